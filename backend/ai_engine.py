@@ -1,47 +1,301 @@
+import asyncio
 import random
 import json
-from backend import template_manager
-from backend.gemini_client import get_gemini_client, GeminiClient
+import re
+import threading
+import time
+from typing import Any, AsyncIterator
+from backend import metrics, prompt_cache
+from backend.gemini_client import get_gemini_client, get_async_gemini_client, GeminiClient, AsyncGeminiClient
+from backend.template_index import TemplateIndex, library_keys
+from backend.prompt_builder import PromptBuilder, record_prompt
+from backend.prompt_cache import PromptParts, business_profile
+from backend.fast_render import CompiledTemplate, slot_values
+from backend.template_store import TemplateStore, get_template_store
+from backend.warm_pool import PLACEHOLDERS, WARM_POOL_GENERATED, WarmPool, pool_key
+
+NUM_INSPIRATION_TEMPLATES = 3
+
+# Acrescentado ao contexto dos templates gerados de antemão (ver `backend.warm_pool`).
+WARM_POOL_INSTRUCTION = """
+        Este template será reaproveitado para vários clientes deste nicho: escreva
+        exatamente [NOME_DO_PROFISSIONAL] onde entraria o nome do contato e
+        [NOME_DA_EMPRESA] onde entraria o nome da empresa.
+        """
+
+_BODY_KEY = re.compile(r'"body"\s*:\s*"')
+_JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+def build_client_context(nome: str, empresa: str, nicho: str, onde: str, ponto: str | None, problems: list) -> str:
+    """Monta o contexto do cliente a partir dos campos do formulário."""
+    return f"""
+        Nome do Cliente: {nome}
+        Nome da Empresa: {empresa}
+        Nicho de Atuação: {nicho}
+        Onde foi encontrado: {onde}
+        Ponto Forte (Elogio): {ponto or 'Nenhum'}
+        Problemas a resolver: {', '.join(problems)}
+        """
+
+class _BodyStreamExtractor:
+    """
+    Extrai, pedaço a pedaço, o valor de "body" de uma resposta JSON em streaming.
+
+    Se a resposta não começar como JSON (ou bloco ```json), o texto inteiro é
+    tratado como corpo, como faz o fallback de `_parse_hybrid_response`.
+    """
 
-class AIEngine:
     def __init__(self):
-        self.gemini_client = get_gemini_client()
+        self.buffer = ""
+        self.mode = None  # None (indefinido), "json" ou "plain"
+        self.pos = None   # posição do próximo caractere do corpo no buffer
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        self.buffer += chunk
+        if self.mode is None:
+            stripped = self.buffer.lstrip()
+            if not stripped:
+                return ""
+            self.mode = "json" if stripped[0] in "{`" else "plain"
+            if self.mode == "plain":
+                return self.buffer
+        elif self.mode == "plain":
+            return chunk
+
+        if self.done:
+            return ""
+        if self.pos is None:
+            match = _BODY_KEY.search(self.buffer)
+            if not match:
+                return ""
+            self.pos = match.end()
+        return self._decode()
+
+    def _decode(self) -> str:
+        out = []
+        buffer, i = self.buffer, self.pos
+        while i < len(buffer):
+            char = buffer[i]
+            if char == '"':
+                self.done = True
+                i += 1
+                break
+            if char != '\\':
+                out.append(char)
+                i += 1
+                continue
+            # Sequência de escape: espera o resto chegar se estiver incompleta.
+            if i + 1 >= len(buffer):
+                break
+            escape = buffer[i + 1]
+            if escape == 'u':
+                if i + 6 > len(buffer):
+                    break
+                code = int(buffer[i + 2:i + 6], 16)
+                if 0xD800 <= code < 0xDC00 and buffer[i + 6:i + 8] in ('\\u', '\\', ''):
+                    # Par substituto (ex.: emoji): só decodifica com as duas metades.
+                    if i + 12 > len(buffer):
+                        break
+                    low = int(buffer[i + 8:i + 12], 16)
+                    out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                    i += 12
+                    continue
+                out.append(chr(code))
+                i += 6
+            else:
+                out.append(_JSON_ESCAPES.get(escape, escape))
+                i += 2
+        self.pos = i
+        return "".join(out)
+
+def _template_body(template: dict) -> str:
+    # Templates humanos guardam o texto em "content"; os gerados pela IA, em "body".
+    return template.get('body') or template.get('content') or ''
+
+class AIEngine:
+    def __init__(self, gemini_client: GeminiClient | None = None, async_gemini_client: AsyncGeminiClient | None = None,
+                 template_store: TemplateStore | None = None, template_index: TemplateIndex | None = None,
+                 warm_pool: WarmPool | None = None):
+        # Os clientes padrão são criados no primeiro uso: o cliente real importa o
+        # SDK e monta o modelo, o que atrasaria o início do servidor e do CLI.
+        self._gemini_client = gemini_client
+        self._async_gemini_client = async_gemini_client
+        self._client_lock = threading.Lock()
+        self.template_store = template_store or get_template_store()
+        self.template_index = template_index or TemplateIndex()
+        # Versão da biblioteca com que o índice foi sincronizado (None: ainda não montado).
+        self._index_version = None
+        self._index_lock = threading.Lock()
+        # Templates gerados de antemão para os nichos mais pedidos (None: sempre gera na hora).
+        self.warm_pool = warm_pool
+        self.template_store.add_listener(self._on_library_change)
+
+    @property
+    def gemini_client(self) -> GeminiClient:
+        if self._gemini_client is None:
+            with self._client_lock:
+                if self._gemini_client is None:
+                    self._gemini_client = get_gemini_client()
+        return self._gemini_client
+
+    @gemini_client.setter
+    def gemini_client(self, client: GeminiClient) -> None:
+        self._gemini_client = client
+
+    @property
+    def async_gemini_client(self) -> AsyncGeminiClient:
+        if self._async_gemini_client is None:
+            with self._client_lock:
+                if self._async_gemini_client is None:
+                    self._async_gemini_client = get_async_gemini_client()
+        return self._async_gemini_client
+
+    @async_gemini_client.setter
+    def async_gemini_client(self, client: AsyncGeminiClient) -> None:
+        self._async_gemini_client = client
+
+    def warm_clients(self) -> None:
+        """Cria os clientes do modelo de antemão (ex.: no início do servidor, fora do caminho da requisição)."""
+        self.gemini_client
+        self.async_gemini_client
 
     def _load_all_templates(self) -> dict:
-        """Carrega todos os templates de todas as fontes."""
-        return template_manager.get_all_templates()
+        """Todos os templates, sem cópias (`templates_view`): o motor só lê, nunca altera."""
+        return self.template_store.templates_view()
 
-    def _create_hybrid_template(self, context: str, inspiration_templates: list) -> dict:
-        """Cria um novo template híbrido com base em templates de inspiração."""
-        prompt = f"""
+    def _on_library_change(self, event: str, template_type: str, filename: str, template_data: dict | None) -> None:
+        """Mantém o índice em dia com as inclusões e remoções feitas pelo store."""
+        if self._index_version is None:
+            return
+        if event == "saved":
+            self.template_index.add((template_type, filename), dict(template_data, filename=filename, name=filename))
+        elif event == "deleted":
+            self.template_index.remove((template_type, filename))
+
+    def _ensure_index(self) -> None:
+        # A versão da biblioteca muda com qualquer escrita de template, inclusive
+        # de outro processo ou edição manual; aí sincroniza só a diferença. O uso
+        # não muda a versão: chega ao índice por `record_usage` e, de outros
+        # processos, na próxima sincronização.
+        version = self.template_store.library_version()
+        if version == self._index_version:
+            return
+        with self._index_lock:
+            if version == self._index_version:
+                return
+            # Lidos depois da versão: no mínimo tão novos quanto ela.
+            all_templates = self._load_all_templates()
+            self.template_index.sync(library_keys(all_templates), self.template_store.get_usage_counts())
+            self._index_version = version
+
+    def warm_index(self) -> None:
+        """Monta o índice de busca de antemão; a primeira montagem vetoriza a biblioteca inteira."""
+        self._ensure_index()
+
+    @metrics.timed("select_templates")
+    def _select_inspiration_templates(self, context: str = "") -> list:
+        """
+        Escolhe os templates de inspiração mais relevantes para o contexto do
+        cliente (similaridade no índice local, ponderada pelo uso). Sem contexto,
+        sorteia 2-3. Lista vazia se a biblioteca estiver vazia.
+        """
+        if context:
+            # O índice espelha a biblioteca; ela só é lida quando mudou.
+            self._ensure_index()
+            ranked = self.template_index.search(context, NUM_INSPIRATION_TEMPLATES)
+            return [template for template, _ in ranked]
+
+        all_templates = self._load_all_templates()
+        selectable_templates = (all_templates.get("human_adm", []) + all_templates.get("human", [])
+                                + all_templates.get("ai", []))
+        num_to_select = min(len(selectable_templates), random.randint(2, 3))
+        return random.sample(selectable_templates, num_to_select)
+
+    def _hybrid_prompt_parts(self, context: str, inspiration_templates: list) -> PromptParts:
+        """
+        Prefixo fixo (perfil do negócio e instruções) e sufixo com o contexto e
+        os modelos de inspiração, no orçamento da etapa.
+        """
+        builder = PromptBuilder("hybrid")
+        builder.add(f"""
         Contexto do Cliente: "{context}"
 
         Modelos de Inspiração:
-        """
+        """)
         for i, template in enumerate(inspiration_templates):
-            prompt += f"\\n--- Modelo de Inspiração {i+1} ---\\n"
-            prompt += f"Título: {template.get('title', 'N/A')}\\n"
-            prompt += f"Assunto: {template.get('subject', 'N/A')}\\n"
-            prompt += f"Corpo: {template.get('body', 'N/A')}\\n"
+            builder.add(f"\n--- Modelo de Inspiração {i+1} ---\n"
+                        f"Título: {template.get('title', 'N/A')}\n"
+                        f"Assunto: {template.get('subject', 'N/A')}\n"
+                        f"Corpo: ")
+            builder.add_body(_template_body(template) or 'N/A')
+            builder.add("\n")
+        return PromptParts(self._hybrid_prefix(), builder.build())
 
-        prompt += """
-        ---
-        Tarefa: Crie uma nova proposta de mensagem de vendas (template) que seja uma fusão inteligente das ideias dos modelos de inspiração fornecidos. A nova proposta deve ser perfeitamente adaptada ao contexto do cliente.
+    def _hybrid_prefix(self) -> str:
+        return business_profile() + """
+        Tarefa: Crie uma nova proposta de mensagem de vendas (template) que seja uma fusão inteligente das ideias dos modelos de inspiração fornecidos abaixo. A nova proposta deve ser perfeitamente adaptada ao contexto do cliente e apresentar a empresa descrita acima, destacando os produtos ou serviços e os pontos fortes que mais combinam com os problemas do cliente.
 
         O resultado deve ser um objeto JSON com as seguintes chaves: "title", "subject", "body", "ideal_for".
         - "title": Um título curto e impactante para o novo template.
         - "subject": A linha de assunto do e-mail.
         - "ideal_for": Descreva o cenário ideal de uso para esta nova proposta.
         - "body": O corpo completo da mensagem, em formato de texto simples, usando as melhores técnicas de copywriting dos modelos de inspiração.
+        ---
         """
-        
-        response_text = self.gemini_client.generate_content(prompt)
-        
+
+    def _build_hybrid_prompt(self, context: str, inspiration_templates: list) -> str:
+        return self._hybrid_prompt_parts(context, inspiration_templates).text
+
+    def _call_model(self, call: str, prompt: PromptParts, media_files: list | None = None) -> str:
+        """Chama o modelo registrando latência e tamanhos nas métricas (`call`: 'hybrid' ou 'report')."""
+        record_prompt(call, prompt)
+        start = time.perf_counter()
+        response = None
+        try:
+            with metrics.span(f"{call}_call"):
+                response = self.gemini_client.generate_with_prefix(prompt.prefix, prompt.suffix, media_files)
+            return response
+        finally:
+            metrics.record_llm_call(call, time.perf_counter() - start, prompt.text, response)
+
+    async def _call_model_async(self, call: str, prompt: PromptParts, media_files: list | None = None) -> str:
+        record_prompt(call, prompt)
+        start = time.perf_counter()
+        response = None
+        try:
+            with metrics.span(f"{call}_call"):
+                response = await self.async_gemini_client.generate_with_prefix(prompt.prefix, prompt.suffix, media_files)
+            return response
+        finally:
+            metrics.record_llm_call(call, time.perf_counter() - start, prompt.text, response)
+
+    async def _stream_model(self, call: str, prompt: PromptParts, media_files: list | None = None) -> AsyncIterator[str]:
+        record_prompt(call, prompt)
+        start = time.perf_counter()
+        chunks = []
+        completed = False
+        try:
+            with metrics.span(f"{call}_call"):
+                async for chunk in self.async_gemini_client.generate_with_prefix_stream(prompt.prefix, prompt.suffix,
+                                                                                        media_files):
+                    chunks.append(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            metrics.record_llm_call(call, time.perf_counter() - start, prompt.text,
+                                    "".join(chunks) if completed else None)
+
+    @metrics.timed("parse_response")
+    def _parse_hybrid_response(self, response_text: str) -> dict:
         try:
             # Limpa e converte a string de resposta para um dicionário Python
             clean_response = response_text.strip().replace("```json", "").replace("```", "")
-            return json.loads(clean_response)
+            template = json.loads(clean_response)
+            metrics.record_hybrid_parse(fallback=False)
+            return template
         except json.JSONDecodeError:
+            metrics.record_hybrid_parse(fallback=True)
             # Se a IA não retornar um JSON válido, cria um template de fallback
             return {
                 "title": "Proposta Híbrida (Fallback)",
@@ -50,56 +304,224 @@ class AIEngine:
                 "ideal_for": "Situações onde a IA falhou em gerar um JSON."
             }
 
-    def _generate_creation_report(self, context: str, inspiration_templates: list, new_template: dict) -> str:
-        """Gera um relatório explicando como o novo template foi criado."""
-        prompt = f"""
+    def _create_hybrid_template(self, context: str, inspiration_templates: list, media_files: list | None = None) -> dict:
+        """Cria um novo template híbrido com base em templates de inspiração."""
+        with metrics.span("build_prompt"):
+            prompt = self._hybrid_prompt_parts(context, inspiration_templates)
+        response_text = self._call_model("hybrid", prompt, media_files)
+        return self._parse_hybrid_response(response_text)
+
+    def _report_prompt_parts(self, context: str, inspiration_templates: list, new_template: dict) -> PromptParts:
+        builder = PromptBuilder("report")
+        builder.add(f"""
         Contexto do Cliente: "{context}"
 
         Modelos de Inspiração Usados:
-        """
+        """)
         for template in inspiration_templates:
-            prompt += f"- {template.get('title', 'N/A')}\\n"
-
-        prompt += f"""
+            builder.add(f"- {template.get('title') or template.get('filename', 'N/A')}\n")
+        builder.add(f"""
         Novo Template Gerado:
         - Título: {new_template.get('title', 'N/A')}
         - Assunto: {new_template.get('subject', 'N/A')}
+        """)
+        return PromptParts(self._report_prefix(), builder.build())
 
+    def _report_prefix(self) -> str:
+        return business_profile() + """
+        Tarefa: Escreva um relatório conciso e transparente para o usuário final. Explique, em 2-3 parágrafos, por que você escolheu os modelos de inspiração listados abaixo e como você combinou as ideias deles para criar a nova proposta, considerando o contexto do cliente e o que a empresa descrita acima oferece. Seja claro sobre a estratégia por trás da fusão.
         ---
-        Tarefa: Escreva um relatório conciso e transparente para o usuário final. Explique, em 2-3 parágrafos, por que você escolheu esses modelos de inspiração e como você combinou as ideias deles para criar a nova proposta, considerando o contexto do cliente. Seja claro sobre a estratégia por trás da fusão.
         """
-        return self.gemini_client.generate_content(prompt)
 
-    def generate_proposal(self, context: str) -> dict:
+    def _build_report_prompt(self, context: str, inspiration_templates: list, new_template: dict) -> str:
+        return self._report_prompt_parts(context, inspiration_templates, new_template).text
+
+    def _generate_creation_report(self, context: str, inspiration_templates: list, new_template: dict) -> str:
+        """Gera um relatório explicando como o novo template foi criado."""
+        with metrics.span("build_prompt"):
+            prompt = self._report_prompt_parts(context, inspiration_templates, new_template)
+        return self._call_model("report", prompt)
+
+    @metrics.timed("save_template")
+    def _save_new_template(self, new_template: dict) -> str:
+        """Persiste o template híbrido na biblioteca de IA e registra o uso."""
+        template_name = self.template_store.save_ai_template(new_template)
+        self.template_store.increment_template_usage(template_name)
+        self.template_index.record_usage(template_name)
+        return template_name
+
+    def _empty_library_result(self) -> dict:
+        return {
+            "proposal": "Nenhum template disponível para gerar uma proposta.",
+            "report": "Não há templates no sistema. Adicione alguns para começar."
+        }
+
+    def _warm_pool_entry(self, lead: dict | None, media_files: list | None) -> dict | None:
+        """
+        Conta o pedido no pool e devolve a entrada pronta para ele, se houver.
+        Pedidos com mídia ou com ponto forte geram na hora: o template do pool
+        é escrito sem o elogio, que é próprio de cada lead.
+        """
+        if self.warm_pool is None or not lead or media_files or lead.get("ponto"):
+            return None
+        key = pool_key(lead.get("nicho", ""), lead.get("problems") or [])
+        self.warm_pool.record(key)
+        return self.warm_pool.get(key)
+
+    def _personalize(self, entry: dict, lead: dict) -> dict:
+        values = slot_values(lead)
+        return {
+            "proposal": CompiledTemplate(entry["template"].get("body", "")).render(values),
+            "report": CompiledTemplate(entry["report"]).render(values),
+            "tokens_saved": 0,
+            "warm_pool": True
+        }
+
+    async def refill_warm_pool(self, limit: int | None = None) -> int:
+        """
+        Gera templates para as combinações mais pedidas que faltam no pool,
+        dentro do orçamento dele. Devolve quantos entraram no pool.
+        """
+        generated = 0
+        for key in self.warm_pool.candidates(limit):
+            if not self.warm_pool.try_spend():
+                break
+            nicho, problems = key
+            context = build_client_context(*PLACEHOLDERS, nicho, "varia por cliente", None,
+                                           list(problems)) + WARM_POOL_INSTRUCTION
+            inspiration_templates = await asyncio.to_thread(self._select_inspiration_templates, context)
+            if not inspiration_templates:
+                break
+            with metrics.span("build_prompt"):
+                prompt = self._hybrid_prompt_parts(context, inspiration_templates)
+            template = self._parse_hybrid_response(await self._call_model_async("warm_hybrid", prompt))
+            if not any(placeholder in template.get("body", "") for placeholder in PLACEHOLDERS):
+                # Sem marcadores o texto não pode ser personalizado para cada lead.
+                if metrics.ENABLED:
+                    WARM_POOL_GENERATED.inc("rejected")
+                continue
+            with metrics.span("build_prompt"):
+                report_prompt = self._report_prompt_parts(context, inspiration_templates, template)
+            report = await self._call_model_async("warm_report", report_prompt)
+            self.warm_pool.put(key, {"template": template, "report": report})
+            if metrics.ENABLED:
+                WARM_POOL_GENERATED.inc("ok")
+            generated += 1
+        return generated
+
+    @metrics.timed("generate_proposal")
+    def generate_proposal(self, context: str, media_files: list | None = None, lead: dict | None = None) -> dict:
         """
         Gera uma proposta inteligente, possivelmente combinando templates existentes.
+        `media_files` (ver `backend.media`) acompanha o pedido do template híbrido.
+        Com `lead` (campos do formulário: nome, empresa, nicho, problems), o
+        pedido pode ser atendido pelo pool pré-gerado.
         """
-        all_templates = self._load_all_templates()
-        
-        human_adm_templates = all_templates.get("human_adm", [])
-        human_templates = all_templates.get("human", [])
-        ai_templates = all_templates.get("ai", [])
+        entry = self._warm_pool_entry(lead, media_files)
+        if entry is not None:
+            self._save_new_template(entry["template"])
+            return self._personalize(entry, lead)
 
-        selectable_templates = human_adm_templates + human_templates + ai_templates
+        inspiration_templates = self._select_inspiration_templates(context)
+        if not inspiration_templates:
+            return self._empty_library_result()
 
-        if not selectable_templates:
-            return {
-                "proposal": "Nenhum template disponível para gerar uma proposta.",
-                "report": "Não há templates no sistema. Adicione alguns para começar."
-            }
+        with prompt_cache.track_tokens_saved() as saved:
+            new_template = self._create_hybrid_template(context, inspiration_templates, media_files)
 
-        num_to_select = min(len(selectable_templates), random.randint(2, 3))
-        inspiration_templates = random.sample(selectable_templates, num_to_select)
+            if new_template:
+                self._save_new_template(new_template)
+
+            report = self._generate_creation_report(context, inspiration_templates, new_template)
+
+        return {
+            "proposal": new_template.get('body', "Erro ao gerar proposta."),
+            "report": report,
+            "tokens_saved": saved.total
+        }
+
+    @metrics.timed("generate_proposal")
+    async def generate_proposal_async(self, context: str, media_files: list | None = None,
+                                      lead: dict | None = None) -> dict:
+        """
+        Versão assíncrona de `generate_proposal`.
+
+        As chamadas ao modelo usam o `AsyncGeminiClient` e o acesso a disco roda em
+        threads, de modo que um único worker atende várias propostas simultâneas.
+        """
+        entry = self._warm_pool_entry(lead, media_files)
+        if entry is not None:
+            await asyncio.to_thread(self._save_new_template, entry["template"])
+            return self._personalize(entry, lead)
+
+        inspiration_templates = await asyncio.to_thread(self._select_inspiration_templates, context)
+        if not inspiration_templates:
+            return self._empty_library_result()
 
-        new_template = self._create_hybrid_template(context, inspiration_templates)
+        with prompt_cache.track_tokens_saved() as saved:
+            with metrics.span("build_prompt"):
+                prompt = self._hybrid_prompt_parts(context, inspiration_templates)
+            response_text = await self._call_model_async("hybrid", prompt, media_files)
+            new_template = self._parse_hybrid_response(response_text)
 
-        if new_template:
-            template_name = template_manager.save_ai_template(new_template)
-            template_manager.increment_template_usage(template_name)
+            if new_template:
+                await asyncio.to_thread(self._save_new_template, new_template)
 
-        report = self._generate_creation_report(context, inspiration_templates, new_template)
+            with metrics.span("build_prompt"):
+                report_prompt = self._report_prompt_parts(context, inspiration_templates, new_template)
+            report = await self._call_model_async("report", report_prompt)
 
         return {
             "proposal": new_template.get('body', "Erro ao gerar proposta."),
-            "report": report
-        }
\ No newline at end of file
+            "report": report,
+            "tokens_saved": saved.total
+        }
+
+    async def stream_proposal(self, context: str, media_files: list | None = None) -> AsyncIterator[tuple[str, Any]]:
+        """
+        Gera uma proposta em streaming, como pares (evento, dados).
+
+        Eventos, em ordem: "proposal" (trechos do corpo do template híbrido, à
+        medida que o modelo os gera), "template" (título/assunto/arquivo salvo),
+        "report" (trechos do relatório) e "done" (resultado final, igual ao de
+        `generate_proposal`, com `tokens_saved`).
+        """
+        inspiration_templates = await asyncio.to_thread(self._select_inspiration_templates, context)
+        if not inspiration_templates:
+            yield "done", self._empty_library_result()
+            return
+
+        # O gerador avança na mesma tarefa do consumidor, então o contexto do contador se mantém entre os eventos.
+        with prompt_cache.track_tokens_saved() as saved:
+            with metrics.span("build_prompt"):
+                prompt = self._hybrid_prompt_parts(context, inspiration_templates)
+            extractor = _BodyStreamExtractor()
+            chunks = []
+            async for chunk in self._stream_model("hybrid", prompt, media_files):
+                chunks.append(chunk)
+                body_text = extractor.feed(chunk)
+                if body_text:
+                    yield "proposal", body_text
+
+            new_template = self._parse_hybrid_response("".join(chunks))
+            template_name = None
+            if new_template:
+                template_name = await asyncio.to_thread(self._save_new_template, new_template)
+            yield "template", {
+                "title": new_template.get('title'),
+                "subject": new_template.get('subject'),
+                "template_name": template_name
+            }
+
+            with metrics.span("build_prompt"):
+                report_prompt = self._report_prompt_parts(context, inspiration_templates, new_template)
+            report_chunks = []
+            async for chunk in self._stream_model("report", report_prompt):
+                report_chunks.append(chunk)
+                yield "report", chunk
+
+            yield "done", {
+                "proposal": new_template.get('body', "Erro ao gerar proposta."),
+                "report": "".join(report_chunks),
+                "tokens_saved": saved.total
+            }
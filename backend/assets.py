@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""Build e entrega dos arquivos estáticos do frontend.
+
+`python -m backend.assets build` copia `frontend/` para `frontend/dist/`:
+
+- `app.js` e `style.css` viram `app.<hash>.js` e `style.<hash>.css` (hash do
+  conteúdo), e o `index.html` passa a apontar para eles;
+- cada arquivo ganha cópias pré-comprimidas `.gz` e, com o pacote `brotli`
+  instalado, `.br`;
+- `manifest.json` lista o nome original de cada arquivo com hash.
+
+`PrecompressedStaticFiles` serve a pasta escolhendo a cópia comprimida que o
+navegador aceita (`Accept-Encoding`) e manda `Cache-Control: immutable` para
+os arquivos com hash, que nunca mudam de conteúdo sob o mesmo nome. O
+`index.html` é sempre revalidado. Sem build, o servidor usa `frontend/` como
+antes.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+from typing import Dict
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+try:
+    import brotli
+except ImportError:  # opcional: sem ele só há as cópias .gz
+    brotli = None
+
+FRONTEND_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "frontend"))
+DIST_DIR = os.path.join(FRONTEND_DIR, "dist")
+MANIFEST = "manifest.json"
+# Arquivos que recebem hash no nome; os demais (index.html) mantêm o nome.
+FINGERPRINTED = (".js", ".css")
+COMPRESSED = (".html", ".js", ".css", ".json", ".svg")
+IMMUTABLE = "public, max-age=31536000, immutable"
+_HASHED_NAME = re.compile(r"\.[0-9a-f]{10}\.[a-z0-9]+$")
+
+
+def fingerprint(name: str, content: bytes) -> str:
+    """`app.js` -> `app.<10 primeiros hex do sha256>.js`."""
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:10]}{ext}"
+
+
+def _write(path: str, content: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(content)
+    if path.endswith(COMPRESSED):
+        # mtime=0: a mesma entrada gera sempre o mesmo .gz.
+        with open(path + ".gz", "wb") as f:
+            f.write(gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + ".br", "wb") as f:
+                f.write(brotli.compress(content, quality=11))
+
+
+def build(source_dir: str = FRONTEND_DIR, out_dir: str = DIST_DIR) -> Dict[str, str]:
+    """Gera a pasta de distribuição e devolve o manifesto (nome original -> nome com hash)."""
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+
+    manifest = {}
+    pages = {}
+    for name in sorted(os.listdir(source_dir)):
+        path = os.path.join(source_dir, name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, "rb") as f:
+            content = f.read()
+        if name.endswith(FINGERPRINTED):
+            manifest[name] = fingerprint(name, content)
+            _write(os.path.join(out_dir, manifest[name]), content)
+        elif name.endswith(".html"):
+            pages[name] = content.decode("utf-8")
+        else:
+            _write(os.path.join(out_dir, name), content)
+
+    for name, html in pages.items():
+        for original, hashed in manifest.items():
+            html = re.sub(rf'((?:src|href)=["\'](?:\./)?){re.escape(original)}(["\'])', rf"\g<1>{hashed}\g<2>", html)
+        _write(os.path.join(out_dir, name), html.encode("utf-8"))
+
+    with open(os.path.join(out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def static_dir() -> str:
+    """A pasta de distribuição, se o build já rodou; senão `frontend/`."""
+    return DIST_DIR if os.path.isfile(os.path.join(DIST_DIR, MANIFEST)) else FRONTEND_DIR
+
+
+def _accepts(accept_encoding: str, encoding: str) -> bool:
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        if name.strip() == encoding:
+            return params.strip().replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """`StaticFiles` que prefere as cópias `.br`/`.gz` e marca os arquivos com hash como imutáveis."""
+
+    def file_response(self, full_path, stat_result, scope: Scope, status_code: int = 200) -> Response:
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        path = str(full_path)
+        response = None
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if _accepts(accept_encoding, encoding) and os.path.isfile(path + suffix):
+                compressed = super().file_response(path + suffix, os.stat(path + suffix), scope, status_code)
+                if isinstance(compressed, FileResponse):
+                    # O tipo é o do arquivo original, não o do .gz/.br.
+                    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                    if media_type.startswith("text/") or media_type == "application/javascript":
+                        media_type += "; charset=utf-8"
+                    compressed.headers["content-type"] = media_type
+                    compressed.headers["content-encoding"] = encoding
+                response = compressed
+                break
+        if response is None:
+            response = super().file_response(full_path, stat_result, scope, status_code)
+        if os.path.isfile(path + ".gz") or os.path.isfile(path + ".br"):
+            response.headers["vary"] = "Accept-Encoding"
+        if _HASHED_NAME.search(os.path.basename(path)):
+            response.headers["cache-control"] = IMMUTABLE
+        elif path.endswith(".html"):
+            response.headers["cache-control"] = "no-cache"
+        return response
+
+
+def main():
+    p = argparse.ArgumentParser(description="Build dos arquivos estáticos do frontend.")
+    sub = p.add_subparsers(dest='command', required=True)
+    build_cmd = sub.add_parser('build', help="Gera frontend/dist com nomes com hash e cópias .gz/.br")
+    build_cmd.add_argument('--source', default=FRONTEND_DIR)
+    build_cmd.add_argument('--out', default=DIST_DIR)
+    args = p.parse_args()
+
+    if args.command == 'build':
+        manifest = build(args.source, args.out)
+        for original, hashed in manifest.items():
+            print(f"{original} -> {hashed}")
+        if brotli is None:
+            print("Aviso: pacote 'brotli' não instalado; só as cópias .gz foram geradas.")
+
+
+if __name__ == '__main__':
+    main()
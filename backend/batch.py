@@ -0,0 +1,157 @@
+"""Geração de propostas em lote a partir de CSV ou JSONL.
+
+Cada lead tem os mesmos campos do formulário: nome, empresa, nicho, onde,
+ponto (opcional) e problems. Em CSV, `problems` pode ser uma lista JSON ou
+itens separados por ";". Um campo opcional `id` identifica o lead; sem ele,
+o id é um hash dos campos.
+
+Os resultados saem em JSONL, um por lead, na ordem em que ficam prontos. O
+próprio arquivo de saída serve de checkpoint: ao rodar de novo com a mesma
+saída, leads já concluídos com sucesso são pulados.
+"""
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import os
+from typing import Any, AsyncIterator, Dict, Iterable, List
+
+from backend.ai_engine import AIEngine, build_client_context
+
+LEAD_FIELDS = ('nome', 'empresa', 'nicho', 'onde', 'ponto', 'problems')
+REQUIRED_FIELDS = ('nome', 'empresa', 'nicho', 'onde', 'problems')
+
+
+def _parse_problems(value: Any) -> List[str]:
+    if isinstance(value, list):
+        return [str(p) for p in value if p]
+    value = (value or '').strip()
+    if value.startswith('['):
+        return [str(p) for p in json.loads(value) if p]
+    return [p.strip() for p in value.split(';') if p.strip()]
+
+
+def lead_id(lead: Dict[str, Any]) -> str:
+    """Id estável do lead: o campo `id`, se houver, senão um hash dos campos do formulário."""
+    if lead.get('id'):
+        return str(lead['id'])
+    payload = json.dumps([lead.get(field) for field in LEAD_FIELDS], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def normalize_lead(raw: Dict[str, Any]) -> Dict[str, Any]:
+    missing = [field for field in REQUIRED_FIELDS if not raw.get(field)]
+    if missing:
+        raise ValueError(f"Lead sem os campos obrigatórios: {', '.join(missing)}")
+    lead = {field: raw.get(field) for field in LEAD_FIELDS}
+    lead['problems'] = _parse_problems(raw.get('problems'))
+    lead['id'] = lead_id(dict(lead, id=raw.get('id')))
+    return lead
+
+
+def parse_leads(lines: Iterable[str], fmt: str) -> List[Dict[str, Any]]:
+    """Lê leads de linhas de texto no formato 'csv' ou 'jsonl'."""
+    if fmt == 'csv':
+        rows = csv.DictReader(lines)
+    elif fmt == 'jsonl':
+        rows = (json.loads(line) for line in lines if line.strip())
+    else:
+        raise ValueError(f"Formato de lote desconhecido: '{fmt}'. Use 'csv' ou 'jsonl'.")
+    return [normalize_lead(row) for row in rows]
+
+
+def detect_format(filename: str) -> str:
+    ext = os.path.splitext(filename or '')[1].lower()
+    return 'csv' if ext == '.csv' else 'jsonl'
+
+
+def read_leads(path: str, fmt: str | None = None) -> List[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return parse_leads(f, fmt or detect_format(path))
+
+
+def parse_leads_bytes(data: bytes, filename: str, fmt: str | None = None) -> List[Dict[str, Any]]:
+    text = data.decode('utf-8-sig')
+    return parse_leads(io.StringIO(text, newline=''), fmt or detect_format(filename))
+
+
+def load_checkpoint(output_path: str) -> set:
+    """Ids dos leads que já têm um resultado bem-sucedido no arquivo de saída."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Linha truncada por uma queda no meio da escrita.
+                continue
+            if record.get('status') == 'ok':
+                completed.add(record['id'])
+    return completed
+
+
+async def run_batch(engine: AIEngine, leads: List[Dict[str, Any]], concurrency: int = 4,
+                    completed: set | None = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Gera propostas para `leads` com no máximo `concurrency` em andamento,
+    devolvendo cada resultado assim que fica pronto. Leads cujo id está em
+    `completed` são pulados.
+    """
+    completed = completed or set()
+    pending = [lead for lead in leads if lead['id'] not in completed]
+    queue: asyncio.Queue = asyncio.Queue()
+    for lead in pending:
+        queue.put_nowait(lead)
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        while True:
+            try:
+                lead = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            context = build_client_context(lead['nome'], lead['empresa'], lead['nicho'],
+                                           lead['onde'], lead['ponto'], lead['problems'])
+            try:
+                result = await engine.generate_proposal_async(context)
+                await results.put({'id': lead['id'], 'status': 'ok', **result})
+            except Exception as e:
+                await results.put({'id': lead['id'], 'status': 'error', 'error': str(e)})
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, len(pending))))]
+    try:
+        for _ in range(len(pending)):
+            yield await results.get()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+def _ends_mid_line(path: str) -> bool:
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return False
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b'\n'
+
+
+async def run_batch_to_file(engine: AIEngine, leads: List[Dict[str, Any]], output_path: str,
+                            concurrency: int = 4) -> Dict[str, int]:
+    """Roda o lote anexando cada resultado a `output_path`, retomando do checkpoint existente."""
+    completed = load_checkpoint(output_path)
+    counts = {'skipped': sum(1 for lead in leads if lead['id'] in completed), 'ok': 0, 'error': 0}
+    with open(output_path, 'a', encoding='utf-8') as out:
+        if _ends_mid_line(output_path):
+            # Fecha a linha deixada pela metade por uma queda anterior.
+            out.write('\n')
+        async for record in run_batch(engine, leads, concurrency, completed):
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+            out.flush()
+            os.fsync(out.fileno())
+            counts[record['status']] += 1
+    return counts
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks do armazenamento de templates e da geração de propostas.
+
+Gera bibliotecas sintéticas (por padrão com 100, 10 mil e 100 mil templates de
+IA, mais os templates humanos) e mede, para cada tamanho:
+
+- `get_all_templates` (primeira leitura, com o disco frio para o cache, e as
+  seguintes, que copiam a biblioteca) e `templates_view` (sem cópias);
+- `get_template_report`, `increment_template_usage` e `save_ai_template`;
+- `AIEngine.generate_proposal` de ponta a ponta com o `MockGeminiClient` e uma
+  latência artificial configurável (`--latency`).
+
+Uso:
+  python -m backend.bench -o resultados.json
+  python -m backend.bench --sizes 100,10000 --store sqlite -o resultados.json
+  python -m backend.bench --sizes 100 --compare base.json --threshold 0.2
+
+O resultado é JSON (tempos em milissegundos). Com `--compare`, cada medida é
+comparada com a mesma medida do arquivo de base pela mediana; o comando
+termina com código 1 se alguma ficar mais lenta que o limite.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+from backend import data, template_manager
+from backend.ai_engine import AIEngine, build_client_context
+from backend.gemini_client import AsyncMockGeminiClient, MockGeminiClient
+from backend.template_store import FileSystemTemplateStore, SQLiteTemplateStore, migrate_filesystem_to_sqlite
+
+DEFAULT_SIZES = (100, 10_000, 100_000)
+DEFAULT_REPEAT = 50
+DEFAULT_PROPOSALS = 10
+DEFAULT_THRESHOLD = 0.2
+NUM_HUMAN_TEMPLATES = 20
+BODY_WORDS = 80
+USED_FRACTION = 0.1
+
+NICHOS = ("clínica odontológica", "restaurante", "loja virtual", "academia", "escritório de advocacia",
+          "imobiliária", "pet shop", "salão de beleza", "escola de idiomas", "oficina mecânica")
+PROBLEMAS = ("site lento no celular", "anúncios levando para a página inicial", "sem avaliações no Google",
+             "formulário de contato quebrado", "Instagram sem link para agendamento", "alto abandono de carrinho")
+
+
+def _vocabulary() -> List[str]:
+    words = {word.strip(".,:;!?()[]—").lower() for variants in data.TEMPLATES.values()
+             for text in variants.values() for word in text.split()}
+    return sorted(word for word in words if word.isalpha())
+
+
+def build_library(directory: str, size: int, seed: int = 0) -> Dict[str, str]:
+    """
+    Grava em `directory` uma biblioteca com `size` templates de IA, os templates
+    humanos e um arquivo de uso em que ~10% dos templates já foram usados.
+    Reaproveita uma biblioteca já gerada com os mesmos parâmetros.
+    """
+    paths = {
+        "human_dir": os.path.join(directory, "human_templates"),
+        "ai_dir": os.path.join(directory, "ai_templates"),
+        "usage_file": os.path.join(directory, "template_usage.json"),
+    }
+    marker = os.path.join(directory, ".bench-library")
+    signature = f"{size}:{seed}"
+    if os.path.exists(marker):
+        with open(marker, encoding="utf-8") as f:
+            if f.read() == signature:
+                return paths
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(paths["human_dir"])
+    os.makedirs(paths["ai_dir"])
+
+    rng = random.Random(seed)
+    vocabulary = _vocabulary()
+
+    def write(folder: str, filename: str, template: Dict[str, Any]) -> None:
+        with open(os.path.join(folder, filename), "w", encoding="utf-8") as f:
+            json.dump(template, f, ensure_ascii=False)
+
+    for i in range(NUM_HUMAN_TEMPLATES):
+        write(paths["human_dir"], f"{i:02d}_Humano_{i}.json", {
+            "title": f"Humano {i}", "subject": rng.choice(NICHOS),
+            "body": " ".join(rng.choices(vocabulary, k=BODY_WORDS)),
+        })
+    usage = {}
+    for i in range(size):
+        filename = f"Proposta_{i:06d}.json"
+        nicho = rng.choice(NICHOS)
+        write(paths["ai_dir"], filename, {
+            "title": f"Proposta {i}", "subject": f"Mais clientes para {nicho}",
+            "body": f"Olá! Para {nicho}: " + " ".join(rng.choices(vocabulary, k=BODY_WORDS)),
+            "ideal_for": nicho,
+        })
+        if rng.random() < USED_FRACTION:
+            usage[filename] = {"usage_count": rng.randint(1, 50), "last_used": None, "ai_analysis": []}
+    with open(paths["usage_file"], "w", encoding="utf-8") as f:
+        json.dump(usage, f)
+    with open(marker, "w", encoding="utf-8") as f:
+        f.write(signature)
+    return paths
+
+
+@contextmanager
+def _library(paths: Dict[str, str]):
+    """Aponta o template_manager para a biblioteca sintética enquanto o bloco roda."""
+    previous = (template_manager.HUMAN_TEMPLATES_DIR, template_manager.AI_TEMPLATES_DIR, template_manager.DATA_FILE)
+    template_manager.HUMAN_TEMPLATES_DIR = paths["human_dir"]
+    template_manager.AI_TEMPLATES_DIR = paths["ai_dir"]
+    template_manager.DATA_FILE = paths["usage_file"]
+    template_manager.invalidate_template_cache()
+    try:
+        yield
+    finally:
+        template_manager.flush_usage_data()
+        (template_manager.HUMAN_TEMPLATES_DIR, template_manager.AI_TEMPLATES_DIR,
+         template_manager.DATA_FILE) = previous
+        template_manager.invalidate_template_cache()
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "min_ms": ordered[0] * 1000,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def measure(fn: Callable[[int], Any], repeat: int) -> Dict[str, float]:
+    """Roda `fn(i)` `repeat` vezes e resume os tempos."""
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    return _summary(samples)
+
+
+def _context(rng: random.Random) -> str:
+    return build_client_context("Cliente", "Empresa", rng.choice(NICHOS), "Google", None,
+                                rng.sample(PROBLEMAS, 2))
+
+
+def run_size(size: int, workdir: str, store_kind: str, repeat: int, proposals: int, latency: float,
+             seed: int = 0) -> Dict[str, Any]:
+    """Mede as operações numa biblioteca com `size` templates de IA."""
+    paths = build_library(os.path.join(workdir, f"library-{size}"), size, seed)
+    # As escritas vão para uma cópia, para que a biblioteca gerada possa ser reaproveitada.
+    run_dir = os.path.join(workdir, f"run-{size}")
+    shutil.rmtree(run_dir, ignore_errors=True)
+    shutil.copytree(paths["human_dir"], os.path.join(run_dir, "human_templates"))
+    shutil.copytree(paths["ai_dir"], os.path.join(run_dir, "ai_templates"))
+    shutil.copy(paths["usage_file"], os.path.join(run_dir, "template_usage.json"))
+    paths = {
+        "human_dir": os.path.join(run_dir, "human_templates"),
+        "ai_dir": os.path.join(run_dir, "ai_templates"),
+        "usage_file": os.path.join(run_dir, "template_usage.json"),
+    }
+
+    rng = random.Random(seed)
+    vocabulary = _vocabulary()
+    filenames = [f"Proposta_{i:06d}.json" for i in range(size)]
+    results: Dict[str, Any] = {}
+    with _library(paths):
+        if store_kind == "sqlite":
+            db_path = os.path.join(run_dir, "templates.db")
+            migrate_filesystem_to_sqlite(db_path, paths["human_dir"], paths["ai_dir"], paths["usage_file"])
+            store = SQLiteTemplateStore(db_path)
+        else:
+            store = FileSystemTemplateStore()
+
+        try:
+            results["get_all_templates_cold"] = measure(lambda i: store.get_all_templates(), 1)
+            results["get_all_templates"] = measure(lambda i: store.get_all_templates(), repeat)
+            results["templates_view"] = measure(lambda i: store.templates_view(), repeat)
+            results["get_template_report"] = measure(
+                lambda i: store.get_template_report(rng.choice(filenames)), repeat)
+            results["increment_template_usage"] = measure(
+                lambda i: store.increment_template_usage(rng.choice(filenames)), repeat)
+            results["save_ai_template"] = measure(lambda i: store.save_ai_template({
+                "title": f"Nova {i}", "subject": "Benchmark",
+                "body": f"Texto novo {i}: " + " ".join(rng.choices(vocabulary, k=BODY_WORDS)),
+            }), repeat)
+
+            engine = AIEngine(MockGeminiClient(latency), AsyncMockGeminiClient(latency), template_store=store)
+            results["engine_warm_index"] = measure(lambda i: engine.warm_index(), 1)
+            results["generate_proposal"] = measure(lambda i: engine.generate_proposal(_context(rng)), proposals)
+            store.flush()
+        finally:
+            if isinstance(store, SQLiteTemplateStore):
+                store.close()
+    shutil.rmtree(run_dir, ignore_errors=True)
+    return results
+
+
+def run(sizes: List[int], workdir: str, store_kind: str = "filesystem", repeat: int = DEFAULT_REPEAT,
+        proposals: int = DEFAULT_PROPOSALS, latency: float = 0.0, seed: int = 0) -> Dict[str, Any]:
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "store": store_kind,
+            "repeat": repeat,
+            "proposals": proposals,
+            "latency_s": latency,
+            "seed": seed,
+        },
+        "results": {},
+    }
+    for size in sizes:
+        print(f"Biblioteca com {size} templates...", file=sys.stderr)
+        report["results"][str(size)] = run_size(size, workdir, store_kind, repeat, proposals, latency, seed)
+    return report
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD,
+            metric: str = "p50_ms") -> List[Dict[str, Any]]:
+    """
+    Compara as medidas presentes nos dois resultados. Cada linha traz a razão
+    atual/base e `regression=True` quando ela passa de 1 + `threshold`.
+    """
+    rows = []
+    for size, operations in current["results"].items():
+        for operation, stats in operations.items():
+            base = baseline.get("results", {}).get(size, {}).get(operation)
+            if not base or not base.get(metric):
+                continue
+            ratio = stats[metric] / base[metric]
+            rows.append({
+                "size": int(size),
+                "operation": operation,
+                "baseline_ms": base[metric],
+                "current_ms": stats[metric],
+                "ratio": ratio,
+                "regression": ratio > 1 + threshold,
+            })
+    return rows
+
+
+def _print_comparison(rows: List[Dict[str, Any]], threshold: float) -> None:
+    print(f"{'tamanho':>8}  {'operação':<26} {'base (ms)':>11} {'atual (ms)':>11} {'razão':>7}")
+    for row in rows:
+        flag = "  << mais lento" if row["regression"] else ""
+        print(f"{row['size']:>8}  {row['operation']:<26} {row['baseline_ms']:>11.3f} "
+              f"{row['current_ms']:>11.3f} {row['ratio']:>7.2f}{flag}")
+    slower = sum(row["regression"] for row in rows)
+    print(f"{slower} de {len(rows)} medidas mais lentas que a base em mais de {threshold:.0%}.")
+
+
+def main(argv: List[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Benchmarks do armazenamento de templates e da geração de propostas.")
+    p.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                   help="Tamanhos das bibliotecas sintéticas, separados por vírgula")
+    p.add_argument("--store", choices=["filesystem", "sqlite"], default="filesystem")
+    p.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Repetições de cada operação do armazenamento")
+    p.add_argument("--proposals", type=int, default=DEFAULT_PROPOSALS, help="Propostas geradas por tamanho")
+    p.add_argument("--latency", type=float, default=0.0, help="Latência artificial do mock, em segundos")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--workdir", help="Diretório das bibliotecas geradas (reaproveitadas entre execuções)")
+    p.add_argument("-o", "--output", help="Arquivo JSON de resultados (padrão: saída padrão)")
+    p.add_argument("--compare", metavar="BASE", help="Resultado salvo para comparar")
+    p.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                   help="Aumento relativo tolerado antes de acusar lentidão (0.2 = 20%%)")
+    args = p.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    workdir = args.workdir or tempfile.mkdtemp(prefix="proposal-bench-")
+    try:
+        report = run(sizes, workdir, args.store, args.repeat, args.proposals, args.latency, args.seed)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            rows = compare(report, json.load(f), args.threshold)
+        _print_comparison(rows, args.threshold)
+        return 1 if any(row["regression"] for row in rows) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
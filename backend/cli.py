@@ -1,49 +1,94 @@
-"""Pequeno CLI para criar uma proposta.
+"""Pequeno CLI para criar propostas.
 
 Uso:
-  - Para executar com mock (padrão): `python -m backend.cli --mock`
-  - Para usar um cliente real, defina `GEMINI_ENABLED=1` e providencie `GEMINI_API_KEY`.
+  - Proposta de exemplo com mock: `python -m backend.cli --mock`
+  - Lote a partir de CSV/JSONL: `python -m backend.cli batch leads.csv -o resultados.jsonl --concurrency 8`
+    (rodar de novo com a mesma saída retoma de onde parou)
+  - Propostas locais, sem o modelo, em todas as variantes:
+    `python -m backend.cli render leads.csv -o campanha.jsonl --variants default,formal`
+  - Sem `--mock`, o cliente é escolhido pelas variáveis `USE_MOCK_AI` e `GEMINI_API_KEY`.
 """
-import os
 import argparse
+import asyncio
+import json
 
-from backend.gemini_client import MockGeminiClient
-from backend.ai_engine import create_proposal_flow
+from backend.gemini_client import AsyncMockGeminiClient, MockGeminiClient
+from backend.ai_engine import AIEngine, build_client_context
+from backend import batch
+from backend.fast_render import get_fast_renderer
+
+
+def _build_engine(mock: bool) -> AIEngine:
+    if mock:
+        return AIEngine(MockGeminiClient(), AsyncMockGeminiClient())
+    return AIEngine()
+
+
+def run_example(engine: AIEngine) -> None:
+    context = build_client_context(
+        nome='Cliente Exemplo',
+        empresa='Empresa Ex',
+        nicho='Serviços',
+        onde='anúncio',
+        ponto='bom conteúdo',
+        problems=[
+            'O site passa sensação amadora',
+            'Alta taxa de abandono no mobile',
+        ],
+    )
+    out = engine.generate_proposal(context)
+    print(out['proposal'])
+    print()
+    print(out['report'])
+
+
+def run_batch(engine: AIEngine, args: argparse.Namespace) -> None:
+    leads = batch.read_leads(args.input, args.format)
+    counts = asyncio.run(batch.run_batch_to_file(engine, leads, args.output, args.concurrency))
+    print(f"{counts['ok']} propostas geradas, {counts['error']} erros, "
+          f"{counts['skipped']} já concluídas (checkpoint) -> {args.output}")
+
+
+def run_render(args: argparse.Namespace) -> None:
+    leads = batch.read_leads(args.input, args.format)
+    variants = args.variants.split(",") if args.variants else None
+    count = 0
+    with open(args.output, "w", encoding="utf-8") as f:
+        for record in get_fast_renderer().render_bulk(leads, variants, args.template):
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    print(f"{count} propostas montadas para {len(leads)} leads -> {args.output}")
 
 
 def main():
     p = argparse.ArgumentParser()
     p.add_argument("--mock", action="store_true", help="Usar MockGeminiClient para teste")
+    sub = p.add_subparsers(dest="command")
+
+    b = sub.add_parser("batch", help="Gera propostas para um arquivo de leads (CSV ou JSONL)")
+    b.add_argument("input", help="Arquivo de leads com os campos nome, empresa, nicho, onde, ponto, problems")
+    b.add_argument("-o", "--output", required=True, help="Arquivo JSONL de resultados (também usado como checkpoint)")
+    b.add_argument("-c", "--concurrency", type=int, default=4, help="Máximo de propostas em andamento ao mesmo tempo")
+    b.add_argument("--format", choices=["csv", "jsonl"], help="Formato da entrada (padrão: pela extensão)")
+    b.add_argument("--mock", action="store_true", default=argparse.SUPPRESS, help="Usar MockGeminiClient para teste")
+
+    r = sub.add_parser("render", help="Monta propostas com os templates de backend.data, sem chamar o modelo")
+    r.add_argument("input", help="Arquivo de leads (CSV ou JSONL)")
+    r.add_argument("-o", "--output", required=True, help="Arquivo JSONL com uma proposta por lead e variante")
+    r.add_argument("--variants", help="Variantes separadas por vírgula (padrão: todas)")
+    r.add_argument("--template", help="Família de template para todos os leads (padrão: escolhida por lead)")
+    r.add_argument("--format", choices=["csv", "jsonl"], help="Formato da entrada (padrão: pela extensão)")
+
     args = p.parse_args()
+    if args.command == "render":
+        run_render(args)
+        return
+    engine = _build_engine(args.mock)
 
-    if args.mock or os.getenv("GEMINI_ENABLED") != "1":
-        def resolver(prompt: str) -> str:
-            if 'Biblioteca de Templates' in prompt:
-                return 'HIGH_TICKET'
-            return (
-                "Olá, [Nome do Profissional]! Acompanho seu trabalho e admiro. "
-                "No entanto, notei que seu site atual não reflete a qualidade do serviço. "
-                "Nossa solução: redesign premium para justificar o preço e aumentar conversões."
-            )
-
-        client = MockGeminiClient(resolver)
+    if args.command == "batch":
+        run_batch(engine, args)
     else:
-        raise RuntimeError("Integração real com Gemini não implementada. Use --mock ou defina GEMINI_ENABLED=0")
-
-    client_info = {
-        'Nome do Cliente (Contato Principal)': 'Cliente Exemplo',
-        'Nome da Empresa': 'Empresa Ex',
-        'Nicho/Área de Atuação': 'Serviços',
-        'Onde o encontrei': 'anúncio',
-        'Ponto Forte (Elogio Inicial)': 'bom conteúdo',
-    }
-    problems = [
-        'O site passa sensação amadora',
-        'Alta taxa de abandono no mobile',
-    ]
-
-    out = create_proposal_flow(client_info, problems, client)
-    print(out)
+        run_example(engine)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Renderização local (sem o modelo) dos templates de `backend.data`.
+
+Cada texto de `data.TEMPLATES` é dividido uma única vez em trechos literais e
+espaços (`[NOME_DO_PROFISSIONAL]`, `[PROBLEMAS]`, ...). Renderizar é só juntar
+os trechos com os valores do formulário, o que leva microssegundos e permite
+montar milhares de propostas de uma vez para campanhas offline.
+
+Sem `template_id`, a família é escolhida pelo índice vetorial
+(`backend.template_index`) comparando nicho e problemas com o texto padrão de
+cada família.
+"""
+
+import re
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Sequence
+
+from backend import data
+from backend.template_index import TemplateIndex
+
+DEFAULT_VARIANT = "default"
+NO_PROBLEMS_TEXT = "alguns pontos que vale a pena revisarmos juntos"
+
+_SLOT = re.compile(r"\[([A-Z][A-Z_]*)\]")
+
+
+class CompiledTemplate:
+    """Template já dividido em trechos: `literals` tem sempre um item a mais que `slots`."""
+
+    __slots__ = ("literals", "slots")
+
+    def __init__(self, text: str):
+        pieces = _SLOT.split(text)
+        self.literals = tuple(pieces[0::2])
+        self.slots = tuple(pieces[1::2])
+
+    def render(self, values: Dict[str, str]) -> str:
+        # Espaços sem valor ficam como estão, para aparecerem na revisão.
+        parts = [self.literals[0]]
+        for slot, literal in zip(self.slots, self.literals[1:]):
+            parts.append(values.get(slot, f"[{slot}]"))
+            parts.append(literal)
+        return "".join(parts)
+
+
+def format_problems(problems: Sequence[str]) -> str:
+    """'a', 'b' e 'c' -> 'a, b e c', sem a pontuação final de cada item."""
+    items = [p.strip().rstrip(".;") for p in problems if p and p.strip()]
+    if not items:
+        return NO_PROBLEMS_TEXT
+    if len(items) == 1:
+        return items[0]
+    return f"{', '.join(items[:-1])} e {items[-1]}"
+
+
+def slot_values(lead: Dict[str, Any]) -> Dict[str, str]:
+    """Valores dos espaços a partir dos campos do formulário (nome, empresa, nicho, problems)."""
+    return {
+        "NOME_DO_PROFISSIONAL": lead.get("nome") or "",
+        "NOME_DA_EMPRESA": lead.get("empresa") or "",
+        "NICHO_DA_EMPRESA": lead.get("nicho") or "",
+        "PROBLEMAS": format_problems(lead.get("problems") or []),
+    }
+
+
+class FastRenderer:
+    def __init__(self, templates: Dict[str, Any] | None = None):
+        templates = data.TEMPLATES if templates is None else templates
+        self.compiled: Dict[str, Dict[str, CompiledTemplate]] = {}
+        for template_id, variants in templates.items():
+            if not isinstance(variants, dict):
+                variants = {DEFAULT_VARIANT: variants}
+            self.compiled[template_id] = {name: CompiledTemplate(text) for name, text in variants.items()}
+
+        self.index = TemplateIndex(usage_weight=0.0)
+        for template_id, variants in self.compiled.items():
+            default = variants.get(DEFAULT_VARIANT) or next(iter(variants.values()))
+            text = template_id.replace("_", " ") + "\n" + "".join(default.literals)
+            self.index.add(template_id, {"filename": template_id, "body": text})
+
+    def variants(self, template_id: str) -> List[str]:
+        return list(self.compiled[template_id])
+
+    def select_template_id(self, lead: Dict[str, Any]) -> str:
+        """Família mais parecida com o nicho e os problemas do lead."""
+        query = " ".join([lead.get("nicho") or ""] + list(lead.get("problems") or []))
+        ranked = self.index.search(query, k=1)
+        return ranked[0][0]["filename"] if ranked else next(iter(self.compiled))
+
+    def render(self, lead: Dict[str, Any], template_id: str | None = None,
+               variant: str = DEFAULT_VARIANT) -> Dict[str, Any]:
+        """
+        Renderiza uma proposta para os campos do formulário em `lead`. Levanta
+        KeyError se `template_id` ou `variant` não existirem.
+        """
+        template_id = template_id or self.select_template_id(lead)
+        proposal = self.compiled[template_id][variant].render(slot_values(lead))
+        return {
+            "proposal": proposal,
+            "report": f"Proposta montada localmente com o template '{template_id}' "
+                      f"(variante '{variant}'), sem chamada ao modelo.",
+            "template_id": template_id,
+            "variant": variant,
+            "mode": "fast",
+        }
+
+    def render_bulk(self, leads: Iterable[Dict[str, Any]], variants: Sequence[str] | None = None,
+                    template_id: str | None = None) -> Iterator[Dict[str, Any]]:
+        """
+        Uma proposta por lead e variante (todas as variantes, se `variants` for
+        None). Sem `template_id`, cada lead usa o escolhido pelo índice.
+        Variantes que a família não tem são puladas.
+        """
+        for lead in leads:
+            chosen = template_id or self.select_template_id(lead)
+            family = self.compiled[chosen]
+            values = slot_values(lead)
+            for variant in (variants or family):
+                compiled = family.get(variant)
+                if compiled is None:
+                    continue
+                yield {
+                    "id": lead.get("id"),
+                    "template_id": chosen,
+                    "variant": variant,
+                    "proposal": compiled.render(values),
+                }
+
+
+_renderer: FastRenderer | None = None
+_renderer_lock = threading.Lock()
+
+
+def get_fast_renderer() -> FastRenderer:
+    """Renderizador compartilhado, compilado no primeiro uso."""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = FastRenderer()
+        return _renderer
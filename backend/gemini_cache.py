@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""Cache de respostas na frente do GeminiClient.
+
+A chave é um hash SHA-256 do nome do modelo, do prompt e dos bytes de cada
+arquivo de mídia. Há um nível em memória (LRU com TTL) e um nível opcional em
+disco, que sobrevive a reinícios. Use `bypass_cache()` para ignorar o cache
+numa requisição específica.
+"""
+
+import base64
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, List
+
+from backend import metrics
+from backend.gemini_client import AsyncGeminiClient, GeminiClient
+from backend.usage_recorder import atomic_write_json
+
+_bypass = contextvars.ContextVar("gemini_cache_bypass", default=False)
+
+@contextmanager
+def bypass_cache():
+    """Dentro deste bloco, as chamadas vão direto ao modelo (a resposta nova ainda é gravada)."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+def _media_bytes(file_info: Dict[str, Any]) -> bytes:
+    content = file_info.get("content", b"")
+    if isinstance(content, bytes):
+        return content
+    return base64.b64decode(content)
+
+def cache_key(model_name: str, prompt: str, media_files: List[Dict[str, Any]] | None = None) -> str:
+    digest = hashlib.sha256()
+    for part in (model_name.encode("utf-8"), prompt.encode("utf-8")):
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    for file_info in media_files or []:
+        if file_info.get("sha256"):
+            # Arquivo já no spool de mídia: o hash foi calculado no upload.
+            media_digest = bytes.fromhex(file_info["sha256"])
+        else:
+            media_digest = hashlib.sha256(_media_bytes(file_info)).digest()
+        digest.update(media_digest)
+    return digest.hexdigest()
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 1024, ttl: float | None = 3600.0, disk_dir: str | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str) -> tuple[float, str] | None:
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if self._expired(entry["created"]):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+        return entry["created"], entry["response"]
+
+    def _remember(self, key: str, created: float, response: str) -> None:
+        self._entries[key] = (created, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+        if self.disk_dir:
+            entry = self._read_disk(key)
+            if entry is not None:
+                with self._lock:
+                    self._remember(key, *entry)
+                    self.hits += 1
+                    self.disk_hits += 1
+                return entry[1]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, response: str) -> None:
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, response)
+        if self.disk_dir:
+            try:
+                atomic_write_json(self._disk_path(key), {"created": created, "response": response}, ensure_ascii=False)
+            except OSError as e:
+                print(f"Warning: Could not write Gemini cache entry to disk: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+def _model_name(client: Any) -> str:
+    return getattr(client, "model_name", type(client).__name__)
+
+class CachingGeminiClient(GeminiClient):
+    def __init__(self, client: GeminiClient, cache: ResponseCache | None = None):
+        self.client = client
+        self.cache = cache or ResponseCache()
+        self.model_name = _model_name(client)
+
+    def generate_content(self, prompt: str, media_files: List[Dict[str, Any]] | None = None) -> str:
+        return self._cached(prompt, media_files, lambda: self.client.generate_content(prompt, media_files))
+
+    def generate_with_prefix(self, prefix: str, suffix: str, media_files: List[Dict[str, Any]] | None = None) -> str:
+        return self._cached(prefix + suffix, media_files,
+                            lambda: self.client.generate_with_prefix(prefix, suffix, media_files))
+
+    def _cached(self, prompt: str, media_files: List[Dict[str, Any]] | None, call) -> str:
+        key = cache_key(self.model_name, prompt, media_files)
+        if not _bypass.get():
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        response = call()
+        self.cache.put(key, response)
+        return response
+
+class AsyncCachingGeminiClient(AsyncGeminiClient):
+    def __init__(self, client: AsyncGeminiClient, cache: ResponseCache | None = None):
+        self.client = client
+        self.cache = cache or ResponseCache()
+        self.model_name = _model_name(client)
+
+    async def generate_content(self, prompt: str, media_files: List[Dict[str, Any]] | None = None) -> str:
+        return await self._cached(prompt, media_files, lambda: self.client.generate_content(prompt, media_files))
+
+    async def generate_with_prefix(self, prefix: str, suffix: str,
+                                   media_files: List[Dict[str, Any]] | None = None) -> str:
+        return await self._cached(prefix + suffix, media_files,
+                                  lambda: self.client.generate_with_prefix(prefix, suffix, media_files))
+
+    async def _cached(self, prompt: str, media_files: List[Dict[str, Any]] | None, call) -> str:
+        key = cache_key(self.model_name, prompt, media_files)
+        if not _bypass.get():
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        response = await call()
+        self.cache.put(key, response)
+        return response
+
+    async def generate_content_stream(self, prompt: str, media_files: List[Dict[str, Any]] | None = None) -> AsyncIterator[str]:
+        async for chunk in self._cached_stream(prompt, media_files,
+                                               lambda: self.client.generate_content_stream(prompt, media_files)):
+            yield chunk
+
+    async def generate_with_prefix_stream(self, prefix: str, suffix: str,
+                                          media_files: List[Dict[str, Any]] | None = None) -> AsyncIterator[str]:
+        stream = lambda: self.client.generate_with_prefix_stream(prefix, suffix, media_files)
+        async for chunk in self._cached_stream(prefix + suffix, media_files, stream):
+            yield chunk
+
+    async def _cached_stream(self, prompt: str, media_files: List[Dict[str, Any]] | None, stream) -> AsyncIterator[str]:
+        key = cache_key(self.model_name, prompt, media_files)
+        if not _bypass.get():
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        chunks = []
+        async for chunk in stream():
+            chunks.append(chunk)
+            yield chunk
+        response = "".join(chunks)
+        self.cache.put(key, response)
+
+_shared_cache: ResponseCache | None = None
+
+def get_response_cache() -> ResponseCache:
+    """Cache compartilhado pelos clientes síncrono e assíncrono, configurado por variáveis de ambiente."""
+    global _shared_cache
+    if _shared_cache is None:
+        ttl = float(os.getenv("GEMINI_CACHE_TTL", "3600"))
+        _shared_cache = ResponseCache(
+            max_entries=int(os.getenv("GEMINI_CACHE_SIZE", "1024")),
+            ttl=ttl if ttl > 0 else None,
+            disk_dir=os.getenv("GEMINI_CACHE_DIR") or None,
+        )
+    return _shared_cache
+
+def _collect_metrics() -> list:
+    if _shared_cache is None:
+        return []
+    stats = _shared_cache.stats()
+    return [
+        ("gemini_cache_lookups_total", "counter", "Consultas ao cache de respostas do Gemini por resultado.", [
+            ({"result": "memory_hit"}, stats["hits"] - stats["disk_hits"]),
+            ({"result": "disk_hit"}, stats["disk_hits"]),
+            ({"result": "miss"}, stats["misses"]),
+        ]),
+        ("gemini_cache_hit_ratio", "gauge", "Fração das consultas ao cache de respostas atendidas por ele.",
+         [({}, stats["hit_rate"])]),
+        ("gemini_cache_entries", "gauge", "Respostas guardadas na memória.", [({}, stats["entries"])]),
+    ]
+
+metrics.REGISTRY.add_collector(_collect_metrics)
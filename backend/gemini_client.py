@@ -1,16 +1,36 @@
 # -*- coding: utf-8 -*-
-"""Cliente mínimo para interagir com a API do Gemini."""
+"""Cliente mínimo para interagir com a API do Gemini.
 
-import base64
+O SDK (`google.generativeai`) só é importado quando um cliente real é criado,
+para que o servidor e o CLI (inclusive com `--mock`) iniciem rápido.
+"""
+
+import asyncio
 import os
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List
+from typing import Any, AsyncIterator, Dict, List
+
+from backend.media import MediaPipeline, get_media_pipeline
+from backend.prompt_cache import (ContextCache, LocalContextCache, get_gemini_context_cache,
+                                  get_local_context_cache, prompt_cache_enabled)
+from backend.resilience import GeminiError, GeminiGuard, GeminiUnavailableError, estimate_tokens, get_gemini_guard
 
-import google.generativeai as genai
-import magic
-from dotenv import load_dotenv
+_env_loaded = False
+_env_lock = threading.Lock()
 
-load_dotenv()
+def load_environment() -> None:
+    """Carrega as variáveis do arquivo .env, uma única vez por processo."""
+    global _env_loaded
+    with _env_lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _env_loaded = True
+
+# Padrão do projeto; GEMINI_MODEL escolhe outro modelo sem mudar o código.
+MODEL_NAME = 'gemini-1.5-pro-latest'
 
 class GeminiClient(ABC):
     @abstractmethod
@@ -18,64 +38,273 @@ class GeminiClient(ABC):
         """Gera conteúdo com base no prompt e, opcionalmente, em arquivos de mídia."""
         pass
 
+    def generate_with_prefix(self, prefix: str, suffix: str, media_files: List[Dict[str, Any]] | None = None) -> str:
+        """
+        Como `generate_content(prefix + suffix)`, mas `prefix` é a parte fixa do
+        prompt: clientes com cache de contexto a enviam só uma vez (ver
+        `backend.prompt_cache`). A implementação padrão envia o prompt inteiro.
+        """
+        return self.generate_content(prefix + suffix, media_files)
+
+class AsyncGeminiClient(ABC):
+    @abstractmethod
+    async def generate_content(self, prompt: str, media_files: List[Dict[str, Any]] | None = None) -> str:
+        """Versão assíncrona de `GeminiClient.generate_content`, sem bloquear o event loop."""
+        pass
+
+    async def generate_content_stream(self, prompt: str, media_files: List[Dict[str, Any]] | None = None) -> AsyncIterator[str]:
+        """Gera conteúdo em pedaços, à medida que o modelo os produz.
+
+        A implementação padrão devolve a resposta inteira num único pedaço.
+        """
+        yield await self.generate_content(prompt, media_files)
+
+    async def generate_with_prefix(self, prefix: str, suffix: str,
+                                   media_files: List[Dict[str, Any]] | None = None) -> str:
+        """Versão assíncrona de `GeminiClient.generate_with_prefix`."""
+        return await self.generate_content(prefix + suffix, media_files)
+
+    async def generate_with_prefix_stream(self, prefix: str, suffix: str,
+                                          media_files: List[Dict[str, Any]] | None = None) -> AsyncIterator[str]:
+        """`generate_content_stream` com o prefixo fixo separado, como em `generate_with_prefix`."""
+        async for chunk in self.generate_content_stream(prefix + suffix, media_files):
+            yield chunk
+
 class RealGeminiClient(GeminiClient):
-    def __init__(self, api_key: str | None = None):
+    def __init__(self, api_key: str | None = None, guard: GeminiGuard | None = None,
+                 media_pipeline: MediaPipeline | None = None, context_cache: ContextCache | None = None):
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             raise ValueError("API key for Gemini not found. Please set the GEMINI_API_KEY environment variable.")
+        import google.generativeai as genai
+
         genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-pro-latest')
+        self.model_name = os.getenv("GEMINI_MODEL") or MODEL_NAME
+        self.model = genai.GenerativeModel(self.model_name)
+        # Limite de taxa, retentativas e circuit breaker, compartilhados pelo processo.
+        self.guard = guard or get_gemini_guard()
+        # Spool em disco e upload pela File API, com cada arquivo enviado uma única vez.
+        self.media = media_pipeline or get_media_pipeline()
+        # Prefixos fixos dos prompts guardados no provedor (None: sempre o prompt inteiro).
+        self.context_cache = context_cache
 
     def _prepare_media(self, media_files: List[Dict[str, Any]]) -> List[Any]:
-        parts = []
-        for file_info in media_files:
-            file_content_b64 = file_info["content"]
-            
-            # Decodifica o conteúdo de base64
-            file_bytes = base64.b64decode(file_content_b64)
-            
-            # Detecta o tipo MIME
-            mime_type = magic.from_buffer(file_bytes, mime=True)
-            
-            if not mime_type.startswith(("image/", "video/")):
-                continue
-
-            parts.append({"mime_type": mime_type, "data": file_bytes})
-        return parts
+        """Troca cada arquivo de imagem ou vídeo pela referência do upload; outros tipos são ignorados."""
+        return self.media.prepare(media_files)
+
+    def _request_parts(self, prompt: str, media_files: List[Dict[str, Any]] | None) -> List[Any]:
+        request_parts = [prompt]
+        if media_files:
+            media_parts = self._prepare_media(media_files)
+            request_parts.extend(media_parts)
+        return request_parts
 
     def generate_content(self, prompt: str, media_files: List[Dict[str, Any]] | None = None) -> str:
-        try:
-            request_parts = [prompt]
-            if media_files:
-                media_parts = self._prepare_media(media_files)
-                request_parts.extend(media_parts)
-            
-            response = self.model.generate_content(request_parts)
+        """Levanta GeminiError (ou GeminiUnavailableError, se for transitório) em caso de falha."""
+        return self._generate(self.model, prompt, media_files)
+
+    def generate_with_prefix(self, prefix: str, suffix: str, media_files: List[Dict[str, Any]] | None = None) -> str:
+        model, prompt = _model_for(self.context_cache, self.model_name, self.model, prefix, suffix)
+        return self._generate(model, prompt, media_files)
+
+    def _generate(self, model: Any, prompt: str, media_files: List[Dict[str, Any]] | None) -> str:
+        request_parts = self._request_parts(prompt, media_files)
+        tokens = estimate_tokens(prompt, len(request_parts) - 1)
+        return self.guard.call(lambda: model.generate_content(request_parts).text, tokens)
+
+def _model_for(context_cache: ContextCache | None, model_name: str, model: Any,
+               prefix: str, suffix: str) -> tuple[Any, str]:
+    """Modelo e texto a enviar: o modelo ligado ao prefixo em cache e só o sufixo, ou `model` e o prompt inteiro."""
+    cached_model = context_cache.lookup(model_name, prefix) if context_cache else None
+    if cached_model is None:
+        return model, prefix + suffix
+    return cached_model, suffix
+
+class AsyncRealGeminiClient(AsyncGeminiClient):
+    def __init__(self, api_key: str | None = None, guard: GeminiGuard | None = None,
+                 media_pipeline: MediaPipeline | None = None, context_cache: ContextCache | None = None):
+        # Reaproveita a configuração, o preparo de mídia, a proteção e o cache de contexto do cliente síncrono.
+        self._client = RealGeminiClient(api_key=api_key, guard=guard, media_pipeline=media_pipeline,
+                                        context_cache=context_cache)
+        self.model_name = self._client.model_name
+        self.model = self._client.model
+        self.guard = self._client.guard
+        self.context_cache = self._client.context_cache
+
+    async def generate_content(self, prompt: str, media_files: List[Dict[str, Any]] | None = None) -> str:
+        return await self._generate(self.model, prompt, media_files)
+
+    async def generate_with_prefix(self, prefix: str, suffix: str,
+                                   media_files: List[Dict[str, Any]] | None = None) -> str:
+        model, prompt = await asyncio.to_thread(_model_for, self.context_cache, self.model_name, self.model,
+                                                prefix, suffix)
+        return await self._generate(model, prompt, media_files)
+
+    async def _generate(self, model: Any, prompt: str, media_files: List[Dict[str, Any]] | None) -> str:
+        # O upload da mídia bloqueia (envio e espera do processamento): fora do event loop.
+        request_parts = await asyncio.to_thread(self._client._request_parts, prompt, media_files)
+        tokens = estimate_tokens(prompt, len(request_parts) - 1)
+
+        async def call() -> str:
+            response = await model.generate_content_async(request_parts)
             return response.text
+
+        return await self.guard.call_async(call, tokens)
+
+    async def generate_content_stream(self, prompt: str, media_files: List[Dict[str, Any]] | None = None) -> AsyncIterator[str]:
+        async for chunk in self._stream(self.model, prompt, media_files):
+            yield chunk
+
+    async def generate_with_prefix_stream(self, prefix: str, suffix: str,
+                                          media_files: List[Dict[str, Any]] | None = None) -> AsyncIterator[str]:
+        model, prompt = await asyncio.to_thread(_model_for, self.context_cache, self.model_name, self.model,
+                                                prefix, suffix)
+        async for chunk in self._stream(model, prompt, media_files):
+            yield chunk
+
+    async def _stream(self, model: Any, prompt: str, media_files: List[Dict[str, Any]] | None) -> AsyncIterator[str]:
+        request_parts = await asyncio.to_thread(self._client._request_parts, prompt, media_files)
+        tokens = estimate_tokens(prompt, len(request_parts) - 1)
+
+        async def open_stream():
+            # Só a abertura do stream (até o primeiro pedaço) é retentada; depois
+            # disso o texto já foi entregue a quem chamou.
+            response = await model.generate_content_async(request_parts, stream=True)
+            chunks = response.__aiter__()
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                return None, None
+            return first, chunks
+
+        first, chunks = await self.guard.call_async(open_stream, tokens)
+        if first is None:
+            return
+        try:
+            if first.text:
+                yield first.text
+            async for chunk in chunks:
+                if chunk.text:
+                    yield chunk.text
         except Exception as e:
-            print(f"Error generating content with Gemini: {e}")
-            return f"Erro ao gerar conteúdo: {e}"
+            raise GeminiError(f"Erro ao gerar conteúdo: {e}") from e
+
+def _resolve_prefix(context_cache: LocalContextCache | None, model_name: str, prefix: str, suffix: str) -> str:
+    """Prompt completo que o mock recebe: o prefixo vem do cache local quando está registrado lá."""
+    handle = context_cache.lookup(model_name, prefix) if context_cache else None
+    return (context_cache.resolve(handle) if handle else prefix) + suffix
 
 class MockGeminiClient(GeminiClient):
-    def generate_content(self, prompt: str, media_files: List[Dict[str, Any]] | None = None) -> str:
+    model_name = 'mock'
+
+    def __init__(self, latency: float = 0.0, context_cache: LocalContextCache | None = None):
+        # Latência artificial (em segundos) para simular o tempo de resposta do modelo.
+        self.latency = latency
+        self.context_cache = context_cache
+
+    def _respond(self, prompt: str, media_files: List[Dict[str, Any]] | None = None) -> str:
         media_info = ""
         if media_files:
             media_info = f" (com análise de {len(media_files)} arquivos de mídia)"
         
-        if "Explique em um relatório conciso" in prompt:
+        if "relatório conciso" in prompt:
             return f"[Relatório Mock] Esta proposta foi gerada para ser eficaz, combinando o template base com a análise de mídia{media_info}."
         
         return f"[Proposta Mock] Conteúdo gerado com base no prompt e no template{media_info}."
 
-def get_gemini_client() -> GeminiClient:
+    def generate_content(self, prompt: str, media_files: List[Dict[str, Any]] | None = None) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(prompt, media_files)
+
+    def generate_with_prefix(self, prefix: str, suffix: str, media_files: List[Dict[str, Any]] | None = None) -> str:
+        return self.generate_content(_resolve_prefix(self.context_cache, self.model_name, prefix, suffix), media_files)
+
+class AsyncMockGeminiClient(AsyncGeminiClient):
+    model_name = 'mock'
+
+    def __init__(self, latency: float = 0.0, chunk_size: int = 3, chunk_delay: float = 0.0,
+                 context_cache: LocalContextCache | None = None):
+        # No streaming, `latency` é o tempo até o primeiro pedaço; cada pedaço
+        # tem `chunk_size` palavras e chega `chunk_delay` segundos após o anterior.
+        self.latency = latency
+        self.context_cache = context_cache
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self._mock = MockGeminiClient()
+
+    async def generate_content(self, prompt: str, media_files: List[Dict[str, Any]] | None = None) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._mock._respond(prompt, media_files)
+
+    async def generate_content_stream(self, prompt: str, media_files: List[Dict[str, Any]] | None = None) -> AsyncIterator[str]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        words = self._mock._respond(prompt, media_files).split(" ")
+        for i in range(0, len(words), self.chunk_size):
+            if i and self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            chunk = " ".join(words[i:i + self.chunk_size])
+            yield chunk if i + self.chunk_size >= len(words) else chunk + " "
+
+    async def generate_with_prefix(self, prefix: str, suffix: str,
+                                   media_files: List[Dict[str, Any]] | None = None) -> str:
+        return await self.generate_content(_resolve_prefix(self.context_cache, self.model_name, prefix, suffix),
+                                           media_files)
+
+    async def generate_with_prefix_stream(self, prefix: str, suffix: str,
+                                          media_files: List[Dict[str, Any]] | None = None) -> AsyncIterator[str]:
+        prompt = _resolve_prefix(self.context_cache, self.model_name, prefix, suffix)
+        async for chunk in self.generate_content_stream(prompt, media_files):
+            yield chunk
+
+def _mock_latency() -> float:
+    return float(os.getenv("MOCK_AI_LATENCY", "0") or 0)
+
+def _resolve_api_key() -> str | None:
+    """Retorna a chave da API do Gemini, ou None quando o cliente mock deve ser usado."""
+    load_environment()
     if os.getenv("USE_MOCK_AI", "true").lower() == "true":
         print("Using Mock Gemini Client")
-        return MockGeminiClient()
-    
+        return None
+
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         print("WARNING: GEMINI_API_KEY not found. Using Mock Gemini Client.")
-        return MockGeminiClient()
-    
+        return None
+
     print("Using Real Gemini Client")
-    return RealGeminiClient(api_key=api_key)
\ No newline at end of file
+    return api_key
+
+def _cache_enabled() -> bool:
+    return os.getenv("GEMINI_CACHE", "false").lower() in ("1", "true")
+
+def _context_cache(real: bool) -> ContextCache | None:
+    if not prompt_cache_enabled():
+        return None
+    return get_gemini_context_cache() if real else get_local_context_cache()
+
+def get_gemini_client() -> GeminiClient:
+    api_key = _resolve_api_key()
+    if not api_key:
+        client = MockGeminiClient(latency=_mock_latency(), context_cache=_context_cache(real=False))
+    else:
+        client = RealGeminiClient(api_key=api_key, context_cache=_context_cache(real=True))
+
+    if _cache_enabled():
+        from backend.gemini_cache import CachingGeminiClient, get_response_cache
+        client = CachingGeminiClient(client, get_response_cache())
+    return client
+
+def get_async_gemini_client() -> AsyncGeminiClient:
+    api_key = _resolve_api_key()
+    if not api_key:
+        client = AsyncMockGeminiClient(latency=_mock_latency(), context_cache=_context_cache(real=False))
+    else:
+        client = AsyncRealGeminiClient(api_key=api_key, context_cache=_context_cache(real=True))
+
+    if _cache_enabled():
+        from backend.gemini_cache import AsyncCachingGeminiClient, get_response_cache
+        client = AsyncCachingGeminiClient(client, get_response_cache())
+    return client
\ No newline at end of file
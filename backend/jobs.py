@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""Fila de trabalhos para gerar propostas fora da requisição HTTP.
+
+`POST /jobs/proposal` grava o pedido e devolve um id na hora; um número fixo
+de workers (tarefas asyncio) executa os trabalhos em ordem de chegada, e
+`GET /jobs/{id}` informa o estado e, no fim, o resultado.
+
+Os trabalhos ficam num banco SQLite, que pode ser compartilhado por vários
+processos do servidor. Cada trabalho em execução guarda o dono (host e pid do
+processo) e um heartbeat renovado a cada `lease / 3` segundos. Um trabalho só
+volta para a fila quando o dono morreu (pid inexistente no mesmo host) ou o
+heartbeat passou de `lease` segundos; os dos processos vivos seguem com eles.
+Ao parar, a fila devolve os próprios trabalhos em execução. Trabalhos
+concluídos há mais de `retention` segundos são apagados.
+
+Estados: "queued" -> "running" -> "done" ou "error".
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List
+
+from backend import metrics
+
+DEFAULT_DB_PATH = "jobs.db"
+DEFAULT_WORKERS = 4
+DEFAULT_RETENTION = 7 * 24 * 3600
+DEFAULT_LEASE = 60.0
+
+QUEUED, RUNNING, DONE, ERROR = "queued", "running", "done", "error"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    owner TEXT,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+# Colunas acrescentadas depois da primeira versão do banco.
+_ADDED_COLUMNS = {"owner": "TEXT", "heartbeat_at": "REAL"}
+
+logger = logging.getLogger("backend.jobs")
+
+JOB_WAIT_SECONDS = metrics.REGISTRY.histogram(
+    "job_wait_seconds", "Tempo entre a criação do trabalho e o início da execução.", ("kind",))
+JOB_RUN_SECONDS = metrics.REGISTRY.histogram("job_run_seconds", "Duração da execução dos trabalhos.", ("kind",))
+JOBS_FINISHED = metrics.REGISTRY.counter("jobs_finished_total", "Trabalhos concluídos por resultado.", ("kind", "status"))
+
+Handler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+def worker_id() -> str:
+    """Dono dos trabalhos iniciados por este processo: `host:pid`."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_is_dead(owner: str | None) -> bool:
+    """True se `owner` é um processo deste host que não existe mais. Em outro host, só o lease decide."""
+    if not owner:
+        return True  # trabalho gravado antes de existir o dono
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass  # existe, mas é de outro usuário
+    return False
+
+
+class JobStore:
+    """Persistência dos trabalhos; uma conexão protegida por lock, como no `SQLiteTemplateStore`."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, column_type in _ADDED_COLUMNS.items():
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def create(self, kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        job = {"id": uuid.uuid4().hex, "kind": kind, "status": QUEUED, "created_at": time.time()}
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO jobs (id, kind, status, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                               (job["id"], kind, QUEUED, json.dumps(payload, ensure_ascii=False), job["created_at"]))
+        return job
+
+    def start(self, job_id: str, owner: str | None = None) -> Dict[str, Any] | None:
+        """
+        Marca o trabalho como em execução por `owner` e devolve tipo, payload e
+        horários; None se ele não está mais na fila (outro worker o pegou).
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            # O UPDATE condicional é a reserva: entre processos, só um o vê mudar uma linha.
+            claimed = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, owner = ?, heartbeat_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, now, owner, now, job_id, QUEUED)).rowcount
+            if not claimed:
+                return None
+            row = self._conn.execute("SELECT kind, payload, created_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return {"id": job_id, "kind": row["kind"], "payload": json.loads(row["payload"]),
+                "created_at": row["created_at"], "started_at": now}
+
+    def finish(self, job_id: str, owner: str | None, result: Dict[str, Any] | None = None,
+               error: str | None = None) -> bool:
+        """
+        Grava o resultado se o trabalho ainda está em execução por `owner`.
+        Devolve False se ele foi devolvido à fila ou pego por outro worker
+        (lease vencido); o resultado atrasado é descartado.
+        """
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? "
+                "WHERE id = ? AND owner IS ? AND status = ?",
+                (ERROR if error is not None else DONE,
+                 json.dumps(result, ensure_ascii=False) if result is not None else None,
+                 error, time.time(), job_id, owner, RUNNING)).rowcount > 0
+
+    def get(self, job_id: str) -> Dict[str, Any] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, result, error, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = dict(row)
+            if job["status"] == QUEUED:
+                job["position"] = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?",
+                    (QUEUED, job["created_at"])).fetchone()[0]
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def heartbeat(self, owner: str, job_ids: List[str]) -> None:
+        """Renova o lease dos trabalhos que `owner` ainda está executando."""
+        if not job_ids:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ? AND owner = ?",
+                                   [(time.time(), job_id, RUNNING, owner) for job_id in job_ids])
+
+    def release(self, owner: str) -> int:
+        """Devolve à fila os trabalhos em execução de `owner` (parada do processo)."""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, owner = NULL, heartbeat_at = NULL "
+                "WHERE status = ? AND owner = ?", (QUEUED, RUNNING, owner)).rowcount
+
+    def reclaim(self, lease: float) -> List[str]:
+        """
+        Devolve à fila os trabalhos em execução cujo dono morreu ou cujo
+        heartbeat passou de `lease` segundos, e devolve os ids deles.
+        """
+        cutoff = time.time() - lease
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT id, owner, heartbeat_at FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+            stale = [row["id"] for row in rows
+                     if (row["heartbeat_at"] or 0) < cutoff or _owner_is_dead(row["owner"])]
+            self._conn.executemany(
+                "UPDATE jobs SET status = ?, started_at = NULL, owner = NULL, heartbeat_at = NULL "
+                "WHERE id = ? AND status = ?", [(QUEUED, job_id, RUNNING) for job_id in stale])
+        return stale
+
+    def recover(self, lease: float = DEFAULT_LEASE) -> List[str]:
+        """Devolve à fila os trabalhos abandonados (`reclaim`) e lista os pendentes em ordem de chegada."""
+        self.reclaim(lease)
+        with self._lock:
+            return [job_id for (job_id,) in self._conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,))]
+
+    def prune(self, older_than: float) -> int:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                                      (DONE, ERROR, older_than)).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+        return {status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, ERROR)}
+
+    def oldest_queued(self) -> float | None:
+        with self._lock:
+            return self._conn.execute("SELECT MIN(created_at) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+
+
+class JobQueue:
+    """
+    Executa trabalhos com no máximo `workers` ao mesmo tempo. `handlers` mapeia
+    o tipo do trabalho para uma função assíncrona que recebe o payload e
+    devolve o resultado (um dicionário serializável em JSON).
+    """
+
+    def __init__(self, handlers: Dict[str, Handler], db_path: str = DEFAULT_DB_PATH,
+                 workers: int = DEFAULT_WORKERS, retention: float = DEFAULT_RETENTION,
+                 lease: float = DEFAULT_LEASE, owner: str | None = None):
+        self.handlers = handlers
+        self.db_path = db_path
+        self._store: JobStore | None = None
+        self._store_lock = threading.Lock()
+        self.workers = max(1, workers)
+        self.retention = retention
+        self.lease = lease
+        self.owner = owner or worker_id()
+        self._queue: asyncio.Queue | None = None
+        self._tasks: List[asyncio.Task] = []
+        # Trabalhos que os workers deste processo estão executando (renovados pelo heartbeat).
+        self._active: set = set()
+
+    @property
+    def store(self) -> JobStore:
+        # Aberto no primeiro uso, para que importar o servidor não crie o banco.
+        with self._store_lock:
+            if self._store is None:
+                self._store = JobStore(self.db_path)
+            return self._store
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self) -> None:
+        """Retoma os trabalhos pendentes e inicia os workers no loop atual."""
+        if self._tasks:
+            return
+        self.store.prune(time.time() - self.retention)
+        self._queue = asyncio.Queue()
+        for job_id in self.store.recover(self.lease):
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self) -> None:
+        """Para os workers e devolve à fila os trabalhos que eles estavam executando."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._queue = None
+        self._active.clear()
+        if self._store is not None:
+            self.store.release(self.owner)
+
+    def close(self) -> None:
+        with self._store_lock:
+            if self._store is not None:
+                self._store.close()
+                self._store = None
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if kind not in self.handlers:
+            raise ValueError(f"Tipo de trabalho desconhecido: '{kind}'")
+        job = self.store.create(kind, payload)
+        if self._queue is not None:
+            self._queue.put_nowait(job["id"])
+        return job
+
+    def get(self, job_id: str) -> Dict[str, Any] | None:
+        return self.store.get(job_id)
+
+    async def _heartbeat(self) -> None:
+        """Renova o lease dos trabalhos em execução e retoma os abandonados por processos que morreram."""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                self.store.heartbeat(self.owner, list(self._active))
+                for job_id in self.store.reclaim(self.lease):
+                    self._queue.put_nowait(job_id)
+            except Exception:
+                logger.exception("Falha ao renovar o lease dos trabalhos")
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = self.store.start(job_id, self.owner)
+            except Exception:
+                # O trabalho segue na fila do banco e é retomado no próximo início.
+                logger.exception("Falha ao iniciar o trabalho %s", job_id)
+                continue
+            if job is None:
+                continue
+            kind = job["kind"]
+            if metrics.ENABLED:
+                JOB_WAIT_SECONDS.observe(job["started_at"] - job["created_at"], kind)
+            self._active.add(job_id)
+            try:
+                result = await self.handlers[kind](job["payload"])
+            except asyncio.CancelledError:
+                # Parada do servidor: `stop` devolve o trabalho à fila.
+                raise
+            except Exception as e:
+                result, error, status = None, str(e), ERROR
+            else:
+                error, status = None, DONE
+            finally:
+                self._active.discard(job_id)
+            try:
+                finished = self.store.finish(job_id, self.owner, result=result, error=error)
+            except Exception:
+                # Sem heartbeat, o lease vence e o trabalho volta para a fila.
+                logger.exception("Falha ao gravar o resultado do trabalho %s", job_id)
+                continue
+            if not finished:
+                logger.warning("Trabalho %s já não era deste worker; resultado descartado", job_id)
+                continue
+            if metrics.ENABLED:
+                JOB_RUN_SECONDS.observe(time.time() - job["started_at"], kind)
+                JOBS_FINISHED.inc(kind, status)
+
+    def collect_metrics(self) -> list:
+        """Famílias de métricas da fila, para `metrics.REGISTRY.add_collector`."""
+        if self._store is None:
+            return []
+        counts = self.store.counts()
+        oldest = self.store.oldest_queued()
+        return [
+            ("job_queue_depth", "gauge", "Trabalhos aguardando na fila.", [({}, counts[QUEUED])]),
+            ("jobs_running", "gauge", "Trabalhos em execução.", [({}, counts[RUNNING])]),
+            ("job_oldest_queued_seconds", "gauge", "Há quanto tempo o trabalho mais antigo da fila espera.",
+             [({}, time.time() - oldest if oldest else 0)]),
+        ]
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""Pipeline de mídia para as requisições ao Gemini.
+
+- `MediaSpool`: grava uploads em disco pedaço a pedaço, calculando o SHA-256
+  no caminho e detectando o tipo MIME só pelos primeiros KB. Os arquivos
+  ficam endereçados pelo hash, então o mesmo conteúdo é guardado uma vez.
+- `MediaUploader`: envia um arquivo ao serviço de upload e devolve a
+  referência usada na requisição (`GeminiFileUploader` usa a File API;
+  `LocalUploader` é um substituto local para testes e desenvolvimento).
+- `UploadCache`: lembra a referência de cada hash enquanto ela vale, para
+  que o mesmo arquivo seja enviado uma vez só.
+- `MediaPipeline`: junta as peças e transforma `media_files` em partes da
+  requisição.
+
+Cada item de `media_files` é um dicionário com `path`, `sha256`, `size` e
+`mime_type` (como devolvido por `MediaSpool`) ou, no formato antigo, com o
+conteúdo em `content` (base64 em texto, ou os próprios bytes).
+"""
+
+import asyncio
+import base64
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List
+
+from backend import metrics
+
+SNIFF_BYTES = 8192
+CHUNK_SIZE = 1024 * 1024
+# Os arquivos da File API expiram em 48h; a margem evita usar uma referência vencida.
+UPLOAD_TTL = 47 * 3600
+SPOOL_MAX_AGE = 24 * 3600
+SUPPORTED_MIME_PREFIXES = ("image/", "video/")
+
+
+def default_spool_dir() -> str:
+    return os.getenv("MEDIA_SPOOL_DIR") or os.path.join(tempfile.gettempdir(), "proposal-media")
+
+
+class MediaSpool:
+    def __init__(self, directory: str | None = None, max_age: float = SPOOL_MAX_AGE):
+        self.directory = directory or default_spool_dir()
+        self.max_age = max_age
+        self._last_prune = 0.0
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.directory, sha256[:2], sha256)
+
+    def _open_temp(self):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".upload-")
+        return os.fdopen(fd, "wb"), tmp_path
+
+    def _finish(self, tmp_path: str, digest, size: int, head: bytes, filename: str | None) -> Dict[str, Any]:
+        import magic  # a libmagic só é carregada no primeiro upload
+
+        sha256 = digest.hexdigest()
+        path = self._path(sha256)
+        if os.path.exists(path):
+            # Mesmo conteúdo já está no spool: descarta a cópia nova.
+            os.remove(tmp_path)
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        self._maybe_prune()
+        return {
+            "path": path,
+            "sha256": sha256,
+            "size": size,
+            "mime_type": magic.from_buffer(head, mime=True) if head else "application/octet-stream",
+            "filename": filename,
+        }
+
+    def write(self, chunks: Iterable[bytes], filename: str | None = None) -> Dict[str, Any]:
+        """Grava os pedaços no spool e devolve a descrição do arquivo."""
+        f, tmp_path = self._open_temp()
+        digest, size, head = hashlib.sha256(), 0, b""
+        try:
+            with f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    if len(head) < SNIFF_BYTES:
+                        head += chunk[:SNIFF_BYTES - len(head)]
+                    f.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return self._finish(tmp_path, digest, size, head, filename)
+
+    async def write_upload(self, upload: Any, filename: str | None = None, chunk_size: int = CHUNK_SIZE) -> Dict[str, Any]:
+        """Versão para arquivos com `async read(n)`, como o `UploadFile` do FastAPI."""
+        f, tmp_path = self._open_temp()
+        digest, size, head = hashlib.sha256(), 0, b""
+        try:
+            with f:
+                while chunk := await upload.read(chunk_size):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    if len(head) < SNIFF_BYTES:
+                        head += chunk[:SNIFF_BYTES - len(head)]
+                    f.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        # Mover o arquivo, detectar o tipo e a limpeza periódica do spool bloqueiam: fora do event loop.
+        return await asyncio.to_thread(self._finish, tmp_path, digest, size, head,
+                                       filename or getattr(upload, "filename", None))
+
+    def write_base64(self, content: str, filename: str | None = None, chunk_size: int = CHUNK_SIZE) -> Dict[str, Any]:
+        """Decodifica base64 em blocos direto para o spool, sem montar o arquivo inteiro na memória."""
+        step = chunk_size - chunk_size % 4
+        return self.write((base64.b64decode(content[i:i + step]) for i in range(0, len(content), step)), filename)
+
+    def prune(self) -> int:
+        """Remove arquivos do spool sem uso há mais de `max_age` segundos."""
+        removed = 0
+        cutoff = time.time() - self.max_age
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def _maybe_prune(self) -> None:
+        now = time.monotonic()
+        if now - self._last_prune >= min(self.max_age, 3600):
+            self._last_prune = now
+            self.prune()
+
+
+class MediaUploader(ABC):
+    @abstractmethod
+    def upload(self, asset: Dict[str, Any]) -> Any:
+        """Envia o arquivo descrito por `asset` e devolve a referência usada na requisição."""
+
+
+class GeminiFileUploader(MediaUploader):
+    """Envia pela File API do Gemini e espera o processamento (vídeos) terminar."""
+
+    def __init__(self, processing_timeout: float = 300.0, poll_interval: float = 2.0):
+        self.processing_timeout = processing_timeout
+        self.poll_interval = poll_interval
+
+    def upload(self, asset: Dict[str, Any]) -> Any:
+        import google.generativeai as genai
+
+        uploaded = genai.upload_file(asset["path"], mime_type=asset["mime_type"],
+                                     display_name=asset.get("filename") or asset["sha256"][:16])
+        deadline = time.monotonic() + self.processing_timeout
+        while uploaded.state.name == "PROCESSING":
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"O processamento de '{uploaded.name}' passou de {self.processing_timeout}s.")
+            time.sleep(self.poll_interval)
+            uploaded = genai.get_file(uploaded.name)
+        if uploaded.state.name != "ACTIVE":
+            raise RuntimeError(f"Falha ao processar o arquivo '{uploaded.name}': {uploaded.state.name}")
+        return uploaded
+
+
+class LocalUploader(MediaUploader):
+    """Substituto local do serviço de upload: copia para um diretório e devolve uma referência `local://`."""
+
+    def __init__(self, directory: str | None = None):
+        self.directory = directory
+        self.uploads: List[str] = []
+
+    def upload(self, asset: Dict[str, Any]) -> Any:
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(asset["path"], "rb") as src, open(os.path.join(self.directory, asset["sha256"]), "wb") as dst:
+                while chunk := src.read(CHUNK_SIZE):
+                    dst.write(chunk)
+        self.uploads.append(asset["sha256"])
+        return {"file_uri": f"local://{asset['sha256']}", "mime_type": asset["mime_type"]}
+
+
+class UploadCache:
+    def __init__(self, ttl: float = UPLOAD_TTL, clock=time.time):
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: Dict[str, tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, sha256: str) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(sha256)
+            if entry is not None and self.clock() - entry[0] < self.ttl:
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(sha256, None)
+            self.misses += 1
+            return None
+
+    def put(self, sha256: str, handle: Any) -> None:
+        with self._lock:
+            self._entries[sha256] = (self.clock(), handle)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class MediaPipeline:
+    def __init__(self, uploader: MediaUploader, spool: MediaSpool | None = None, cache: UploadCache | None = None):
+        self.uploader = uploader
+        self.spool = spool or MediaSpool()
+        self.cache = cache or UploadCache()
+        # Um lock por hash em envio, com o número de pedidos que o usam; sai do dicionário com o último.
+        self._locks: Dict[str, list] = {}
+        self._locks_lock = threading.Lock()
+
+    def asset_for(self, file_info: Dict[str, Any]) -> Dict[str, Any]:
+        if file_info.get("path") and file_info.get("sha256"):
+            return file_info
+        content = file_info["content"]
+        if isinstance(content, bytes):
+            return self.spool.write([content], file_info.get("filename"))
+        return self.spool.write_base64(content, file_info.get("filename"))
+
+    def handle_for(self, asset: Dict[str, Any]) -> Any:
+        """Referência do arquivo no serviço de upload, enviando-o só se ainda não foi enviado."""
+        sha256 = asset["sha256"]
+        with self._locks_lock:
+            entry = self._locks.setdefault(sha256, [threading.Lock(), 0])
+            entry[1] += 1
+        # Uma requisição por hash: pedidos simultâneos do mesmo arquivo esperam o primeiro envio.
+        try:
+            with entry[0]:
+                handle = self.cache.get(sha256)
+                if handle is None:
+                    handle = self.uploader.upload(asset)
+                    self.cache.put(sha256, handle)
+        finally:
+            with self._locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[sha256]
+        return handle
+
+    def prepare(self, media_files: List[Dict[str, Any]]) -> List[Any]:
+        parts = []
+        for file_info in media_files:
+            asset = self.asset_for(file_info)
+            if not asset["mime_type"].startswith(SUPPORTED_MIME_PREFIXES):
+                continue
+            parts.append(self.handle_for(asset))
+        return parts
+
+
+_pipeline: MediaPipeline | None = None
+_pipeline_lock = threading.Lock()
+
+
+def get_media_pipeline() -> MediaPipeline:
+    """Pipeline compartilhado pelos clientes reais do processo, com uploads pela File API."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = MediaPipeline(GeminiFileUploader())
+        return _pipeline
+
+
+def _collect_metrics() -> list:
+    if _pipeline is None:
+        return []
+    stats = _pipeline.cache.stats()
+    return [
+        ("media_upload_cache_lookups_total", "counter", "Consultas ao cache de uploads de mídia por resultado.",
+         [({"result": "hit"}, stats["hits"]), ({"result": "miss"}, stats["misses"])]),
+        ("media_upload_cache_entries", "gauge", "Arquivos com referência de upload ainda válida.",
+         [({}, stats["entries"])]),
+    ]
+
+
+metrics.REGISTRY.add_collector(_collect_metrics)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""Redução de imagens e vídeos antes de irem para o modelo.
+
+Fica entre o spool de upload (`backend.media`) e o `_prepare_media`:
+
+- imagens são reduzidas para caber em `max_dimension` pixels e recomprimidas
+  (JPEG, ou PNG quando há transparência); se isso não diminuir o arquivo, o
+  original é mantido;
+- vídeos viram `keyframes` quadros JPEG espalhados pela duração, extraídos
+  com o `ffmpeg` (sem ele, o vídeo segue inteiro);
+- outros tipos passam sem mudança.
+
+O trabalho roda num pool de processos para não travar o atendimento das
+requisições, e cada chamada devolve um relatório com os tamanhos antes e depois.
+"""
+
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+from backend.media import MediaSpool
+
+DEFAULT_MAX_DIMENSION = 1536
+DEFAULT_JPEG_QUALITY = 85
+DEFAULT_KEYFRAMES = 6
+
+logger = logging.getLogger("backend.media")
+
+# Configuração do processo de trabalho, definida pelo inicializador do pool.
+_settings: Dict[str, Any] = {}
+
+
+def _encode_image(image) -> bytes:
+    buffer = io.BytesIO()
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        image.save(buffer, format="PNG", optimize=True)
+    else:
+        image.convert("RGB").save(buffer, format="JPEG", quality=_settings["jpeg_quality"],
+                                  optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def _downscale_image(asset: Dict[str, Any], spool: MediaSpool) -> Tuple[List[Dict[str, Any]], str | None]:
+    from PIL import Image, ImageOps
+
+    max_dimension = _settings["max_dimension"]
+    with Image.open(asset["path"]) as original:
+        image = ImageOps.exif_transpose(original)
+        resized = max(image.size) > max_dimension
+        if resized:
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        data = _encode_image(image)
+
+    if not resized and len(data) >= asset["size"]:
+        return [asset], None
+    return [spool.write([data], asset.get("filename"))], None
+
+
+def _ffmpeg_output(args: List[str]) -> bytes:
+    return subprocess.run(args, check=True, capture_output=True, timeout=120).stdout
+
+
+def _extract_keyframes(asset: Dict[str, Any], spool: MediaSpool) -> Tuple[List[Dict[str, Any]], str | None]:
+    if not shutil.which("ffmpeg") or not shutil.which("ffprobe"):
+        return [asset], "ffmpeg indisponível; vídeo enviado inteiro"
+
+    duration = float(_ffmpeg_output([
+        "ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", asset["path"],
+    ]).strip() or 0)
+    count = max(1, _settings["keyframes"])
+    side = _settings["max_dimension"]
+    scale = f"scale=w='min(iw,{side})':h='min(ih,{side})':force_original_aspect_ratio=decrease"
+    frames = []
+    for i in range(count):
+        # Quadros no meio de cada trecho, para cobrir o vídeo inteiro.
+        timestamp = duration * (i + 0.5) / count
+        data = _ffmpeg_output([
+            "ffmpeg", "-v", "error", "-ss", f"{timestamp:.3f}", "-i", asset["path"], "-frames:v", "1",
+            "-vf", scale, "-q:v", "3", "-f", "image2pipe", "-vcodec", "mjpeg", "-",
+        ])
+        if data:
+            name = f"{os.path.splitext(asset.get('filename') or 'video')[0]}_{i + 1}.jpg"
+            frames.append(spool.write([data], name))
+    if not frames:
+        return [asset], "nenhum quadro extraído; vídeo enviado inteiro"
+    return frames, None
+
+
+def _init_worker(settings: Dict[str, Any]) -> None:
+    _settings.clear()
+    _settings.update(settings)
+
+
+def preprocess_asset(asset: Dict[str, Any]) -> Dict[str, Any]:
+    """Processa um arquivo do spool; roda dentro do pool."""
+    spool = MediaSpool(_settings["spool_dir"])
+    mime_type = asset["mime_type"]
+    note = None
+    try:
+        if mime_type.startswith("image/"):
+            outputs, note = _downscale_image(asset, spool)
+        elif mime_type.startswith("video/"):
+            outputs, note = _extract_keyframes(asset, spool)
+        else:
+            outputs = [asset]
+    except Exception as e:
+        outputs, note = [asset], f"falha no processamento ({e}); arquivo enviado sem mudanças"
+
+    report = {
+        "filename": asset.get("filename"),
+        "mime_type": mime_type,
+        "bytes_before": asset["size"],
+        "bytes_after": sum(output["size"] for output in outputs),
+        "outputs": len(outputs),
+    }
+    if note:
+        report["note"] = note
+    return {"outputs": outputs, "report": report}
+
+
+class MediaPreprocessor:
+    def __init__(self, max_dimension: int = DEFAULT_MAX_DIMENSION, jpeg_quality: int = DEFAULT_JPEG_QUALITY,
+                 keyframes: int = DEFAULT_KEYFRAMES, workers: int | None = None, spool_dir: str | None = None):
+        self.settings = {
+            "max_dimension": max_dimension,
+            "jpeg_quality": jpeg_quality,
+            "keyframes": keyframes,
+            "spool_dir": spool_dir or MediaSpool().directory,
+        }
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self._pool: ProcessPoolExecutor | None = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # "spawn" evita herdar locks e threads do servidor no processo filho.
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker, initargs=(self.settings,))
+        return self._pool
+
+    @staticmethod
+    def _combine(results: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        assets = [output for result in results for output in result["outputs"]]
+        files = [result["report"] for result in results]
+        report = {
+            "files": files,
+            "bytes_before": sum(f["bytes_before"] for f in files),
+            "bytes_after": sum(f["bytes_after"] for f in files),
+        }
+        if files:
+            logger.info("Mídia reduzida de %d para %d bytes (%d arquivos -> %d)",
+                        report["bytes_before"], report["bytes_after"], len(files), len(assets))
+        return assets, report
+
+    def process(self, assets: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Devolve os arquivos processados (na ordem de entrada) e o relatório de tamanhos."""
+        if not assets:
+            return self._combine([])
+        return self._combine(list(self._get_pool().map(preprocess_asset, assets)))
+
+    async def process_async(self, assets: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        if not assets:
+            return self._combine([])
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        results = await asyncio.gather(*(loop.run_in_executor(pool, preprocess_asset, asset) for asset in assets))
+        return self._combine(list(results))
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+def get_media_preprocessor(spool_dir: str | None = None) -> MediaPreprocessor:
+    """
+    Pré-processador configurado pelas variáveis MEDIA_MAX_DIMENSION,
+    MEDIA_JPEG_QUALITY, MEDIA_VIDEO_KEYFRAMES e MEDIA_PREPROCESS_WORKERS.
+    """
+    workers = int(os.getenv("MEDIA_PREPROCESS_WORKERS", "0"))
+    return MediaPreprocessor(
+        max_dimension=int(os.getenv("MEDIA_MAX_DIMENSION", DEFAULT_MAX_DIMENSION)),
+        jpeg_quality=int(os.getenv("MEDIA_JPEG_QUALITY", DEFAULT_JPEG_QUALITY)),
+        keyframes=int(os.getenv("MEDIA_VIDEO_KEYFRAMES", DEFAULT_KEYFRAMES)),
+        workers=workers or None,
+        spool_dir=spool_dir,
+    )
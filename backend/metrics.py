@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""Métricas no formato de texto do Prometheus, sem dependências externas.
+
+- `span(nome)`: bloco cronometrado; a duração vai para o histograma
+  `proposal_stage_seconds{stage=nome}`. `@timed(nome)` faz o mesmo para uma
+  função inteira.
+- `record_llm_call`: contagem, latência e tamanho do prompt e da resposta de
+  cada chamada ao modelo.
+- `REGISTRY.add_collector`: valores lidos na hora da coleta (ex.: acertos de cache).
+
+Com `METRICS_ENABLED=0` (ou `set_enabled(False)`), `span` devolve um contexto
+vazio compartilhado e os registros retornam na primeira linha, de modo que a
+instrumentação custa só uma checagem de variável.
+"""
+
+import bisect
+import functools
+import inspect
+import math
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+# (nome, tipo, ajuda, [(rótulos, valor)])
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def set_enabled(enabled: bool) -> None:
+    global ENABLED
+    ENABLED = enabled
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0.0)
+
+    def collect(self) -> Family:
+        with self._lock:
+            samples = [(dict(zip(self.labelnames, labels)), value) for labels, value in sorted(self._values.items())]
+        return self.name, "counter", self.help, samples
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # rótulos -> [contagem por faixa (não acumulada, com +Inf no fim), soma, total]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            series = self._series.get(labels)
+            return series[2] if series else 0
+
+    def collect(self) -> Family:
+        samples = []
+        with self._lock:
+            series_items = sorted((labels, ([*s[0]], s[1], s[2])) for labels, s in self._series.items())
+        for labels, (counts, total, count) in series_items:
+            base = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                samples.append((dict(base, le=_format_value(bound)), cumulative, "_bucket"))
+            samples.append((base, total, "_sum"))
+            samples.append((base, count, "_count"))
+        return self.name, "histogram", self.help, samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        """Registra uma função que devolve famílias de métricas na hora da coleta."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Todas as métricas no formato de texto do Prometheus (versão 0.0.4)."""
+        with self._lock:
+            metrics, collectors = list(self._metrics), list(self._collectors)
+        families = [metric.collect() for metric in metrics]
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                print(f"Warning: metrics collector failed: {e}")
+
+        lines = []
+        for name, kind, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample in samples:
+                labels, value = sample[0], sample[1]
+                suffix = sample[2] if len(sample) > 2 else ""
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "proposal_stage_seconds", "Duração de cada etapa da geração de propostas e do acesso aos templates.", ("stage",))
+LLM_CALLS = REGISTRY.counter("llm_calls_total", "Chamadas ao modelo por tipo e resultado.", ("call", "status"))
+LLM_SECONDS = REGISTRY.histogram("llm_call_seconds", "Latência das chamadas ao modelo.", ("call",))
+LLM_PROMPT_CHARS = REGISTRY.histogram(
+    "llm_prompt_chars", "Tamanho dos prompts enviados, em caracteres.", ("call",), SIZE_BUCKETS)
+LLM_RESPONSE_CHARS = REGISTRY.histogram(
+    "llm_response_chars", "Tamanho das respostas recebidas, em caracteres.", ("call",), SIZE_BUCKETS)
+HYBRID_PARSE = REGISTRY.counter(
+    "hybrid_parse_total", "Respostas do template híbrido lidas como JSON ou pelo fallback.", ("result",))
+
+_NOOP = nullcontext()
+
+
+class _Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, self.stage)
+        return False
+
+
+def span(stage: str):
+    """Cronometra o bloco `with` como a etapa `stage`."""
+    return _Span(stage) if ENABLED else _NOOP
+
+
+def timed(stage: str):
+    """Decorador: cronometra cada chamada da função (síncrona ou `async`) como a etapa `stage`."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not ENABLED:
+                    return await fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    STAGE_SECONDS.observe(time.perf_counter() - start, stage)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - start, stage)
+        return wrapper
+    return decorator
+
+
+def record_llm_call(call: str, seconds: float, prompt: str, response: str | None) -> None:
+    """Registra uma chamada ao modelo; `response=None` indica falha."""
+    if not ENABLED:
+        return
+    LLM_CALLS.inc(call, "ok" if response is not None else "error")
+    LLM_SECONDS.observe(seconds, call)
+    LLM_PROMPT_CHARS.observe(len(prompt), call)
+    if response is not None:
+        LLM_RESPONSE_CHARS.observe(len(response), call)
+
+
+def record_hybrid_parse(fallback: bool) -> None:
+    if ENABLED:
+        HYBRID_PARSE.inc("fallback" if fallback else "json")
+
+
+def render() -> str:
+    return REGISTRY.render()
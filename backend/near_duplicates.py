@@ -0,0 +1,174 @@
+"""Near-duplicate detection for template bodies with MinHash and LSH.
+
+Each body is reduced to the set of its word 3-grams ("shingles"). A MinHash
+signature of NUM_PERM values estimates the Jaccard similarity between two
+sets, and locality-sensitive hashing splits the signature into BANDS bands:
+two bodies become candidates when any band matches exactly. With the default
+20 bands of 6 rows, a pair at 0.8 Jaccard becomes a candidate with >99%
+probability and one at 0.5 with ~27%; candidates are then confirmed against
+`threshold` using the full signatures.
+"""
+import re
+import threading
+import unicodedata
+import zlib
+
+import numpy as np
+
+NUM_PERM = 120
+BANDS = 20
+SHINGLE_SIZE = 3
+DEFAULT_THRESHOLD = 0.8
+
+_WORD = re.compile(r'\w+')
+_rng = np.random.RandomState(20240611)
+# Fixed coefficients so signatures are comparable across processes and runs.
+_A = _rng.randint(0, 1 << 63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.randint(0, 1 << 63, size=NUM_PERM, dtype=np.uint64)
+_SHIFT = np.uint64(32)
+
+
+def _words(text):
+    text = (text or '').lower()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return _WORD.findall(text)
+
+
+def shingles(text):
+    """Returns the set of word n-grams of `text`, lowercased and without accents."""
+    words = _words(text)
+    if len(words) < SHINGLE_SIZE:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _shingle_hashes(words):
+    # Combines per-word crc32 values instead of hashing each joined n-gram string.
+    hashes = np.fromiter((zlib.crc32(w.encode('utf-8')) for w in words), dtype=np.uint64, count=len(words))
+    # Short bodies are a single shingle of all their words, as in `shingles`.
+    size = min(len(words), SHINGLE_SIZE)
+    n = len(words) - size + 1
+    combined = np.zeros(n, dtype=np.uint64)
+    for offset in range(size):
+        combined = combined * np.uint64(0x100000001B3) + hashes[offset:offset + n]
+    return combined
+
+
+def signature(text):
+    """MinHash signature of the shingles of `text`, or None for empty text."""
+    words = _words(text)
+    if not words:
+        return None
+    hashes = _shingle_hashes(words)
+    # Multiply-shift hashing: (a * x + b) mod 2**64, keeping the high 32 bits.
+    values = (hashes[:, None] * _A[None, :] + _B[None, :]) >> _SHIFT
+    return values.min(axis=0).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    LSH index of template bodies keyed by filename.
+
+    `version` records which version of the library the index mirrors; callers
+    compare it with their own change counter to decide when to `sync`.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, field='body'):
+        self.threshold = threshold
+        self.field = field
+        self.version = None
+        self._lock = threading.Lock()
+        self._signatures = {}
+        self._templates = {}
+        self._buckets = [{} for _ in range(BANDS)]
+
+    def __len__(self):
+        return len(self._signatures)
+
+    @staticmethod
+    def _bands(sig):
+        rows = NUM_PERM // BANDS
+        return [sig[i * rows:(i + 1) * rows].tobytes() for i in range(BANDS)]
+
+    def _add(self, key, template, sig):
+        self._remove(key)
+        self._templates[key] = template
+        if sig is None:
+            return
+        self._signatures[key] = sig
+        for bucket, band in zip(self._buckets, self._bands(sig)):
+            bucket.setdefault(band, set()).add(key)
+
+    def _remove(self, key):
+        self._templates.pop(key, None)
+        sig = self._signatures.pop(key, None)
+        if sig is None:
+            return
+        for bucket, band in zip(self._buckets, self._bands(sig)):
+            keys = bucket.get(band)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del bucket[band]
+
+    def add(self, key, template):
+        sig = signature(template.get(self.field))
+        with self._lock:
+            self._add(key, template, sig)
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def sync(self, templates, version=None):
+        """Mirrors `templates` ({key: template}), re-hashing only new or replaced objects."""
+        with self._lock:
+            if version is not None and version == self.version:
+                return
+            for key in [k for k in self._templates if k not in templates]:
+                self._remove(key)
+            changed = [(k, t) for k, t in templates.items() if self._templates.get(k) is not t]
+        signatures = [(k, t, signature(t.get(self.field))) for k, t in changed]
+        with self._lock:
+            for key, template, sig in signatures:
+                self._add(key, template, sig)
+            self.version = version
+
+    def find(self, text, exclude=()):
+        """Returns (key, estimated Jaccard similarity) of the closest near-duplicate of `text`, or None."""
+        sig = signature(text)
+        if sig is None:
+            return None
+        best = None
+        with self._lock:
+            candidates = set()
+            for bucket, band in zip(self._buckets, self._bands(sig)):
+                candidates.update(bucket.get(band, ()))
+            for key in candidates:
+                if key in exclude:
+                    continue
+                similarity = float(np.mean(self._signatures[key] == sig))
+                if similarity >= self.threshold and (best is None or similarity > best[1]
+                                                     or (similarity == best[1] and key < best[0])):
+                    best = (key, similarity)
+        return best
+
+
+def find_duplicates(templates, usage_counts=None, threshold=DEFAULT_THRESHOLD):
+    """
+    Groups near-duplicate templates by body. In each group the most used
+    template (then the first by filename) is kept. Returns (duplicate, kept)
+    filename pairs.
+    """
+    usage_counts = usage_counts or {}
+    ordered = sorted(templates, key=lambda t: (-usage_counts.get(t['filename'], 0), t['filename']))
+    index = NearDuplicateIndex(threshold)
+    duplicates = []
+    for template in ordered:
+        match = index.find(template.get('body'))
+        if match:
+            duplicates.append((template['filename'], match[0]))
+        else:
+            index.add(template['filename'], template)
+    return duplicates
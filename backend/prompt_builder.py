@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Sufixo dos prompts dentro de um orçamento de tokens.
+
+O prefixo fixo vai para o cache de contexto (`backend.prompt_cache`); o que
+pesa a cada pedido é o sufixo, dominado pelos corpos dos modelos de
+inspiração. `PromptBuilder` junta os trechos numa única passada e, se o total
+passar do orçamento da etapa, corta primeiro os corpos mais longos: todos
+ficam com no máximo o mesmo tamanho, o maior que caiba no orçamento, e os
+curtos seguem inteiros.
+
+Orçamentos (em tokens, pela estimativa local de `resilience.estimate_tokens`):
+`PROMPT_BUDGET_HYBRID` e `PROMPT_BUDGET_REPORT`. `record_prompt` registra o
+tamanho de cada chamada no log `backend.prompt` e nas métricas.
+"""
+
+import logging
+import os
+from typing import List
+
+from backend import metrics
+from backend.prompt_cache import PromptParts
+from backend.resilience import estimate_tokens
+
+DEFAULT_BUDGETS = {"hybrid": 1500, "report": 400}
+# Um corpo cortado mantém pelo menos isto, mesmo que o orçamento estoure.
+MIN_BODY_CHARS = 160
+TRUNCATION_MARK = " [...]"
+
+logger = logging.getLogger("backend.prompt")
+
+PROMPT_TOKENS = metrics.REGISTRY.histogram(
+    "llm_prompt_tokens", "Tokens estimados de cada prompt, por parte (prefix ou suffix).", ("call", "part"),
+    (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768))
+PROMPT_TRIMMED = metrics.REGISTRY.counter(
+    "prompt_bodies_trimmed_total", "Corpos de inspiração cortados para caber no orçamento.", ("call",))
+
+
+def stage_budget(call: str) -> int:
+    """Orçamento de tokens do sufixo da etapa `call` ('hybrid' ou 'report')."""
+    return int(os.getenv(f"PROMPT_BUDGET_{call.upper()}", DEFAULT_BUDGETS.get(call, DEFAULT_BUDGETS["hybrid"])))
+
+
+def _truncate(text: str, limit: int) -> str:
+    """Corta `text` em até `limit` caracteres, no último espaço, e marca o corte."""
+    cut = text[:max(0, limit - len(TRUNCATION_MARK))]
+    space = cut.rfind(" ")
+    if space > len(cut) // 2:
+        cut = cut[:space]
+    return cut.rstrip() + TRUNCATION_MARK
+
+
+def fit_texts(texts: List[str], budget_chars: int, min_chars: int = MIN_BODY_CHARS) -> List[str]:
+    """
+    Corta os textos mais longos primeiro até a soma caber em `budget_chars`.
+    Procura o maior teto comum que cabe; textos abaixo dele ficam inteiros.
+    """
+    total = sum(len(text) for text in texts)
+    if total <= budget_chars:
+        return list(texts)
+
+    lengths = sorted((len(text) for text in texts), reverse=True)
+    # Com os k maiores cortados no teto e os demais inteiros: k * teto + resto <= orçamento.
+    rest = total
+    cap = 0
+    for k, length in enumerate(lengths, start=1):
+        rest -= length
+        cap = (budget_chars - rest) // k
+        following = lengths[k] if k < len(lengths) else 0
+        if cap >= following:
+            break
+    cap = max(cap, min_chars)
+    return [text if len(text) <= cap else _truncate(text, cap) for text in texts]
+
+
+class PromptBuilder:
+    """
+    Acumula trechos fixos (`add`) e corpos que podem ser cortados (`add_body`)
+    e monta o texto de uma vez em `build`, respeitando o orçamento da etapa.
+    """
+
+    def __init__(self, call: str, budget_tokens: int | None = None):
+        self.call = call
+        self.budget_tokens = stage_budget(call) if budget_tokens is None else budget_tokens
+        self._pieces: List[tuple] = []
+        self.trimmed = 0
+
+    def add(self, text: str) -> "PromptBuilder":
+        self._pieces.append((text, False))
+        return self
+
+    def add_body(self, text: str) -> "PromptBuilder":
+        self._pieces.append((text, True))
+        return self
+
+    def build(self) -> str:
+        fixed_chars = sum(len(text) for text, trimmable in self._pieces if not trimmable)
+        bodies = [text for text, trimmable in self._pieces if trimmable]
+        # Mesma conta de `estimate_tokens`: ~4 caracteres por token.
+        fitted = fit_texts(bodies, max(0, self.budget_tokens * 4 - fixed_chars))
+        self.trimmed = sum(1 for before, after in zip(bodies, fitted) if before is not after)
+        if self.trimmed and metrics.ENABLED:
+            PROMPT_TRIMMED.inc(self.call, amount=self.trimmed)
+        fitted_iter = iter(fitted)
+        return "".join(next(fitted_iter) if trimmable else text for text, trimmable in self._pieces)
+
+
+def record_prompt(call: str, prompt: PromptParts) -> None:
+    """Registra o tamanho estimado do prompt de uma chamada, para calibrar os orçamentos."""
+    prefix_tokens = estimate_tokens(prompt.prefix)
+    suffix_tokens = estimate_tokens(prompt.suffix)
+    if metrics.ENABLED:
+        PROMPT_TOKENS.observe(prefix_tokens, call, "prefix")
+        PROMPT_TOKENS.observe(suffix_tokens, call, "suffix")
+    logger.info("prompt %s: prefix=%d suffix=%d tokens (orçamento do sufixo: %d)",
+                call, prefix_tokens, suffix_tokens, stage_budget(call))
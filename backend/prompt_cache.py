@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""Prompts em duas partes e cache de contexto do prefixo fixo.
+
+Cada prompt do motor é um `PromptParts`:
+
+- `prefix`: o perfil do negócio (`config.BUSINESS_INFO`) e as instruções da
+  tarefa. É igual em todas as chamadas do mesmo tipo, então é registrado uma
+  vez no cache de contexto do provedor e depois referenciado pelo handle;
+- `suffix`: o que muda a cada pedido (contexto do cliente, modelos de inspiração).
+
+`GeminiContextCache` usa o `CachedContent` do Gemini; `LocalContextCache` é o
+substituto local usado pelos clientes mock e nos testes. Prefixos menores que
+o mínimo aceito pelo provedor para o modelo (`min_cache_tokens`) seguem
+inteiros no prompt.
+
+`track_tokens_saved()` soma os tokens que deixaram de ser enviados durante um
+pedido; o motor devolve esse total em `tokens_saved`.
+"""
+
+import contextvars
+import datetime
+import hashlib
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Dict
+
+from backend import config, metrics
+from backend.resilience import estimate_tokens
+
+DEFAULT_TTL = 3600.0
+# Depois de uma falha ao registrar um prefixo, quanto esperar antes de tentar de novo.
+DEFAULT_RETRY_AFTER = 300.0
+
+# Mínimo de tokens que o Gemini aceita em conteúdo de cache, por família de
+# modelo (o nome mais longo que casar com o início do modelo vale).
+GEMINI_MIN_CACHE_TOKENS = {
+    "gemini-1.5": 4096,
+    "gemini-2.0": 4096,
+    "gemini-2.5-pro": 4096,
+    "gemini-2.5-flash": 1024,
+}
+DEFAULT_GEMINI_MIN_TOKENS = 4096
+
+PROMPT_CACHE_LOOKUPS = metrics.REGISTRY.counter(
+    "prompt_cache_lookups_total", "Prefixos de prompt por resultado no cache de contexto.", ("result",))
+PROMPT_CACHE_TOKENS_SAVED = metrics.REGISTRY.counter(
+    "prompt_cache_tokens_saved_total", "Tokens de prefixo que não foram reenviados graças ao cache de contexto.")
+
+_tally = contextvars.ContextVar("prompt_cache_tally", default=None)
+
+
+class PromptParts:
+    """Prompt dividido em prefixo fixo (candidato ao cache) e sufixo por pedido."""
+
+    __slots__ = ("prefix", "suffix")
+
+    def __init__(self, prefix: str, suffix: str):
+        self.prefix = prefix
+        self.suffix = suffix
+
+    @property
+    def text(self) -> str:
+        return self.prefix + self.suffix
+
+
+def min_cache_tokens(model_name: str) -> int:
+    """Mínimo de tokens para o provedor aceitar o prefixo em cache; PROMPT_CACHE_MIN_TOKENS tem precedência."""
+    override = os.getenv("PROMPT_CACHE_MIN_TOKENS")
+    if override:
+        return int(override)
+    name = model_name.removeprefix("models/")
+    families = [family for family in GEMINI_MIN_CACHE_TOKENS if name.startswith(family)]
+    return GEMINI_MIN_CACHE_TOKENS[max(families, key=len)] if families else DEFAULT_GEMINI_MIN_TOKENS
+
+
+def business_profile(info: Dict[str, Any] | None = None) -> str:
+    """Texto com o perfil da empresa que envia as propostas, a partir de `config.BUSINESS_INFO`."""
+    info = config.BUSINESS_INFO if info is None else info
+    lines = ["Sobre a empresa que envia a proposta:"]
+    if info.get("name"):
+        lines.append(f"- Nome: {info['name']}")
+    if info.get("what_you_do"):
+        lines.append(f"- O que faz: {info['what_you_do']}")
+    for label, key in (("Produtos e serviços", "products_or_services"), ("Pontos fortes", "strengths")):
+        items = info.get(key) or []
+        if items:
+            lines.append(f"- {label}:")
+            lines.extend(f"  - {item}" for item in items)
+    return "\n".join(lines) + "\n"
+
+
+class _Tally:
+    __slots__ = ("total",)
+
+    def __init__(self):
+        self.total = 0
+
+
+@contextmanager
+def track_tokens_saved():
+    """Soma, em `.total`, os tokens economizados pelas chamadas feitas dentro do bloco."""
+    tally = _Tally()
+    token = _tally.set(tally)
+    try:
+        yield tally
+    finally:
+        _tally.reset(token)
+
+
+def record_tokens_saved(tokens: int) -> None:
+    tally = _tally.get()
+    if tally is not None:
+        tally.total += tokens
+    if metrics.ENABLED:
+        PROMPT_CACHE_TOKENS_SAVED.inc(amount=tokens)
+
+
+class ContextCache(ABC):
+    """
+    Prefixos registrados no provedor, por modelo. `lookup` registra o prefixo
+    na primeira vez e o reaproveita até `ttl` segundos depois do registro.
+
+    `min_tokens=None` usa o mínimo do provedor para cada modelo. O registro
+    (uma chamada de rede) acontece fora do lock: pedidos simultâneos pelo mesmo
+    prefixo esperam o registro em andamento, os demais seguem livres. Uma
+    falha faz o prefixo ir inteiro no prompt por `retry_after` segundos.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, min_tokens: int | None = None,
+                 retry_after: float = DEFAULT_RETRY_AFTER):
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.retry_after = retry_after
+        self._entries: Dict[str, tuple] = {}
+        self._pending: Dict[str, Future] = {}
+        # Prefixo -> instante (monotonic) em que um novo registro pode ser tentado.
+        self._rejected: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _register(self, model_name: str, prefix: str) -> Any:
+        """Registra o prefixo no provedor e devolve o handle."""
+
+    def min_tokens_for(self, model_name: str) -> int:
+        return min_cache_tokens(model_name) if self.min_tokens is None else self.min_tokens
+
+    def lookup(self, model_name: str, prefix: str) -> Any | None:
+        """
+        Handle do prefixo para `model_name`, registrando-o se preciso, ou None
+        se o prefixo deve ir inteiro no prompt (pequeno demais ou recusado).
+        """
+        tokens = estimate_tokens(prefix)
+        if tokens < self.min_tokens_for(model_name):
+            return self._finish("skipped", None, tokens)
+
+        key = hashlib.sha256(f"{model_name}\0{prefix}".encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry[1]:
+                return self._finish("hit", entry[0], tokens)
+            if now < self._rejected.get(key, 0.0):
+                return self._finish("skipped", None, tokens)
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = Future()
+
+        if not owner:
+            # Outro pedido está registrando o mesmo prefixo: usa o resultado dele.
+            handle = pending.result()
+            return self._finish("hit" if handle is not None else "error", handle, tokens)
+
+        handle = None
+        try:
+            handle = self._register(model_name, prefix)
+        except Exception as e:
+            print(f"Warning: context cache unavailable for this prompt prefix: {e}")
+        finally:
+            with self._lock:
+                del self._pending[key]
+                if handle is None:
+                    self._rejected[key] = time.monotonic() + self.retry_after
+                else:
+                    self._rejected.pop(key, None)
+                    # Margem de 1% para não usar um handle prestes a expirar no provedor.
+                    self._entries[key] = (handle, time.monotonic() + self.ttl * 0.99)
+            pending.set_result(handle)
+        return self._finish("miss" if handle is not None else "error", handle, tokens)
+
+    def _finish(self, result: str, handle: Any, tokens: int) -> Any:
+        if metrics.ENABLED:
+            PROMPT_CACHE_LOOKUPS.inc(result)
+        if result == "hit":
+            record_tokens_saved(tokens)
+        return handle
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._rejected.clear()
+
+
+class LocalContextCache(ContextCache):
+    """Substituto local do cache do provedor: o handle é o hash e o prefixo fica em memória."""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, min_tokens: int | None = 0,
+                 retry_after: float = DEFAULT_RETRY_AFTER):
+        super().__init__(ttl, min_tokens, retry_after)
+        self._prefixes: Dict[str, str] = {}
+        self.registrations = 0
+
+    def _register(self, model_name: str, prefix: str) -> str:
+        handle = "local/" + hashlib.sha256(f"{model_name}\0{prefix}".encode("utf-8")).hexdigest()[:16]
+        self._prefixes[handle] = prefix
+        self.registrations += 1
+        return handle
+
+    def resolve(self, handle: str) -> str:
+        """O prefixo guardado sob `handle`, como o provedor faria ao receber a referência."""
+        return self._prefixes[handle]
+
+
+class GeminiContextCache(ContextCache):
+    """Registra o prefixo com `CachedContent` e devolve um modelo ligado a ele."""
+
+    def _register(self, model_name: str, prefix: str) -> Any:
+        import google.generativeai as genai
+        from google.generativeai import caching
+
+        cached = caching.CachedContent.create(model=model_name, contents=[prefix],
+                                              ttl=datetime.timedelta(seconds=self.ttl))
+        return genai.GenerativeModel.from_cached_content(cached_content=cached)
+
+
+def prompt_cache_enabled() -> bool:
+    return os.getenv("PROMPT_CACHE", "true").lower() in ("1", "true")
+
+
+_local_cache: LocalContextCache | None = None
+_gemini_cache: GeminiContextCache | None = None
+_caches_lock = threading.Lock()
+
+
+def get_local_context_cache() -> LocalContextCache:
+    global _local_cache
+    with _caches_lock:
+        if _local_cache is None:
+            _local_cache = LocalContextCache()
+        return _local_cache
+
+
+def get_gemini_context_cache() -> GeminiContextCache:
+    """Cache compartilhado pelos clientes reais; o mínimo de tokens vem de `min_cache_tokens`."""
+    global _gemini_cache
+    with _caches_lock:
+        if _gemini_cache is None:
+            _gemini_cache = GeminiContextCache(ttl=float(os.getenv("PROMPT_CACHE_TTL", DEFAULT_TTL)))
+        return _gemini_cache
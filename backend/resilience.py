@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""Proteções para as chamadas ao Gemini: limite de taxa, retentativas e circuit breaker.
+
+- `RateLimiter`: dois token buckets, um para requisições por minuto e outro
+  para tokens por minuto. Se a espera estimada passar de `max_wait`, a chamada
+  é recusada com `RateLimitExceeded` em vez de ficar na fila indefinidamente.
+- Retentativas com backoff exponencial e jitter, apenas para erros transitórios
+  (quota, indisponibilidade, timeout).
+- `CircuitBreaker`: depois de várias falhas seguidas, falha imediatamente por
+  `reset_timeout` segundos e então deixa passar uma chamada de teste.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+from backend import metrics
+
+T = TypeVar("T")
+
+class GeminiError(Exception):
+    """Falha ao gerar conteúdo com o Gemini."""
+
+class GeminiUnavailableError(GeminiError):
+    """O Gemini não pode atender agora; vale tentar de novo depois de `retry_after` segundos."""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class RateLimitExceeded(GeminiUnavailableError):
+    pass
+
+class CircuitOpenError(GeminiUnavailableError):
+    pass
+
+# Erros do google.api_core (e similares) que valem uma nova tentativa.
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+    "InternalServerError", "DeadlineExceeded", "GatewayTimeout",
+}
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(exc).__mro__)
+
+def estimate_tokens(prompt: str, media_count: int = 0) -> int:
+    """Estimativa local: ~4 caracteres por token e 258 tokens por arquivo de mídia."""
+    return max(1, len(prompt) // 4) + 258 * media_count
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Segundos até `amount` ficar disponível (0 se já estiver)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def reserve(self, amount: float) -> None:
+        # O saldo pode ficar negativo: quem reservou depois espera mais (fila justa).
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, max_wait: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.requests = TokenBucket(requests_per_minute / 60.0, requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute, clock)
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _reserve(self, tokens: int) -> float:
+        with self._lock:
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if wait > self.max_wait:
+                self.rejected += 1
+                raise RateLimitExceeded(
+                    f"Limite de requisições ao Gemini atingido; espera estimada de {wait:.1f}s.",
+                    retry_after=wait)
+            self.requests.reserve(1)
+            self.tokens.reserve(tokens)
+            return wait
+
+    def acquire(self, tokens: int = 1) -> None:
+        wait = self._reserve(tokens)
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 1) -> None:
+        wait = self._reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def state(self) -> Dict[str, Any]:
+        with self._lock:
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(1))
+            return {
+                "requests_available": round(self.requests.tokens, 2),
+                "tokens_available": round(self.tokens.tokens, 2),
+                "wait_seconds": round(wait, 3),
+                "max_wait_seconds": self.max_wait,
+                "rejected": self.rejected,
+            }
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def status(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def before_call(self) -> bool:
+        """Libera a chamada ou levanta CircuitOpenError. True quando ela é a chamada de teste do half-open."""
+        with self._lock:
+            status = self.status
+            if status == self.CLOSED:
+                return False
+            if status == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            retry_after = max(0.0, self.reset_timeout - (self.clock() - self.opened_at))
+            raise CircuitOpenError("A API do Gemini está indisponível; tente novamente em instantes.",
+                                   retry_after=retry_after or 1.0)
+
+    def release_trial(self) -> None:
+        """Libera a chamada de teste que não chegou ao fim (fila cheia, cancelamento)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self._trial_in_flight = False
+
+    def state(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"status": self.status, "consecutive_failures": self.failures}
+
+class GeminiGuard:
+    """Combina limite de taxa, retentativas e circuit breaker em volta de uma chamada."""
+
+    def __init__(self, limiter: RateLimiter, breaker: CircuitBreaker, max_retries: int = 3,
+                 backoff_base: float = 1.0, backoff_cap: float = 20.0):
+        self.limiter = limiter
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+    def backoff(self, attempt: int) -> float:
+        # "Full jitter": espalha as retentativas de clientes concorrentes.
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def _record_error(self, exc: Exception, attempt: int) -> bool:
+        """Registra a falha e diz se vale tentar de novo."""
+        if not is_retryable(exc):
+            # Erro da requisição (ex.: argumento inválido): a API respondeu, então não conta como queda.
+            self.breaker.record_success()
+            return False
+        self.breaker.record_failure()
+        return attempt < self.max_retries
+
+    @staticmethod
+    def _as_error(exc: Exception) -> GeminiError:
+        message = f"Erro ao gerar conteúdo: {exc}"
+        if is_retryable(exc):
+            # Transitório, mas as retentativas se esgotaram.
+            return GeminiUnavailableError(message)
+        return GeminiError(message)
+
+    def call(self, fn: Callable[[], T], tokens: int = 1) -> T:
+        attempt = 0
+        while True:
+            trial = self.breaker.before_call()
+            try:
+                self.limiter.acquire(tokens)
+            except BaseException:
+                # Fila cheia ou cancelamento: a chamada de teste não foi feita.
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            try:
+                result = fn()
+            except Exception as e:
+                if not self._record_error(e, attempt):
+                    raise self._as_error(e) from e
+                time.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelada no meio: sem resultado, a vaga de teste não pode ficar presa.
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def call_async(self, fn: Callable[[], Awaitable[T]], tokens: int = 1) -> T:
+        attempt = 0
+        while True:
+            trial = self.breaker.before_call()
+            try:
+                await self.limiter.acquire_async(tokens)
+            except BaseException:
+                # Fila cheia ou cancelamento: a chamada de teste não foi feita.
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            try:
+                result = await fn()
+            except Exception as e:
+                if not self._record_error(e, attempt):
+                    raise self._as_error(e) from e
+                await asyncio.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelada no meio: sem resultado, a vaga de teste não pode ficar presa.
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def state(self) -> Dict[str, Any]:
+        return {"rate_limiter": self.limiter.state(), "circuit_breaker": self.breaker.state()}
+
+_guard: GeminiGuard | None = None
+
+def get_gemini_guard() -> GeminiGuard:
+    """Proteção compartilhada por todos os clientes reais do processo, configurada por variáveis de ambiente."""
+    global _guard
+    if _guard is None:
+        _guard = GeminiGuard(
+            RateLimiter(
+                requests_per_minute=float(os.getenv("GEMINI_RPM", "60")),
+                tokens_per_minute=float(os.getenv("GEMINI_TPM", "1000000")),
+                max_wait=float(os.getenv("GEMINI_MAX_QUEUE_WAIT", "30")),
+            ),
+            CircuitBreaker(
+                failure_threshold=int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5")),
+                reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET", "30")),
+            ),
+            max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "3")),
+        )
+    return _guard
+
+def _collect_metrics() -> list:
+    if _guard is None:
+        return []
+    state = _guard.state()
+    breaker = state["circuit_breaker"]["status"]
+    return [
+        ("gemini_rate_limit_rejected_total", "counter", "Chamadas recusadas pelo limitador de taxa.",
+         [({}, state["rate_limiter"]["rejected"])]),
+        ("gemini_circuit_breaker_state", "gauge", "Estado do circuit breaker (1 no estado atual).",
+         [({"state": status}, 1 if status == breaker else 0)
+          for status in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)]),
+    ]
+
+metrics.REGISTRY.add_collector(_collect_metrics)
@@ -1,17 +1,69 @@
 import os
+import asyncio
 import json
-import uvicorn
-from fastapi import FastAPI, HTTPException, Form
+import math
+import threading
+from contextlib import asynccontextmanager, nullcontext
+from datetime import datetime, timedelta
+
+from fastapi import FastAPI, HTTPException, Form, File, UploadFile, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from typing import Dict, Any, Optional
-from starlette.responses import HTMLResponse
-from backend.template_manager import get_template_report
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES
+from typing import Dict, Any, List, Optional
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from backend.ai_engine import AIEngine, build_client_context
+from backend import assets, batch, metrics, usage_recorder
+from backend.assets import PrecompressedStaticFiles
+from backend.fast_render import DEFAULT_VARIANT, get_fast_renderer
+from backend.gemini_cache import bypass_cache
+from backend.gemini_client import load_environment
+from backend.jobs import JobQueue
+from backend.media import MediaSpool
+from backend.media_preprocess import get_media_preprocessor
+from backend.resilience import GeminiError, GeminiUnavailableError, get_gemini_guard
+from backend.template_store import get_template_store
+from backend.warm_pool import warm_pool_from_env
+
+load_environment()
+
+def _warm_up():
+    template_store.prepare()
+    ai_engine.warm_index()
+    ai_engine.warm_clients()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Monta os índices de templates em segundo plano para não atrasar a primeira proposta.
+    threading.Thread(target=_warm_up, daemon=True).start()
+    await job_queue.start()
+    warmer = asyncio.create_task(_warm_pool_loop()) if warm_pool is not None else None
+    yield
+    if warmer is not None:
+        warmer.cancel()
+        await asyncio.gather(warmer, return_exceptions=True)
+    await job_queue.stop()
+    # Grava os contadores de uso que ainda estão no buffer em memória.
+    template_store.flush()
+    media_preprocessor.close()
+
+app = FastAPI(lifespan=lifespan)
 
-from backend import template_manager
-from backend.ai_engine import AIEngine
+media_spool = MediaSpool()
+# Reduz imagens e vídeos num pool de processos antes de enviá-los ao modelo.
+media_preprocessor = get_media_preprocessor(media_spool.directory)
 
-app = FastAPI()
+# Limite superior para a concorrência pedida em /generate-proposals/batch.
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+# Tamanho padrão e máximo de uma página de GET /templates.
+TEMPLATES_PAGE_SIZE = 50
+TEMPLATES_MAX_PAGE_SIZE = 500
+
+# Comprime as respostas da API (JSON) acima de GZIP_MIN_SIZE bytes. Os arquivos do
+# frontend já saem comprimidos do build, e SSE/NDJSON seguem sem compressão para
+# que cada evento chegue assim que é gerado.
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MIN_SIZE", "1024")),
+                   exclude_content_types=DEFAULT_EXCLUDED_CONTENT_TYPES + ("application/x-ndjson",))
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,23 +73,127 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-ai_engine = AIEngine()
+template_store = get_template_store()
+# Templates pré-gerados para os nichos mais pedidos (WARM_POOL_BUDGET=0 desliga).
+warm_pool = warm_pool_from_env()
+ai_engine = AIEngine(template_store=template_store, warm_pool=warm_pool)
+if warm_pool is not None:
+    metrics.REGISTRY.add_collector(warm_pool.collect_metrics)
+# Intervalo, em segundos, entre as checagens de ociosidade do gerador do pool.
+WARM_POOL_INTERVAL = float(os.getenv("WARM_POOL_INTERVAL", "60"))
+
+async def _warm_pool_loop():
+    """Nos períodos sem pedidos, gera um template por vez para o pool."""
+    while True:
+        await asyncio.sleep(WARM_POOL_INTERVAL)
+        if not warm_pool.idle():
+            continue
+        try:
+            await ai_engine.refill_warm_pool(limit=1)
+        except Exception as e:
+            print(f"Warning: warm pool refill failed: {e}")
+
+def _lead(nome: str, empresa: str, nicho: str, problems: list) -> Dict[str, Any]:
+    return {"nome": nome, "empresa": empresa, "nicho": nicho, "problems": problems}
+
+async def _run_proposal_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    # Um trabalho retomado depois de muito tempo pode ter perdido a mídia para a
+    # limpeza do spool (SPOOL_MAX_AGE); falha com uma mensagem clara em vez de no upload.
+    missing = [asset.get("filename") or asset["path"] for asset in payload.get("media") or []
+               if "path" in asset and not os.path.exists(asset["path"])]
+    if missing:
+        raise RuntimeError(f"A mídia do trabalho já foi removida do spool ({', '.join(missing)}); "
+                           "envie o pedido de novo.")
+    full_context = build_client_context(payload["nome"], payload["empresa"], payload["nicho"],
+                                        payload["onde"], payload["ponto"], payload["problems"])
+    lead = None if payload.get("no_cache") else _lead(payload["nome"], payload["empresa"], payload["nicho"],
+                                                        payload["problems"])
+    with bypass_cache() if payload.get("no_cache") else nullcontext():
+        result = await ai_engine.generate_proposal_async(full_context, payload.get("media"), lead)
+    if payload.get("media_report"):
+        result["media"] = payload["media_report"]
+    return result
+
+# Trabalhos de geração em segundo plano (POST /jobs/proposal), guardados em SQLite.
+job_queue = JobQueue({"proposal": _run_proposal_job}, os.getenv("JOBS_DB_PATH", "jobs.db"),
+                     workers=int(os.getenv("JOBS_WORKERS", "4")),
+                     lease=float(os.getenv("JOBS_LEASE", "60")))
+metrics.REGISTRY.add_collector(lambda: job_queue.collect_metrics())
 
-frontend_dir = os.path.join(os.path.dirname(__file__), "..", "frontend")
+def _unavailable(e: GeminiUnavailableError) -> HTTPException:
+    retry_after = math.ceil(e.retry_after or 1)
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(retry_after)})
+
+def _shed_if_overloaded() -> None:
+    """Recusa a requisição logo de cara se a fila do limitador do Gemini já estiver longa demais."""
+    state = get_gemini_guard().limiter.state()
+    if state["wait_seconds"] > state["max_wait_seconds"]:
+        raise _unavailable(GeminiUnavailableError(
+            "Muitas propostas em andamento; tente novamente em instantes.", retry_after=state["wait_seconds"]))
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
 
 @app.get("/templates")
-def get_all_templates_endpoint():
-    """Retorna todos os templates disponíveis."""
+def get_all_templates_endpoint(request: Request, type: Optional[str] = None, prefix: Optional[str] = None,
+                               limit: Optional[int] = None, cursor: Optional[str] = None,
+                               summary: bool = False):
+    """
+    Retorna os templates disponíveis. Sem parâmetros, devolve a biblioteca
+    inteira agrupada por categoria; com `type`, `prefix`, `limit`, `cursor` ou
+    `summary`, devolve uma página ({items, next_cursor, total}). A resposta leva
+    um ETag da versão da biblioteca (e, no resumo, que traz a contagem de uso,
+    também da versão do uso) e responde 304 se nada mudou.
+    """
     try:
-        return template_manager.get_all_templates()
+        version = template_store.library_version()
+        if summary:
+            version += f"-{template_store.usage_version()}"
+        etag = f'"{version}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if _etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+
+        if type is None and prefix is None and limit is None and cursor is None and not summary:
+            return JSONResponse(template_store.templates_view(), headers=headers)
+
+        limit = TEMPLATES_PAGE_SIZE if limit is None else limit
+        if not 1 <= limit <= TEMPLATES_MAX_PAGE_SIZE:
+            raise HTTPException(status_code=400, detail=f"'limit' deve estar entre 1 e {TEMPLATES_MAX_PAGE_SIZE}.")
+        try:
+            page = template_store.list_templates(template_type=type, title_prefix=prefix, limit=limit,
+                                                 cursor=cursor, summary=summary)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return JSONResponse(page, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/templates/top")
+def get_top_templates_endpoint(n: int = 10, days: int = 7):
+    """Os `n` templates mais usados nos últimos `days` dias e o uso diário da biblioteca no período."""
+    if not 1 <= n <= TEMPLATES_MAX_PAGE_SIZE or not 1 <= days <= usage_recorder.DAILY_RETENTION_DAYS:
+        raise HTTPException(status_code=400, detail=f"'n' deve estar entre 1 e {TEMPLATES_MAX_PAGE_SIZE} e "
+                                                    f"'days' entre 1 e {usage_recorder.DAILY_RETENTION_DAYS}.")
+    since = datetime.now() - timedelta(days=days)
+    return {
+        "since": since.isoformat(timespec="seconds"),
+        "templates": template_store.top_templates(n, since=since),
+        "daily": [{"day": day, "count": count} for day, count in template_store.usage_trend(days=days)],
+    }
+
 @app.post("/templates/human")
 async def create_human_template(template_data: Dict[str, Any]):
     """Cria um novo template humano."""
     try:
-        template_name = template_manager.save_human_template(template_data)
+        template_name = template_store.save_human_template(template_data)
         return {"message": "Template criado com sucesso", "template_name": template_name}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -49,7 +205,7 @@ def delete_template_endpoint(template_type: str, template_name: str):
         if template_type not in ["human", "ai", "human_adm"]:
             raise HTTPException(status_code=400, detail="Tipo de template inválido.")
         
-        template_manager.delete_template(template_type, template_name)
+        template_store.delete_template(template_type, template_name)
         return {"message": f"Template '{template_name}' deletado."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -57,7 +213,7 @@ def delete_template_endpoint(template_type: str, template_name: str):
 @app.get("/templates/report/{template_name}")
 async def get_template_report_page(template_name: str):
     """Serves a simple HTML page with the template content."""
-    report = get_template_report(template_name)
+    report = template_store.get_template_report(template_name)
     if not report:
         return HTMLResponse(content="<h1>Template não encontrado</h1>", status_code=404)
 
@@ -86,6 +242,16 @@ async def get_template_report_page(template_name: str):
     """
     return HTMLResponse(content=html_content)
 
+@app.get("/templates/{template_type}/{template_name}")
+def get_template_endpoint(template_type: str, template_name: str):
+    """Retorna um template completo, para carregar o corpo sob demanda."""
+    if template_type not in ["human", "ai", "human_adm"]:
+        raise HTTPException(status_code=400, detail="Tipo de template inválido.")
+    template = template_store.get_template(template_type, template_name)
+    if template is None:
+        raise HTTPException(status_code=404, detail=f"Template '{template_name}' não encontrado.")
+    return template
+
 @app.post("/generate-proposal")
 async def generate_proposal(
     nome: str = Form(...),
@@ -94,27 +260,220 @@ async def generate_proposal(
     onde: str = Form(...),
     ponto: Optional[str] = Form(None),
     problems: str = Form(...),  # JSON string
+    no_cache: bool = Form(False),
+    media_files: List[UploadFile] = File([]),
+    mode: str = Form("ai"),
+    template_id: Optional[str] = Form(None),
+    variant: str = Form(DEFAULT_VARIANT),
 ):
-    """Gera uma nova proposta com base nos dados do formulário."""
+    """
+    Gera uma nova proposta com base nos dados do formulário. Com `mode=fast`,
+    preenche um template de `backend.data` localmente, sem chamar o modelo.
+    """
+    if mode == "fast":
+        return _render_fast(nome, empresa, nicho, onde, ponto, problems, template_id, variant)
+    _shed_if_overloaded()
     try:
         problem_list = json.loads(problems)
-        full_context = f"""
-        Nome do Cliente: {nome}
-        Nome da Empresa: {empresa}
-        Nicho de Atuação: {nicho}
-        Onde foi encontrado: {onde}
-        Ponto Forte (Elogio): {ponto or 'Nenhum'}
-        Problemas a resolver: {', '.join(problem_list)}
-        """
-        
-        result = ai_engine.generate_proposal(full_context)
+        full_context = build_client_context(nome, empresa, nicho, onde, ponto, problem_list)
+        media, media_report = await _prepare_uploads(media_files)
+
+        if no_cache:
+            # Pedido explícito de uma nova geração (ex.: botão "gerar novamente"): nem cache nem pool.
+            with bypass_cache():
+                result = await ai_engine.generate_proposal_async(full_context, media)
+        else:
+            result = await ai_engine.generate_proposal_async(full_context, media,
+                                                             _lead(nome, empresa, nicho, problem_list))
+        if media_report:
+            result["media"] = media_report
         return result
+    except GeminiUnavailableError as e:
+        raise _unavailable(e)
+    except GeminiError as e:
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao gerar proposta: {str(e)}")
 
-app.mount("/", StaticFiles(directory=frontend_dir, html=True), name="static")
+def _render_fast(nome: str, empresa: str, nicho: str, onde: str, ponto: Optional[str], problems: str,
+                 template_id: Optional[str], variant: str) -> dict:
+    try:
+        lead = {"nome": nome, "empresa": empresa, "nicho": nicho, "onde": onde, "ponto": ponto,
+                "problems": json.loads(problems)}
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Campo 'problems' inválido: {str(e)}")
+    try:
+        return get_fast_renderer().render(lead, template_id, variant)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=f"Template ou variante inexistente: {e.args[0]}")
+
+async def _prepare_uploads(files: List[UploadFile]) -> tuple[list, dict | None]:
+    """
+    Grava os arquivos enviados no spool de mídia, em blocos, sem carregá-los
+    inteiros na memória, e os reduz. Devolve os arquivos e o relatório de tamanhos.
+    """
+    assets = [await media_spool.write_upload(f) for f in files if f.filename]
+    if not assets:
+        return [], None
+    return await media_preprocessor.process_async(assets)
+
+def _sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/generate-proposal/stream")
+async def generate_proposal_stream(
+    nome: str = Form(...),
+    empresa: str = Form(...),
+    nicho: str = Form(...),
+    onde: str = Form(...),
+    ponto: Optional[str] = Form(None),
+    problems: str = Form(...),  # JSON string
+    no_cache: bool = Form(False),
+    media_files: List[UploadFile] = File([]),
+    mode: str = Form("ai"),
+    template_id: Optional[str] = Form(None),
+    variant: str = Form(DEFAULT_VARIANT),
+):
+    """Gera uma proposta enviando o texto via Server-Sent Events à medida que o modelo o produz."""
+    if mode == "fast":
+        result = _render_fast(nome, empresa, nicho, onde, ponto, problems, template_id, variant)
+
+        async def fast_stream():
+            yield _sse_event("proposal", result["proposal"])
+            yield _sse_event("done", result)
+
+        return StreamingResponse(fast_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+    _shed_if_overloaded()
+    try:
+        problem_list = json.loads(problems)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Campo 'problems' inválido: {str(e)}")
+    full_context = build_client_context(nome, empresa, nicho, onde, ponto, problem_list)
+    media, media_report = await _prepare_uploads(media_files)
+
+    async def event_stream():
+        if media_report:
+            yield _sse_event("media", media_report)
+        try:
+            with bypass_cache() if no_cache else nullcontext():
+                async for event, data in ai_engine.stream_proposal(full_context, media):
+                    yield _sse_event(event, data)
+        except Exception as e:
+            yield _sse_event("error", {"detail": f"Erro ao gerar proposta: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/jobs/proposal", status_code=202)
+async def create_proposal_job(
+    nome: str = Form(...),
+    empresa: str = Form(...),
+    nicho: str = Form(...),
+    onde: str = Form(...),
+    ponto: Optional[str] = Form(None),
+    problems: str = Form(...),  # JSON string
+    no_cache: bool = Form(False),
+    media_files: List[UploadFile] = File([]),
+):
+    """
+    Enfileira a geração de uma proposta e devolve o id do trabalho na hora.
+    Acompanhe por `GET /jobs/{id}`; o resultado é o mesmo de /generate-proposal.
+    """
+    try:
+        problem_list = json.loads(problems)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Campo 'problems' inválido: {str(e)}")
+    media, media_report = await _prepare_uploads(media_files)
+    job = job_queue.submit("proposal", {
+        "nome": nome, "empresa": empresa, "nicho": nicho, "onde": onde, "ponto": ponto,
+        "problems": problem_list, "no_cache": no_cache, "media": media, "media_report": media_report,
+    })
+    return {"job_id": job["id"], "status": job["status"], "status_url": f"/jobs/{job['id']}"}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Estado do trabalho (queued, running, done ou error) e, quando concluído, o resultado."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Trabalho '{job_id}' não encontrado.")
+    return job
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Métricas no formato do Prometheus: etapas da proposta, chamadas ao modelo e caches."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/gemini/status")
+def gemini_status():
+    """Estado do limitador de taxa e do circuit breaker das chamadas ao Gemini."""
+    return get_gemini_guard().state()
+
+@app.post("/generate-proposals/batch")
+async def generate_proposals_batch(
+    file: UploadFile = File(...),
+    concurrency: int = Form(4),
+    completed_ids: Optional[str] = Form(None),  # JSON list, para retomar um lote interrompido
+):
+    """
+    Gera propostas para um arquivo de leads (CSV ou JSONL).
+
+    A resposta é NDJSON: uma linha por lead, enviada assim que a proposta fica
+    pronta. Para retomar, reenvie o arquivo com os ids já concluídos em `completed_ids`.
+    """
+    try:
+        leads = batch.parse_leads_bytes(await file.read(), file.filename)
+        completed = set(json.loads(completed_ids)) if completed_ids else set()
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Arquivo de leads inválido: {str(e)}")
+
+    limit = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+
+    async def result_stream():
+        async for record in batch.run_batch(ai_engine, leads, limit, completed):
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+@app.post("/render/bulk")
+async def render_bulk(
+    file: UploadFile = File(...),
+    variants: Optional[str] = Form(None),  # JSON list; sem ela, todas as variantes
+    template_id: Optional[str] = Form(None),
+):
+    """
+    Monta propostas localmente, sem o modelo, para um arquivo de leads (CSV ou
+    JSONL) em cada variante pedida. A resposta é NDJSON: uma linha por lead e variante.
+    """
+    renderer = get_fast_renderer()
+    try:
+        variant_list = json.loads(variants) if variants else None
+    except ValueError:
+        variant_list = variants
+    if variant_list is not None and (not isinstance(variant_list, list)
+                                     or not all(isinstance(v, str) for v in variant_list)):
+        raise HTTPException(status_code=400, detail="'variants' deve ser uma lista JSON de nomes de variante.")
+    try:
+        leads = batch.parse_leads_bytes(await file.read(), file.filename)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Arquivo de leads inválido: {str(e)}")
+    if template_id is not None and template_id not in renderer.compiled:
+        raise HTTPException(status_code=400, detail=f"Template inexistente: {template_id}")
+
+    def result_stream():
+        for record in renderer.render_bulk(leads, variant_list, template_id):
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+# `python -m backend.assets build` gera frontend/dist (nomes com hash, cópias .gz/.br); sem ele, serve frontend/.
+app.mount("/", PrecompressedStaticFiles(directory=assets.static_dir(), html=True), name="static")
 
 if __name__ == "__main__":
+    import uvicorn
+
     for folder in ["human_templates", "ai_templates"]:
         path = os.path.join(os.path.dirname(__file__), folder)
         if not os.path.exists(path):
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""Índice vetorial local da biblioteca de templates.
+
+Cada template vira um vetor de n-gramas (palavras e pares de palavras) com
+"feature hashing" em `dimensions` posições, peso 1 + log(tf) e norma L2. Os
+vetores ficam numa matriz NumPy em ordem de colunas: a consulta só lê as
+colunas em que o contexto tem termos, então o custo cresce com o tamanho da
+consulta, não com o número de dimensões.
+
+O ranking soma a similaridade de cosseno a um bônus pelo uso do template
+(log do contador, normalizado pelo maior), para desempatar a favor do que já
+funcionou. Inclusões e remoções atualizam só a linha afetada; linhas livres
+são reaproveitadas.
+"""
+
+import math
+import re
+import threading
+import unicodedata
+import zlib
+from typing import Any, Dict, Hashable, Iterable, List, Tuple
+
+import numpy as np
+
+DEFAULT_DIMENSIONS = 512
+DEFAULT_USAGE_WEIGHT = 0.15
+
+# Campos de texto de templates humanos (name/content/instructions) e de IA (title/subject/body/ideal_for).
+TEXT_FIELDS = ("title", "name", "subject", "body", "content", "ideal_for", "instructions")
+
+_TOKEN = re.compile(r"\w+")
+_SIGN_BIT = 1 << 31
+
+# Palavras vazias do português e os rótulos fixos de `build_client_context`,
+# que aparecem em toda consulta e só adicionariam ruído.
+STOPWORDS = frozenset("""
+    a ao aos as com como da das de do dos e ela ele em entre essa esse esta este eu foi
+    ha isso isto ja lhe mais mas me mesmo meu minha muito na nas nao no nos o os ou para
+    pela pelo por qual quando que se sem ser seu sua suas seus so sobre tambem te tem um
+    uma voce voces vou
+    nome cliente empresa nicho atuacao onde encontrado ponto forte elogio problemas resolver nenhum
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Palavras em minúsculas e sem acentos, sem palavras vazias e números."""
+    text = text.lower()
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return [token for token in _TOKEN.findall(text)
+            if len(token) > 1 and token not in STOPWORDS and not token.isdigit()]
+
+
+def template_text(template: Dict[str, Any]) -> str:
+    return "\n".join(str(template[field]) for field in TEXT_FIELDS if template.get(field))
+
+
+class TemplateIndex:
+    """
+    Índice em memória, seguro para uso entre threads.
+
+    As chaves identificam o template na biblioteca, ex.: ("ai", "Proposta.json").
+    O contador de uso é por nome de arquivo, como em `template_usage.json`.
+    """
+
+    def __init__(self, dimensions: int = DEFAULT_DIMENSIONS, usage_weight: float = DEFAULT_USAGE_WEIGHT):
+        self.dimensions = dimensions
+        self.usage_weight = usage_weight
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((0, dimensions), dtype=np.float32, order="F")
+        self._usage = np.zeros(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._size = 0  # linhas já usadas (vivas ou livres)
+        self._rows: Dict[Hashable, int] = {}
+        self._keys: List[Hashable | None] = []
+        self._templates: List[Dict[str, Any] | None] = []
+        self._by_filename: Dict[str, set] = {}
+        self._free: List[int] = []
+        self._usage_counts: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._rows
+
+    def vectorize(self, text: str) -> np.ndarray:
+        tokens = tokenize(text)
+        grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        if not grams:
+            return np.zeros(self.dimensions, dtype=np.float32)
+        # crc32 em vez de hash(): o mesmo texto dá o mesmo vetor em qualquer processo.
+        hashes = np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.int64, count=len(grams))
+        hashes, counts = np.unique(hashes, return_counts=True)
+        # O sinal também vem do hash, para que as colisões tendam a se cancelar.
+        weights = (1.0 + np.log(counts)) * np.where(hashes & _SIGN_BIT, 1.0, -1.0)
+        vector = np.bincount(hashes % self.dimensions, weights=weights,
+                             minlength=self.dimensions).astype(np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def _grow(self) -> None:
+        capacity = max(64, 2 * len(self._alive))
+        vectors = np.zeros((capacity, self.dimensions), dtype=np.float32, order="F")
+        vectors[:self._size] = self._vectors[:self._size]
+        self._vectors = vectors
+        self._usage = np.resize(self._usage, capacity)
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+
+    def _filename(self, key: Hashable, template: Dict[str, Any]) -> str:
+        return template.get("filename") or (key[-1] if isinstance(key, tuple) else str(key))
+
+    def _put(self, key: Hashable, template: Dict[str, Any], vector: np.ndarray) -> None:
+        row = self._rows.get(key)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                if self._size == len(self._alive):
+                    self._grow()
+                row = self._size
+                self._size += 1
+                self._keys.append(None)
+                self._templates.append(None)
+            self._rows[key] = row
+        else:
+            self._by_filename[self._filename(key, self._templates[row])].discard(row)
+        filename = self._filename(key, template)
+        self._by_filename.setdefault(filename, set()).add(row)
+        self._vectors[row] = vector
+        self._alive[row] = True
+        self._usage[row] = self._usage_counts.get(filename, 0)
+        self._keys[row] = key
+        self._templates[row] = template
+
+    def _remove(self, key: Hashable) -> bool:
+        row = self._rows.pop(key, None)
+        if row is None:
+            return False
+        filename = self._filename(key, self._templates[row])
+        self._by_filename[filename].discard(row)
+        if not self._by_filename[filename]:
+            del self._by_filename[filename]
+        self._alive[row] = False
+        self._vectors[row] = 0.0
+        self._keys[row] = None
+        self._templates[row] = None
+        self._free.append(row)
+        return True
+
+    def add(self, key: Hashable, template: Dict[str, Any]) -> None:
+        """Inclui (ou substitui) um template."""
+        vector = self.vectorize(template_text(template))
+        with self._lock:
+            self._put(key, template, vector)
+
+    def remove(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._remove(key)
+
+    def sync(self, templates: Dict[Hashable, Dict[str, Any]], usage_counts: Dict[str, int] | None = None) -> None:
+        """
+        Deixa o índice igual a `templates` (chave -> template), vetorizando só
+        o que mudou. Templates são comparados pelo conteúdo (os stores devolvem
+        cópias a cada leitura).
+        """
+        with self._lock:
+            if usage_counts is not None:
+                self._usage_counts = dict(usage_counts)
+                for filename, rows in self._by_filename.items():
+                    for row in rows:
+                        self._usage[row] = self._usage_counts.get(filename, 0)
+            stale = [key for key in self._rows if key not in templates]
+            changed = [(key, template) for key, template in templates.items()
+                       if key not in self._rows or self._templates[self._rows[key]] != template]
+
+        for key in stale:
+            self.remove(key)
+        vectors = [(key, template, self.vectorize(template_text(template))) for key, template in changed]
+        with self._lock:
+            for key, template, vector in vectors:
+                self._put(key, template, vector)
+
+    def record_usage(self, filename: str, count: int = 1) -> None:
+        with self._lock:
+            self._usage_counts[filename] = self._usage_counts.get(filename, 0) + count
+            for row in self._by_filename.get(filename, ()):
+                self._usage[row] = self._usage_counts[filename]
+
+    def search(self, text: str, k: int = 3) -> List[Tuple[Dict[str, Any], float]]:
+        """Os `k` templates mais relevantes para `text`, com a pontuação, do maior para o menor."""
+        query = self.vectorize(text)
+        terms = np.flatnonzero(query)
+        with self._lock:
+            n = self._size
+            if not self._rows or k <= 0:
+                return []
+            if terms.size:
+                scores = self._vectors[:n, terms] @ query[terms]
+            else:
+                scores = np.zeros(n, dtype=np.float32)
+            usage = self._usage[:n]
+            top_usage = float(usage.max(initial=0.0))
+            if self.usage_weight and top_usage > 0:
+                scores += self.usage_weight * np.log1p(usage) / math.log1p(top_usage)
+            scores[~self._alive[:n]] = -np.inf
+
+            k = min(k, len(self._rows))
+            top = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+            top = top[np.argsort(-scores[top], kind="stable")][:k]
+            return [(self._templates[row], float(scores[row])) for row in top]
+
+
+def library_keys(all_templates: Dict[str, Iterable[Dict[str, Any]]]) -> Dict[Hashable, Dict[str, Any]]:
+    """Converte o resultado de `get_all_templates` em chave -> template."""
+    keyed = {}
+    for group, templates in all_templates.items():
+        template_type = "ai" if group == "ai" else "human"
+        for template in templates:
+            keyed[(template_type, template.get("filename") or template.get("name"))] = template
+    return keyed
@@ -1,91 +1,157 @@
+import bisect
+import copy
 import json
 import os
 import re
-from datetime import datetime
+import tempfile
+import threading
+import time
+import uuid
+
+from backend import metrics
+from backend.near_duplicates import NearDuplicateIndex, find_duplicates
+from backend.usage_recorder import UsageRecorder, file_lock
 
 DATA_FILE = 'template_usage.json'
 HUMAN_TEMPLATES_DIR = 'backend/human_templates'
 AI_TEMPLATES_DIR = 'backend/ai_templates'
 NUM_ADM_TEMPLATES = 10
 
+# Seconds between full per-file mtime sweeps of the template cache. In between,
+# only the directory mtime is checked (covers creates, deletes and renames).
+CACHE_REVALIDATE_INTERVAL = 5.0
+
+# Seconds between background flushes of buffered usage updates to DATA_FILE.
+USAGE_FLUSH_INTERVAL = 5.0
+
+# How new template files are named: 'title' (sanitized title plus _1, _2, ...
+# on clashes) or 'ulid' (a time-sortable unique id; the title stays inside the
+# file and in the in-memory title index). Switch an existing library to 'ulid'
+# with migrate_filenames().
+FILENAME_SCHEME = os.getenv('TEMPLATE_FILENAME_SCHEME', 'title').lower()
+
+_ULID_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_ULID_FILENAME = re.compile(r'^[0-9A-HJKMNP-TV-Z]{26}\.json$')
+_ulid_lock = threading.Lock()
+_last_ulid = [0, 0]
+
+_usage_recorder = None
+_usage_recorder_lock = threading.Lock()
+
+def _get_usage_recorder():
+    """Returns the write-behind recorder for the current DATA_FILE."""
+    global _usage_recorder
+    with _usage_recorder_lock:
+        if _usage_recorder is None or _usage_recorder.path != DATA_FILE:
+            if _usage_recorder is not None:
+                _usage_recorder.close()
+            _usage_recorder = UsageRecorder(DATA_FILE, USAGE_FLUSH_INTERVAL)
+        return _usage_recorder
+
+def flush_usage_data():
+    """Writes any buffered usage updates to DATA_FILE."""
+    _get_usage_recorder().flush()
+
 def _load_usage_data():
-    """Loads template usage data from the JSON file."""
-    if not os.path.exists(DATA_FILE):
-        return {}
-    try:
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        return {}
+    """Loads template usage data, including updates not yet flushed to disk."""
+    return _get_usage_recorder().load_all()
 
 def _save_usage_data(data):
-    """Saves template usage data to the JSON file."""
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4)
+    """Replaces the template usage data in the JSON file."""
+    _get_usage_recorder().update(lambda _: data)
 
+@metrics.timed('template_manager.increment_template_usage')
 def increment_template_usage(filename):
     """Increments the usage count for a given template."""
-    data = _load_usage_data()
-    template_info = data.get(filename, {
-        'usage_count': 0,
-        'last_used': None,
-        'ai_analysis': []
-    })
-    template_info['usage_count'] += 1
-    template_info['last_used'] = datetime.now().isoformat()
-    data[filename] = template_info
-    _save_usage_data(data)
+    _get_usage_recorder().increment(filename)
 
+@metrics.timed('template_manager.save_ai_analysis')
 def save_ai_analysis(filename, analysis_text):
     """Saves AI analysis text for a given template."""
-    data = _load_usage_data()
-    if filename not in data:
-        data[filename] = {
-            'usage_count': 0,
-            'last_used': None,
-            'ai_analysis': []
-        }
-    if 'ai_analysis' not in data[filename]:
-        data[filename]['ai_analysis'] = []
+    _get_usage_recorder().add_analysis(filename, analysis_text)
+
+def get_top_templates(n=10, since=None, until=None):
+    """The n most used templates between since and until (default: the last 7 days)."""
+    return _get_usage_recorder().top_templates(n, since, until)
+
+def get_usage_trend(filename=None, days=30):
+    """[(day, uses)] for the last `days` days, for one template or the whole library."""
+    return _get_usage_recorder().usage_trend(filename, days)
 
-    data[filename]['ai_analysis'].append(analysis_text)
-    _save_usage_data(data)
+def compact_usage_data():
+    """Folds the usage event log into the totals and the hourly/daily rollups."""
+    _get_usage_recorder().compact()
 
+def get_usage_counts():
+    """Returns {filename: usage_count} for every template with recorded usage."""
+    return {filename: info.get('usage_count', 0) for filename, info in _load_usage_data().items()}
+
+@metrics.timed('template_manager.get_template_report')
 def get_template_report(filename):
     """Retrieves usage report for a specific template."""
-    data = _load_usage_data()
-    report = data.get(filename)
-    
-    found_path = None
-    for directory in [HUMAN_TEMPLATES_DIR, AI_TEMPLATES_DIR]:
-        path = os.path.join(directory, filename)
-        if os.path.exists(path):
-            found_path = path
-            break
-            
-    if found_path:
-        try:
-            with open(found_path, 'r', encoding='utf-8') as f:
-                template_content = json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            template_content = 'Erro ao ler o arquivo do template.'
-    else:
-        template_content = 'Arquivo do template não encontrado.'
+    report = _get_usage_recorder().get(filename)
+    template_content = _find_template(filename)
+    if isinstance(template_content, dict):
+        template_content = template_content.get('body', 'Conteúdo não disponível.')
 
     if report:
         report['filename'] = filename
-        report['content'] = template_content.get('body', 'Conteúdo não disponível.')
+        report['content'] = template_content
     else:
         report = {
             'filename': filename,
             'usage_count': 0,
             'last_used': 'Nunca',
             'ai_analysis': [],
-            'content': template_content.get('body', 'Conteúdo não disponível.') if isinstance(template_content, dict) else template_content
+            'content': template_content
         }
         
     return report
 
+def _find_template(filename):
+    """
+    Returns the template stored as `filename` (human directory first), or an
+    error message string. Uses a dict lookup in the template cache, so no file
+    is opened and no directory is scanned.
+    """
+    with _cache_lock:
+        for directory in [HUMAN_TEMPLATES_DIR, AI_TEMPLATES_DIR]:
+            cache = _get_dir_cache(directory)
+            cache.refresh()
+            entry = cache.entries.get(filename)
+            if entry is not None:
+                return _copy_template(entry[2])
+    for directory in [HUMAN_TEMPLATES_DIR, AI_TEMPLATES_DIR]:
+        # Not (yet) in the cache: a file written by another process since the last sweep.
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            template_data = _load_template_file(path, filename)
+            return template_data if template_data is not None else 'Erro ao ler o arquivo do template.'
+    return 'Arquivo do template não encontrado.'
+
+def find_templates_by_title(title):
+    """Returns [{'type': 'human'|'ai', 'filename': ...}] for every template with exactly this title."""
+    matches = []
+    with _cache_lock:
+        for template_type, directory in (('human', HUMAN_TEMPLATES_DIR), ('ai', AI_TEMPLATES_DIR)):
+            cache = _get_dir_cache(directory)
+            cache.refresh()
+            matches.extend({'type': template_type, 'filename': filename}
+                           for filename in sorted(cache.titles.get(title, ())))
+    return matches
+
+def _load_template_file(filepath, filename):
+    """Loads a single template file, returning None if it cannot be parsed."""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            template_data = json.load(f)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        print(f"Warning: Could not decode or parse {filepath}. Skipping.")
+        return None
+    template_data['filename'] = filename
+    template_data['name'] = os.path.basename(filename)
+    return template_data
+
 def _get_templates_from_dir(directory):
     """Loads all templates from a specified directory."""
     templates = []
@@ -99,34 +165,282 @@ def _get_templates_from_dir(directory):
 
     for filename in filenames:
         if filename.endswith('.json'):
-            filepath = os.path.join(directory, filename)
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    template_data = json.load(f)
-                    template_data['filename'] = filename
-                    template_data['name'] = os.path.basename(filename)
-                    templates.append(template_data)
-            except (json.JSONDecodeError, UnicodeDecodeError):
-                print(f"Warning: Could not decode or parse {filepath}. Skipping.")
-                continue
+            template_data = _load_template_file(os.path.join(directory, filename), filename)
+            if template_data is not None:
+                templates.append(template_data)
     return templates
 
+def _title_of(template_data):
+    return template_data.get('title') or template_data.get('name', '')
+
+class _DirectoryCache:
+    """
+    In-memory copy of the templates in one directory.
+
+    Files are re-read only when their (mtime, size) changes. A full per-file
+    stat sweep only happens when the directory mtime changes or every
+    CACHE_REVALIDATE_INTERVAL seconds (to catch in-place edits).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.dir_mtime = None
+        self.last_sweep = 0.0
+        self.filenames = []
+        self.entries = {}
+        # title -> filenames; with ULID filenames this is the only way back from a title.
+        self.titles = {}
+        self.version = 0
+        self._templates = None
+
+    def _dir_mtime(self):
+        try:
+            return os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _changed(self):
+        self.version += 1
+        self._templates = None
+
+    def refresh(self):
+        now = time.monotonic()
+        dir_mtime = self._dir_mtime()
+        if (dir_mtime is not None and dir_mtime == self.dir_mtime
+                and now - self.last_sweep < CACHE_REVALIDATE_INTERVAL):
+            return
+
+        seen = set()
+        changed = False
+        if dir_mtime is not None:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith('.json') or not entry.is_file():
+                        continue
+                    seen.add(entry.name)
+                    st = entry.stat()
+                    cached = self.entries.get(entry.name)
+                    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                        continue
+                    template_data = _load_template_file(entry.path, entry.name)
+                    if template_data is None:
+                        if self._drop(entry.name):
+                            changed = True
+                        continue
+                    self._store(entry.name, st, template_data)
+                    changed = True
+
+        for filename in [f for f in self.entries if f not in seen]:
+            self._drop(filename)
+            changed = True
+
+        if changed:
+            self._changed()
+        # A directory mtime from the current clock tick may hide a write that lands
+        # in the same tick, so don't trust it and rescan on the next call.
+        racy = dir_mtime is not None and time.time_ns() - dir_mtime < 1_000_000_000
+        self.dir_mtime = None if racy else dir_mtime
+        self.last_sweep = now
+
+    def _store(self, filename, st, template_data):
+        if filename not in self.entries:
+            bisect.insort(self.filenames, filename)
+        else:
+            self._untitle(filename)
+        self.entries[filename] = (st.st_mtime_ns, st.st_size, template_data)
+        self.titles.setdefault(_title_of(template_data), set()).add(filename)
+
+    def _untitle(self, filename):
+        title = _title_of(self.entries[filename][2])
+        filenames = self.titles.get(title)
+        if filenames is not None:
+            filenames.discard(filename)
+            if not filenames:
+                del self.titles[title]
+
+    def _drop(self, filename):
+        if filename not in self.entries:
+            return False
+        self._untitle(filename)
+        del self.entries[filename]
+        index = bisect.bisect_left(self.filenames, filename)
+        del self.filenames[index]
+        return True
+
+    def _trust_own_write(self):
+        # The write was ours: adopt the new directory mtime without rescanning.
+        # Concurrent external writes show up on the next periodic sweep.
+        if self.last_sweep:
+            self.dir_mtime = self._dir_mtime()
+
+    def put(self, filename, template_data):
+        """Registers a template just written by this process without rescanning."""
+        path = os.path.join(self.directory, filename)
+        template_data = dict(template_data, filename=filename, name=os.path.basename(filename))
+        self._store(filename, os.stat(path), template_data)
+        self._changed()
+        self._trust_own_write()
+
+    def remove(self, filename):
+        if self._drop(filename):
+            self._changed()
+        self._trust_own_write()
+
+    def templates(self):
+        if self._templates is None:
+            self._templates = [self.entries[f][2] for f in self.filenames]
+        return self._templates
+
+_cache_lock = threading.RLock()
+_dir_caches = {}
+# Distinguishes this process and each cache reset in library versions.
+_BOOT_ID = uuid.uuid4().hex[:8]
+_cache_generation = 0
+_split_cache = {'key': None, 'value': None}
+_duplicate_indexes = {}
+
+def _get_dir_cache(directory):
+    cache = _dir_caches.get(directory)
+    if cache is None:
+        cache = _dir_caches[directory] = _DirectoryCache(directory)
+    return cache
+
+def _get_duplicate_index(directory):
+    """Returns the near-duplicate index of `directory`, synced with its cache. Needs _cache_lock."""
+    cache = _get_dir_cache(directory)
+    cache.refresh()
+    index = _duplicate_indexes.get(directory)
+    if index is None:
+        index = _duplicate_indexes[directory] = NearDuplicateIndex()
+    version = (id(cache), cache.version)
+    if index.version != version:
+        index.sync({f: cache.entries[f][2] for f in cache.filenames}, version)
+    return index
+
+def _track_own_write(directory, cache, previous_version, filename):
+    # Applies our own write to an index that was in sync, instead of a full sync later.
+    index = _duplicate_indexes.get(directory)
+    if index is None or index.version != previous_version:
+        return
+    if filename in cache.entries:
+        index.add(filename, cache.entries[filename][2])
+    else:
+        index.remove(filename)
+    index.version = (id(cache), cache.version)
+
+def invalidate_template_cache():
+    """Drops every cached template, forcing the next read to hit the disk."""
+    global _cache_generation
+    with _cache_lock:
+        _cache_generation += 1
+        _dir_caches.clear()
+        _duplicate_indexes.clear()
+        _split_cache['key'] = None
+        _split_cache['value'] = None
+
+def _copy_template(template_data):
+    """Copy of a cached template; values are strings, so only nested containers need their own copy."""
+    return {key: copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+            for key, value in template_data.items()}
+
+@metrics.timed('template_manager.get_templates_view')
+def get_templates_view():
+    """
+    The cached library split into 'human_adm', 'human' and 'ai', without
+    copies: the lists and templates are shared with the cache and with every
+    other caller, so they must not be modified. For hot paths that only read;
+    get_all_templates() returns copies that callers may change.
+    """
+    with _cache_lock:
+        human_cache = _get_dir_cache(HUMAN_TEMPLATES_DIR)
+        ai_cache = _get_dir_cache(AI_TEMPLATES_DIR)
+        human_cache.refresh()
+        ai_cache.refresh()
+
+        key = (id(human_cache), human_cache.version, id(ai_cache), ai_cache.version)
+        if _split_cache['key'] != key:
+            all_human_templates = human_cache.templates()
+            _split_cache['value'] = {
+                'human_adm': all_human_templates[:NUM_ADM_TEMPLATES],
+                'human': all_human_templates[NUM_ADM_TEMPLATES:],
+                'ai': ai_cache.templates()
+            }
+            _split_cache['key'] = key
+        return _split_cache['value']
+
+@metrics.timed('template_manager.get_all_templates')
 def get_all_templates():
     """
     Retrieves all templates, categorized into 'human_adm', 'human', and 'ai'.
     The first 10 templates from the human directory are considered 'human_adm'.
+    Templates are served from an in-process cache (see _DirectoryCache).
+    """
+    # Fresh lists of fresh dicts: callers may mutate what they get without touching the cache.
+    return {category: [_copy_template(t) for t in templates]
+            for category, templates in get_templates_view().items()}
+
+def get_library_version():
+    """
+    Returns an opaque string that changes whenever a template changes, as seen
+    by this process (other processes' writes are picked up by the cache
+    sweep). Usage data has its own version, get_usage_version().
     """
-    all_human_templates = _get_templates_from_dir(HUMAN_TEMPLATES_DIR)
-    ai_templates = _get_templates_from_dir(AI_TEMPLATES_DIR)
+    with _cache_lock:
+        human_cache = _get_dir_cache(HUMAN_TEMPLATES_DIR)
+        ai_cache = _get_dir_cache(AI_TEMPLATES_DIR)
+        human_cache.refresh()
+        ai_cache.refresh()
+        return (f"{_BOOT_ID}-{_cache_generation}-{id(human_cache):x}.{human_cache.version}"
+                f"-{id(ai_cache):x}.{ai_cache.version}")
 
-    human_adm_templates = all_human_templates[:NUM_ADM_TEMPLATES]
-    human_templates = all_human_templates[NUM_ADM_TEMPLATES:]
+def get_usage_version():
+    """
+    Returns an opaque string that changes whenever the usage data changes, in
+    this process or on disk (the usage files' mtimes and sizes).
+    """
+    recorder = _get_usage_recorder()
+    return f"{_BOOT_ID}-{id(recorder):x}.{recorder.version}-{recorder.disk_stamp()}"
+
+def _encode_ulid(value):
+    chars = []
+    for _ in range(26):
+        chars.append(_ULID_ALPHABET[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+def _decode_ulid(ulid):
+    value = 0
+    for char in ulid:
+        value = (value << 5) | _ULID_ALPHABET.index(char)
+    return value
+
+def new_ulid(timestamp_ms=None):
+    """
+    Returns a new ULID: 48 bits of milliseconds and 80 random bits in 26
+    Crockford base32 characters. IDs made by this process sort in creation
+    order, even within the same millisecond. With `timestamp_ms`, the ULID
+    carries that time instead of now (e.g. when naming an existing file).
+    """
+    if timestamp_ms is not None:
+        return _encode_ulid((timestamp_ms << 80) | int.from_bytes(os.urandom(10), 'big'))
+    with _ulid_lock:
+        ms = time.time_ns() // 1_000_000
+        if ms <= _last_ulid[0]:
+            ms, randomness = _last_ulid[0], (_last_ulid[1] + 1) & ((1 << 80) - 1)
+        else:
+            randomness = int.from_bytes(os.urandom(10), 'big')
+        _last_ulid[:] = [ms, randomness]
+    return _encode_ulid((ms << 80) | randomness)
 
-    return {
-        'human_adm': human_adm_templates,
-        'human': human_templates,
-        'ai': ai_templates
-    }
+def is_ulid_filename(filename):
+    return bool(_ULID_FILENAME.match(filename))
+
+def _new_filename(title):
+    if FILENAME_SCHEME == 'ulid':
+        return f"{new_ulid()}.json"
+    if FILENAME_SCHEME != 'title':
+        raise ValueError(f"Unknown TEMPLATE_FILENAME_SCHEME '{FILENAME_SCHEME}'. Use 'title' or 'ulid'.")
+    return sanitize_filename(title)
 
 def sanitize_filename(name):
     """Sanitizes a string to be used as a valid filename."""
@@ -140,24 +454,66 @@ def sanitize_filename(name):
     name = re.sub(r'ç', 'c', name, flags=re.IGNORECASE)
     return f"{name[:50]}.json"
 
+def _directory_lock(directory):
+    """Cross-process lock serializing check-then-write sequences on `directory`."""
+    # Kept next to the directory so listings of the templates stay clean.
+    return file_lock(os.path.normpath(directory) + '.lock')
+
+def _write_new_file(directory, base_filename, template_data):
+    """
+    Writes `template_data` under the first free name derived from
+    `base_filename` and returns that name. The content goes to a temp file
+    first and is hard-linked into place, which fails if the name is taken, so
+    concurrent writers (threads or processes) never overwrite each other and
+    readers never see a half-written template. On filesystems without hard
+    links the name is reserved with O_EXCL and the temp file renamed over it.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.part')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(template_data, f, ensure_ascii=False, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file as 0600; templates are shared like any other file.
+        os.chmod(tmp_path, 0o644)
+
+        name, ext = os.path.splitext(base_filename)
+        filename = base_filename
+        counter = 1
+        while True:
+            filepath = os.path.join(directory, filename)
+            try:
+                try:
+                    os.link(tmp_path, filepath)
+                except FileExistsError:
+                    raise
+                except OSError:
+                    os.close(os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+                    os.replace(tmp_path, filepath)
+                return filename
+            except FileExistsError:
+                filename = f"{name}_{counter}{ext}"
+                counter += 1
+    finally:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+@metrics.timed('template_manager.save_template')
 def _save_template(directory, template_data, is_ai=False):
     """Saves a single template to the specified directory."""
     os.makedirs(directory, exist_ok=True)
     
     title = template_data.get('title') or template_data.get('name', 'sem_titulo')
-    base_filename = sanitize_filename(title)
-    filename = base_filename
-    filepath = os.path.join(directory, filename)
-    
-    counter = 1
-    while os.path.exists(filepath):
-        name, ext = os.path.splitext(base_filename)
-        filename = f"{name}_{counter}{ext}"
-        filepath = os.path.join(directory, filename)
-        counter += 1
+    filename = _write_new_file(directory, _new_filename(title), template_data)
 
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(template_data, f, ensure_ascii=False, indent=4)
+    with _cache_lock:
+        if directory in _dir_caches:
+            cache = _dir_caches[directory]
+            previous_version = (id(cache), cache.version)
+            cache.put(filename, template_data)
+            _track_own_write(directory, cache, previous_version, filename)
         
     return filename
 
@@ -165,10 +521,34 @@ def save_human_template(template_data):
     """Saves a human-created template."""
     return _save_template(HUMAN_TEMPLATES_DIR, template_data)
 
+@metrics.timed('template_manager.save_or_match_ai_template')
+def save_or_match_ai_template(template_data):
+    """
+    Saves an AI-generated template unless its body is a near-duplicate of one
+    already in the library. Returns (filename, created); when created is False,
+    filename is the existing template's.
+    """
+    # The directory lock keeps another worker process from saving the same
+    # template between our duplicate check and our write. It is taken before
+    # _cache_lock, which only guards the in-memory lookup and update, so readers
+    # never wait on another process or on the fsync of the new file.
+    with _directory_lock(AI_TEMPLATES_DIR):
+        with _cache_lock:
+            match = _get_duplicate_index(AI_TEMPLATES_DIR).find(template_data.get('body'))
+        if match:
+            return match[0], False
+        return _save_template(AI_TEMPLATES_DIR, template_data, is_ai=True), True
+
+def prepare_duplicate_index():
+    """Builds the near-duplicate index of the AI templates ahead of the first save."""
+    with _cache_lock:
+        _get_duplicate_index(AI_TEMPLATES_DIR)
+
 def save_ai_template(template_data):
-    """Saves an AI-generated template."""
-    return _save_template(AI_TEMPLATES_DIR, template_data, is_ai=True)
+    """Saves an AI-generated template, or returns the filename of an existing near-duplicate."""
+    return save_or_match_ai_template(template_data)[0]
 
+@metrics.timed('template_manager.delete_template')
 def delete_template(template_type, template_name):
     """
     Deletes a template file and its associated usage data.
@@ -186,14 +566,86 @@ def delete_template(template_type, template_name):
 
     filepath = os.path.join(directory, template_name)
 
-    if not os.path.exists(filepath):
-        raise FileNotFoundError(f"Template '{template_name}' not found.")
+    try:
+        os.remove(filepath)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Template '{template_name}' not found.") from None
 
-    os.remove(filepath)
+    with _cache_lock:
+        if directory in _dir_caches:
+            cache = _dir_caches[directory]
+            previous_version = (id(cache), cache.version)
+            cache.remove(template_name)
+            _track_own_write(directory, cache, previous_version, template_name)
+
+    _get_usage_recorder().forget(template_name)
+
+    return True
+
+@metrics.timed('template_manager.dedupe_ai_templates')
+def dedupe_ai_templates(directory=None, dry_run=False):
+    """
+    One-time pass that removes near-duplicate AI templates from `directory`.
+
+    In each group of near-duplicates the most used template is kept, and the
+    usage counts and analyses of the removed ones are merged into it. Returns
+    a list of (removed, kept) filenames.
+    """
+    directory = directory or AI_TEMPLATES_DIR
+    with _directory_lock(directory):
+        usage_counts = get_usage_counts()
+        duplicates = find_duplicates(_get_templates_from_dir(directory), usage_counts)
+
+        if dry_run or not duplicates:
+            return duplicates
+
+        for filename, _ in duplicates:
+            os.remove(os.path.join(directory, filename))
+
+    recorder = _get_usage_recorder()
+    for filename, kept in duplicates:
+        recorder.merge(filename, kept)
+    recorder.flush()
+    invalidate_template_cache()
+    return duplicates
+
+@metrics.timed('template_manager.migrate_filenames')
+def migrate_filenames(dry_run=False):
+    """
+    Renames every template whose filename is not a ULID to '<ulid>.json' and
+    moves its usage data to the new name. Each ULID carries the file's mtime,
+    so the IDs tell when the templates were written, not when they were
+    migrated. Files are renamed in their current sort order, and a file older
+    than the one before it gets the next ID after that one's, so the order of
+    the library (and which templates count as 'human_adm') does not change.
+    Returns a list of (old, new) filenames per template, in the order they
+    were renamed. Safe to re-run.
+    """
+    renames = []
+    for directory in (HUMAN_TEMPLATES_DIR, AI_TEMPLATES_DIR):
+        if not os.path.isdir(directory):
+            continue
+        with _directory_lock(directory):
+            previous = None
+            for filename in sorted(os.listdir(directory)):
+                if not filename.endswith('.json') or filename.startswith('.') or is_ulid_filename(filename):
+                    continue
+                mtime_ms = os.stat(os.path.join(directory, filename)).st_mtime_ns // 1_000_000
+                ulid = new_ulid(mtime_ms)
+                if previous is not None and ulid <= previous:
+                    ulid = _encode_ulid(_decode_ulid(previous) + 1)
+                previous = ulid
+                new_filename = f"{ulid}.json"
+                if not dry_run:
+                    os.rename(os.path.join(directory, filename), os.path.join(directory, new_filename))
+                renames.append((filename, new_filename))
 
-    data = _load_usage_data()
-    if template_name in data:
-        del data[template_name]
-        _save_usage_data(data)
+    if dry_run or not renames:
+        return renames
 
-    return True
\ No newline at end of file
+    recorder = _get_usage_recorder()
+    for filename, new_filename in renames:
+        recorder.merge(filename, new_filename)
+    recorder.flush()
+    invalidate_template_cache()
+    return renames
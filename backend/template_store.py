@@ -0,0 +1,773 @@
+"""Storage backends for the template library.
+
+`TemplateStore` is the interface used by the engine and the API. Two
+implementations are provided:
+
+- `FileSystemTemplateStore`: the original layout (one JSON file per template
+  plus `template_usage.json`), implemented by `backend.template_manager`.
+- `SQLiteTemplateStore`: a single SQLite database with indexed templates and
+  separate usage/analysis tables, for large libraries.
+
+Select the backend with `TEMPLATE_STORE=filesystem|sqlite` (and
+`TEMPLATE_DB_PATH` for SQLite). Migrate an existing library with:
+
+    python -m backend.template_store migrate --db templates.db
+
+AI templates whose body is a near-duplicate of an existing one are not saved
+again (see `backend.near_duplicates`). Clean up an existing library with:
+
+    python -m backend.template_store dedupe [--dry-run]
+
+With `TEMPLATE_FILENAME_SCHEME=ulid` new templates get time-sortable unique
+ids as filenames instead of their sanitized titles. Rename the files of an
+existing filesystem library (usage data included) with:
+
+    python -m backend.template_store rename-files [--dry-run]
+"""
+import argparse
+import base64
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime, timedelta
+
+from backend import template_manager, usage_recorder
+from backend.near_duplicates import NearDuplicateIndex, find_duplicates
+
+DEFAULT_DB_PATH = 'templates.db'
+TEMPLATE_CATEGORIES = ('human_adm', 'human', 'ai')
+_BOOT_ID = uuid.uuid4().hex[:8]
+
+
+def _encode_cursor(category: str, filename: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([category, filename]).encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        category, filename = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Cursor inválido: {cursor!r}") from e
+    if category not in TEMPLATE_CATEGORIES or not isinstance(filename, str):
+        raise ValueError(f"Cursor inválido: {cursor!r}")
+    return category, filename
+
+
+def _template_title(template: dict) -> str:
+    return template.get('title') or template.get('name') or template.get('filename', '')
+
+
+def _filename_key(template: dict) -> str:
+    return template['filename']
+
+
+class TemplateStore(ABC):
+    @abstractmethod
+    def get_all_templates(self) -> dict:
+        """Retorna os templates agrupados em 'human_adm', 'human' e 'ai'; cópias que quem chama pode alterar."""
+
+    def templates_view(self) -> dict:
+        """
+        Os mesmos grupos de `get_all_templates`, sem cópias, para quem só lê:
+        listas e templates são compartilhados e não podem ser alterados.
+        """
+        return self.get_all_templates()
+
+    @abstractmethod
+    def get_template_report(self, filename: str) -> dict:
+        """Retorna uso, análises e corpo de um template."""
+
+    @abstractmethod
+    def save_human_template(self, template_data: dict) -> str:
+        """Salva um template humano e retorna o nome gerado."""
+
+    @abstractmethod
+    def save_ai_template(self, template_data: dict) -> str:
+        """
+        Salva um template gerado pela IA e retorna o nome gerado. Se o corpo for
+        quase igual ao de um template de IA existente, nada é salvo e o nome
+        retornado é o do existente.
+        """
+
+    @abstractmethod
+    def delete_template(self, template_type: str, template_name: str) -> bool:
+        """Remove um template e seus dados de uso. Levanta FileNotFoundError se não existir."""
+
+    @abstractmethod
+    def increment_template_usage(self, filename: str) -> None:
+        """Incrementa o contador de uso de um template."""
+
+    @abstractmethod
+    def save_ai_analysis(self, filename: str, analysis_text: str) -> None:
+        """Anexa uma análise da IA aos dados de uso de um template."""
+
+    @abstractmethod
+    def dedupe_ai_templates(self, dry_run: bool = False) -> list:
+        """Remove templates de IA quase duplicados, somando o uso ao que fica. Retorna pares (removido, mantido)."""
+
+    @abstractmethod
+    def get_usage_counts(self) -> dict:
+        """Retorna o contador de uso de cada template, por nome de arquivo."""
+
+    @abstractmethod
+    def top_templates(self, n: int = 10, since: datetime | None = None, until: datetime | None = None) -> list:
+        """
+        Os `n` templates mais usados entre `since` e `until` (padrão: últimos 7
+        dias), como [{'filename', 'count'}]. Lê só os agregados por hora e por dia.
+        """
+
+    @abstractmethod
+    def usage_trend(self, filename: str | None = None, days: int = 30) -> list:
+        """Usos por dia nos últimos `days` dias, do mais antigo ao mais recente: [(dia, usos)]."""
+
+    @abstractmethod
+    def library_version(self) -> str:
+        """Texto opaco que muda sempre que um template muda (não muda com o uso)."""
+
+    @abstractmethod
+    def usage_version(self) -> str:
+        """Texto opaco que muda sempre que os dados de uso mudam."""
+
+    def get_template(self, template_type: str, filename: str) -> dict | None:
+        """Retorna um template completo pelo tipo ('human_adm', 'human' ou 'ai') e nome do arquivo."""
+        if template_type not in TEMPLATE_CATEGORIES:
+            raise ValueError("Invalid template type specified.")
+        all_templates = self.templates_view()
+        # 'human_adm' e 'human' vêm do mesmo diretório; a divisão é só pela posição.
+        categories = ('human_adm', 'human') if template_type != 'ai' else ('ai',)
+        for category in categories:
+            templates = all_templates.get(category, [])
+            index = bisect.bisect_left(templates, filename, key=_filename_key)
+            if index < len(templates) and templates[index]['filename'] == filename:
+                return template_manager._copy_template(templates[index])
+        return None
+
+    def list_templates(self, template_type: str | None = None, title_prefix: str | None = None,
+                       limit: int | None = None, cursor: str | None = None, summary: bool = False) -> dict:
+        """
+        Uma página de templates, em ordem de categoria ('human_adm', 'human',
+        'ai') e de nome de arquivo, opcionalmente filtrada por tipo e pelo
+        início do título. Retorna {'items', 'next_cursor', 'total'}; cada item
+        traz seu 'type'. No modo resumo, os itens têm só título, assunto, nome
+        do arquivo e contagem de uso. Levanta ValueError para tipo ou cursor inválido.
+        """
+        if template_type is not None and template_type not in TEMPLATE_CATEGORIES:
+            raise ValueError("Invalid template type specified.")
+        categories = [template_type] if template_type else list(TEMPLATE_CATEGORIES)
+        after = _decode_cursor(cursor) if cursor else None
+        if after and after[0] not in categories:
+            raise ValueError(f"Cursor inválido para o tipo '{template_type}'.")
+
+        # Só os itens da página são copiados; o resto é lido da vista compartilhada.
+        all_templates = self.templates_view()
+        prefix = (title_prefix or '').casefold()
+        total = 0
+        remaining = []
+        for position, category in enumerate(categories):
+            templates = all_templates.get(category, [])
+            if prefix:
+                templates = [t for t in templates if _template_title(t).casefold().startswith(prefix)]
+            total += len(templates)
+            if after and position < categories.index(after[0]):
+                continue
+            start = bisect.bisect_right(templates, after[1], key=_filename_key) if after and category == after[0] else 0
+            remaining.extend((category, t) for t in templates[start:])
+
+        page = remaining if limit is None else remaining[:limit]
+        next_cursor = _encode_cursor(page[-1][0], page[-1][1]['filename']) if len(page) < len(remaining) else None
+
+        if summary:
+            usage = self.get_usage_counts()
+            items = [{
+                'type': category,
+                'filename': t['filename'],
+                'name': t.get('name', t['filename']),
+                'title': _template_title(t),
+                'subject': t.get('subject'),
+                'usage_count': usage.get(t['filename'], 0),
+            } for category, t in page]
+        else:
+            items = [dict(template_manager._copy_template(t), type=category) for category, t in page]
+        return {'items': items, 'next_cursor': next_cursor, 'total': total}
+
+    def flush(self) -> None:
+        """Persiste qualquer escrita ainda em buffer."""
+
+    def prepare(self) -> None:
+        """Monta de antemão as estruturas usadas na primeira escrita (ex.: índice de duplicados)."""
+
+    def add_listener(self, listener) -> None:
+        """
+        Registra `listener(event, template_type, filename, template_data)`, chamado
+        depois de cada inclusão ('saved') ou remoção ('deleted', sem dados) feita
+        por este store. `template_type` é 'human' ou 'ai'.
+        """
+        self.__dict__.setdefault('_listeners', []).append(listener)
+
+    def _notify(self, event: str, template_type: str, filename: str, template_data: dict | None = None) -> None:
+        stored_type = 'ai' if template_type == 'ai' else 'human'
+        for listener in self.__dict__.get('_listeners', ()):
+            listener(event, stored_type, filename, template_data)
+
+
+class FileSystemTemplateStore(TemplateStore):
+    """One JSON file per template; delegates to `backend.template_manager`."""
+
+    def get_all_templates(self) -> dict:
+        return template_manager.get_all_templates()
+
+    def templates_view(self) -> dict:
+        return template_manager.get_templates_view()
+
+    def get_template_report(self, filename: str) -> dict:
+        return template_manager.get_template_report(filename)
+
+    def save_human_template(self, template_data: dict) -> str:
+        filename = template_manager.save_human_template(template_data)
+        self._notify('saved', 'human', filename, template_data)
+        return filename
+
+    def save_ai_template(self, template_data: dict) -> str:
+        filename, created = template_manager.save_or_match_ai_template(template_data)
+        if created:
+            self._notify('saved', 'ai', filename, template_data)
+        return filename
+
+    def delete_template(self, template_type: str, template_name: str) -> bool:
+        deleted = template_manager.delete_template(template_type, template_name)
+        self._notify('deleted', template_type, template_name)
+        return deleted
+
+    def increment_template_usage(self, filename: str) -> None:
+        template_manager.increment_template_usage(filename)
+
+    def save_ai_analysis(self, filename: str, analysis_text: str) -> None:
+        template_manager.save_ai_analysis(filename, analysis_text)
+
+    def dedupe_ai_templates(self, dry_run: bool = False) -> list:
+        duplicates = template_manager.dedupe_ai_templates(dry_run=dry_run)
+        if not dry_run:
+            for filename, _ in duplicates:
+                self._notify('deleted', 'ai', filename)
+        return duplicates
+
+    def get_usage_counts(self) -> dict:
+        return template_manager.get_usage_counts()
+
+    def top_templates(self, n: int = 10, since: datetime | None = None, until: datetime | None = None) -> list:
+        return template_manager.get_top_templates(n, since, until)
+
+    def usage_trend(self, filename: str | None = None, days: int = 30) -> list:
+        return template_manager.get_usage_trend(filename, days)
+
+    def library_version(self) -> str:
+        return template_manager.get_library_version()
+
+    def usage_version(self) -> str:
+        return template_manager.get_usage_version()
+
+    def flush(self) -> None:
+        template_manager.flush_usage_data()
+
+    def prepare(self) -> None:
+        template_manager.prepare_duplicate_index()
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    type TEXT NOT NULL CHECK (type IN ('human', 'ai')),
+    filename TEXT NOT NULL,
+    title TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (type, filename)
+);
+CREATE INDEX IF NOT EXISTS idx_templates_filename ON templates (filename);
+CREATE INDEX IF NOT EXISTS idx_templates_title ON templates (title);
+
+CREATE TABLE IF NOT EXISTS template_usage (
+    filename TEXT PRIMARY KEY,
+    usage_count INTEGER NOT NULL DEFAULT 0,
+    last_used TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_usage_last_used ON template_usage (last_used);
+
+CREATE TABLE IF NOT EXISTS template_analysis (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL,
+    analysis TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_filename ON template_analysis (filename);
+
+CREATE TABLE IF NOT EXISTS usage_rollups (
+    granularity TEXT NOT NULL CHECK (granularity IN ('hourly', 'daily')),
+    bucket TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (granularity, bucket, filename)
+);
+CREATE INDEX IF NOT EXISTS idx_rollups_filename ON usage_rollups (filename);
+
+-- Change counters: 'templates' moves with every template write, 'usage' with every usage write.
+CREATE TABLE IF NOT EXISTS library_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO library_versions (name, version) VALUES ('templates', 0), ('usage', 0);
+"""
+
+
+class SQLiteTemplateStore(TemplateStore):
+    """
+    Template library kept in a SQLite database.
+
+    A single connection guarded by a lock is shared by all threads. The parsed
+    library is cached in memory and reloaded only when the 'templates' counter
+    in `library_versions` moves, so usage writes from any process leave it alone.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self._cache_key = None
+        # type -> (sorted filenames, templates in the same order)
+        self._cache = None
+        self._view_key = None
+        self._view = None
+        self._duplicates = NearDuplicateIndex()
+        # Hour of the last rollup write; expired rollups are pruned when it changes.
+        self._rollup_hour = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def prepare(self) -> None:
+        with self._lock:
+            self._duplicate_index()
+
+    # --- helpers ---
+
+    def _version(self, name):
+        return self._conn.execute('SELECT version FROM library_versions WHERE name = ?', (name,)).fetchone()[0]
+
+    def _bump(self, name):
+        self._conn.execute('UPDATE library_versions SET version = version + 1 WHERE name = ?', (name,))
+
+    def _wrote(self, template_type=None, filename=None, template_data=None):
+        """
+        Records a local write. When the cache was current, the change is applied
+        to it in place (template_data=None means removal) instead of reloading.
+        """
+        previous_key = self._cache_key
+        in_sync = self._cache is not None and previous_key == self._version('templates')
+        self._bump('templates')
+        if not in_sync or template_type is None:
+            return
+        filenames, templates = self._cache[template_type]
+        index = bisect.bisect_left(filenames, filename)
+        exists = index < len(filenames) and filenames[index] == filename
+        if template_data is None:
+            if exists:
+                del filenames[index]
+                del templates[index]
+        else:
+            template = dict(template_data, filename=filename, name=os.path.basename(filename))
+            if exists:
+                templates[index] = template
+            else:
+                filenames.insert(index, filename)
+                templates.insert(index, template)
+        self._cache_key = self._version('templates')
+
+        if template_type == 'ai' and self._duplicates.version == previous_key:
+            if template_data is None:
+                self._duplicates.remove(filename)
+            else:
+                self._duplicates.add(filename, templates[bisect.bisect_left(filenames, filename)])
+            self._duplicates.version = self._cache_key
+
+    @staticmethod
+    def _row_to_template(filename, data):
+        template_data = json.loads(data)
+        template_data['filename'] = filename
+        template_data['name'] = os.path.basename(filename)
+        return template_data
+
+    def _next_suffix(self, template_type, name, ext):
+        """0 if `name + ext` is free, else one past the highest `name_<n>` suffix, in a single query."""
+        pattern = ''.join(f'[{c}]' if c in '*?[' else c for c in name) + '*' + ext
+        taken = False
+        highest = 0
+        for (filename,) in self._conn.execute(
+                'SELECT filename FROM templates WHERE type = ? AND filename GLOB ?', (template_type, pattern)):
+            suffix = filename[len(name):len(filename) - len(ext)]
+            if not suffix:
+                taken = True
+            elif suffix[0] == '_' and suffix[1:].isdigit():
+                highest = max(highest, int(suffix[1:]))
+        return highest + 1 if taken else 0
+
+    def _candidate_filenames(self, template_type, title):
+        """Names for a new template: the base name if free, else the suffixes after the highest one taken."""
+        if template_manager.FILENAME_SCHEME == 'ulid':
+            while True:
+                yield f"{template_manager.new_ulid()}.json"
+        base_filename = template_manager.sanitize_filename(title)
+        name, ext = os.path.splitext(base_filename)
+        counter = self._next_suffix(template_type, name, ext)
+        if counter == 0:
+            yield base_filename
+            counter = 1
+        while True:
+            yield f"{name}_{counter}{ext}"
+            counter += 1
+
+    def _insert(self, template_type, filename, title, template_data, replace=False):
+        stored = {k: v for k, v in template_data.items() if k != 'filename'}
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT'
+        self._conn.execute(
+            f'{verb} INTO templates (type, filename, title, data) VALUES (?, ?, ?, ?)',
+            (template_type, filename, title, json.dumps(stored, ensure_ascii=False)))
+
+    def _duplicate_index(self):
+        self.templates_view()
+        if self._duplicates.version != self._cache_key:
+            filenames, templates = self._cache['ai']
+            self._duplicates.sync(dict(zip(filenames, templates)), self._cache_key)
+        return self._duplicates
+
+    def _save(self, template_type, template_data):
+        title = template_data.get('title') or template_data.get('name', 'sem_titulo')
+        with self._lock, self._conn:
+            for filename in self._candidate_filenames(template_type, title):
+                try:
+                    self._insert(template_type, filename, title, template_data)
+                    break
+                except sqlite3.IntegrityError:
+                    # Another connection took the name after our probe; never overwrite it.
+                    continue
+            self._wrote(template_type, filename, template_data)
+        self._notify('saved', template_type, filename, template_data)
+        return filename
+
+    # --- TemplateStore ---
+
+    def templates_view(self) -> dict:
+        with self._lock:
+            key = self._version('templates')
+            if self._cache_key != key:
+                self._cache = {}
+                for template_type in ('human', 'ai'):
+                    rows = self._conn.execute(
+                        'SELECT filename, data FROM templates WHERE type = ? ORDER BY filename',
+                        (template_type,)).fetchall()
+                    self._cache[template_type] = ([f for f, _ in rows],
+                                                  [self._row_to_template(f, d) for f, d in rows])
+                self._cache_key = key
+
+            # `_wrote` edits the cached lists in place, so the view gets its own lists.
+            if self._view_key != self._cache_key:
+                human = self._cache['human'][1]
+                self._view = {
+                    'human_adm': human[:template_manager.NUM_ADM_TEMPLATES],
+                    'human': human[template_manager.NUM_ADM_TEMPLATES:],
+                    'ai': list(self._cache['ai'][1])
+                }
+                self._view_key = self._cache_key
+            return self._view
+
+    def get_all_templates(self) -> dict:
+        return {category: [template_manager._copy_template(t) for t in templates]
+                for category, templates in self.templates_view().items()}
+
+    def get_template_report(self, filename: str) -> dict:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM templates WHERE filename = ? ORDER BY type = 'ai' LIMIT 1",
+                (filename,)).fetchone()
+            usage = self._conn.execute(
+                'SELECT usage_count, last_used FROM template_usage WHERE filename = ?',
+                (filename,)).fetchone()
+            analyses = [a for (a,) in self._conn.execute(
+                'SELECT analysis FROM template_analysis WHERE filename = ? ORDER BY id', (filename,))]
+
+        if row:
+            content = json.loads(row[0]).get('body', 'Conteúdo não disponível.')
+        else:
+            content = 'Arquivo do template não encontrado.'
+
+        return {
+            'filename': filename,
+            'usage_count': usage[0] if usage else 0,
+            'last_used': (usage[1] if usage else None) or 'Nunca',
+            'ai_analysis': analyses,
+            'content': content
+        }
+
+    def save_human_template(self, template_data: dict) -> str:
+        return self._save('human', template_data)
+
+    def save_ai_template(self, template_data: dict) -> str:
+        with self._lock:
+            match = self._duplicate_index().find(template_data.get('body'))
+            if match:
+                return match[0]
+            return self._save('ai', template_data)
+
+    def delete_template(self, template_type: str, template_name: str) -> bool:
+        if template_type in ('human_adm', 'human'):
+            stored_type = 'human'
+        elif template_type == 'ai':
+            stored_type = 'ai'
+        else:
+            raise ValueError("Invalid template type specified.")
+
+        with self._lock, self._conn:
+            cursor = self._conn.execute('DELETE FROM templates WHERE type = ? AND filename = ?',
+                                        (stored_type, template_name))
+            if cursor.rowcount == 0:
+                raise FileNotFoundError(f"Template '{template_name}' not found.")
+            self._conn.execute('DELETE FROM template_usage WHERE filename = ?', (template_name,))
+            self._conn.execute('DELETE FROM template_analysis WHERE filename = ?', (template_name,))
+            self._conn.execute('DELETE FROM usage_rollups WHERE filename = ?', (template_name,))
+            self._wrote(stored_type, template_name)
+            self._bump('usage')
+        self._notify('deleted', stored_type, template_name)
+        return True
+
+    def increment_template_usage(self, filename: str) -> None:
+        now = datetime.now()
+        hour = now.strftime('%Y-%m-%dT%H')
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO template_usage (filename, usage_count, last_used) VALUES (?, 1, ?) '
+                'ON CONFLICT (filename) DO UPDATE SET usage_count = usage_count + 1, '
+                'last_used = excluded.last_used',
+                (filename, now.isoformat()))
+            self._conn.executemany(
+                'INSERT INTO usage_rollups (granularity, bucket, filename, count) VALUES (?, ?, ?, 1) '
+                'ON CONFLICT (granularity, bucket, filename) DO UPDATE SET count = count + 1',
+                [('hourly', hour, filename), ('daily', now.strftime('%Y-%m-%d'), filename)])
+            if hour != self._rollup_hour:
+                self._prune_rollups(now)
+                self._rollup_hour = hour
+            self._bump('usage')
+
+    def _prune_rollups(self, now):
+        hourly_cutoff = usage_recorder.hourly_retention_start(now).strftime('%Y-%m-%dT%H')
+        daily_cutoff = (now - timedelta(days=usage_recorder.DAILY_RETENTION_DAYS - 1)).strftime('%Y-%m-%d')
+        self._conn.execute("DELETE FROM usage_rollups WHERE granularity = 'hourly' AND bucket < ?", (hourly_cutoff,))
+        self._conn.execute("DELETE FROM usage_rollups WHERE granularity = 'daily' AND bucket < ?", (daily_cutoff,))
+
+    def top_templates(self, n: int = 10, since: datetime | None = None, until: datetime | None = None) -> list:
+        until = until or datetime.now()
+        since = since or until - timedelta(days=7)
+        keys = usage_recorder.window_buckets(since, until, usage_recorder.hourly_retention_start())
+        totals = Counter()
+        with self._lock:
+            for granularity in ('hourly', 'daily'):
+                buckets = [key for g, key in keys if g == granularity]
+                if not buckets:
+                    continue
+                placeholders = ','.join('?' * len(buckets))
+                totals.update(dict(self._conn.execute(
+                    f'SELECT filename, SUM(count) FROM usage_rollups WHERE granularity = ? '
+                    f'AND bucket IN ({placeholders}) GROUP BY filename', (granularity, *buckets))))
+        ranked = sorted(totals.items(), key=lambda item: (-item[1], item[0]))[:n]
+        return [{'filename': filename, 'count': count} for filename, count in ranked]
+
+    def usage_trend(self, filename: str | None = None, days: int = 30) -> list:
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        keys = [(today - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days - 1, -1, -1)]
+        with self._lock:
+            if filename is None:
+                rows = self._conn.execute(
+                    "SELECT bucket, SUM(count) FROM usage_rollups WHERE granularity = 'daily' AND bucket >= ? "
+                    'GROUP BY bucket', (keys[0],))
+            else:
+                rows = self._conn.execute(
+                    "SELECT bucket, count FROM usage_rollups WHERE granularity = 'daily' AND bucket >= ? "
+                    'AND filename = ?', (keys[0], filename))
+            counts = dict(rows)
+        return [(key, counts.get(key, 0)) for key in keys]
+
+    def _cap_analyses(self, filename):
+        # Same limit as the filesystem store: only the newest MAX_ANALYSES are kept.
+        self._conn.execute(
+            'DELETE FROM template_analysis WHERE filename = ? AND id NOT IN '
+            '(SELECT id FROM template_analysis WHERE filename = ? ORDER BY id DESC LIMIT ?)',
+            (filename, filename, usage_recorder.MAX_ANALYSES))
+
+    def save_ai_analysis(self, filename: str, analysis_text: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute('INSERT INTO template_analysis (filename, analysis) VALUES (?, ?)',
+                               (filename, analysis_text))
+            self._cap_analyses(filename)
+            self._bump('usage')
+
+    def dedupe_ai_templates(self, dry_run: bool = False) -> list:
+        with self._lock:
+            templates = self.templates_view()['ai']
+            duplicates = find_duplicates(templates, self.get_usage_counts())
+            if dry_run or not duplicates:
+                return duplicates
+            with self._conn:
+                for filename, kept in duplicates:
+                    self._conn.execute("DELETE FROM templates WHERE type = 'ai' AND filename = ?", (filename,))
+                    self._conn.execute(
+                        'INSERT INTO template_usage (filename, usage_count, last_used) '
+                        'SELECT ?, usage_count, last_used FROM template_usage WHERE filename = ? '
+                        'ON CONFLICT (filename) DO UPDATE SET usage_count = usage_count + excluded.usage_count, '
+                        "last_used = CASE WHEN excluded.last_used > COALESCE(last_used, '') "
+                        'THEN excluded.last_used ELSE last_used END',
+                        (kept, filename))
+                    self._conn.execute('DELETE FROM template_usage WHERE filename = ?', (filename,))
+                    self._conn.execute('UPDATE template_analysis SET filename = ? WHERE filename = ?', (kept, filename))
+                    self._cap_analyses(kept)
+                    self._conn.execute(
+                        'INSERT INTO usage_rollups (granularity, bucket, filename, count) '
+                        'SELECT granularity, bucket, ?, count FROM usage_rollups WHERE filename = ? '
+                        'ON CONFLICT (granularity, bucket, filename) DO UPDATE SET count = count + excluded.count',
+                        (kept, filename))
+                    self._conn.execute('DELETE FROM usage_rollups WHERE filename = ?', (filename,))
+                self._wrote()
+                self._bump('usage')
+        for filename, _ in duplicates:
+            self._notify('deleted', 'ai', filename)
+        return duplicates
+
+    def get_usage_counts(self) -> dict:
+        with self._lock:
+            return dict(self._conn.execute('SELECT filename, usage_count FROM template_usage'))
+
+    def library_version(self) -> str:
+        # Os contadores ficam no banco, então o uso gravado por outros processos não muda esta versão.
+        with self._lock:
+            return f"{_BOOT_ID}-{id(self):x}-{self._version('templates')}"
+
+    def usage_version(self) -> str:
+        with self._lock:
+            return f"{_BOOT_ID}-{id(self):x}-{self._version('usage')}"
+
+
+def migrate_filesystem_to_sqlite(db_path: str = DEFAULT_DB_PATH,
+                                 human_dir: str | None = None,
+                                 ai_dir: str | None = None,
+                                 usage_file: str | None = None) -> dict:
+    """
+    Copies a filesystem template library into a SQLite store.
+
+    Existing rows with the same type/filename are replaced, so the migration
+    can be re-run safely. The hourly and daily usage rollups are copied too,
+    so top templates and trends keep their history. Returns the number of
+    migrated templates and usage records.
+    """
+    human_dir = human_dir or template_manager.HUMAN_TEMPLATES_DIR
+    ai_dir = ai_dir or template_manager.AI_TEMPLATES_DIR
+    usage_file = usage_file or template_manager.DATA_FILE
+
+    recorder = usage_recorder.UsageRecorder(usage_file, flush_interval=0)
+    usage_data = recorder.load_all()
+    rollups = recorder.rollups()
+
+    store = SQLiteTemplateStore(db_path)
+    counts = {'human': 0, 'ai': 0, 'usage': 0}
+    try:
+        with store._lock, store._conn:
+            for template_type, directory in (('human', human_dir), ('ai', ai_dir)):
+                for template_data in template_manager._get_templates_from_dir(directory):
+                    # 'filename' and 'name' are added by the loader, not stored in the file.
+                    filename = template_data.pop('filename')
+                    template_data.pop('name', None)
+                    title = template_data.get('title') or os.path.splitext(filename)[0]
+                    store._insert(template_type, filename, title, template_data, replace=True)
+                    counts[template_type] += 1
+
+            for filename, info in usage_data.items():
+                store._conn.execute(
+                    'INSERT OR REPLACE INTO template_usage (filename, usage_count, last_used) VALUES (?, ?, ?)',
+                    (filename, info.get('usage_count', 0), info.get('last_used')))
+                store._conn.execute('DELETE FROM template_analysis WHERE filename = ?', (filename,))
+                store._conn.executemany(
+                    'INSERT INTO template_analysis (filename, analysis) VALUES (?, ?)',
+                    [(filename, analysis) for analysis in info.get('ai_analysis', [])])
+                counts['usage'] += 1
+
+            store._conn.executemany(
+                'INSERT OR REPLACE INTO usage_rollups (granularity, bucket, filename, count) VALUES (?, ?, ?, ?)',
+                [(granularity, bucket, filename, count)
+                 for granularity in ('hourly', 'daily')
+                 for bucket, bucket_counts in rollups[granularity].items()
+                 for filename, count in bucket_counts.items()])
+            store._wrote()
+            store._bump('usage')
+    finally:
+        store.close()
+    return counts
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_template_store() -> TemplateStore:
+    """Returns the process-wide store selected by the TEMPLATE_STORE environment variable."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = os.getenv('TEMPLATE_STORE', 'filesystem').lower()
+            if backend == 'sqlite':
+                _store = SQLiteTemplateStore(os.getenv('TEMPLATE_DB_PATH', DEFAULT_DB_PATH))
+            elif backend == 'filesystem':
+                _store = FileSystemTemplateStore()
+            else:
+                raise ValueError(f"Unknown TEMPLATE_STORE '{backend}'. Use 'filesystem' or 'sqlite'.")
+        return _store
+
+
+def main():
+    p = argparse.ArgumentParser(description="Ferramentas do armazenamento de templates.")
+    sub = p.add_subparsers(dest='command', required=True)
+    migrate = sub.add_parser('migrate', help="Copia os templates em JSON para um banco SQLite")
+    migrate.add_argument('--db', default=os.getenv('TEMPLATE_DB_PATH', DEFAULT_DB_PATH))
+    migrate.add_argument('--human-dir', default=template_manager.HUMAN_TEMPLATES_DIR)
+    migrate.add_argument('--ai-dir', default=template_manager.AI_TEMPLATES_DIR)
+    migrate.add_argument('--usage-file', default=template_manager.DATA_FILE)
+    dedupe = sub.add_parser('dedupe', help="Remove templates de IA quase duplicados do armazenamento configurado")
+    dedupe.add_argument('--dry-run', action='store_true', help="Só lista os duplicados, sem remover nada")
+    rename = sub.add_parser('rename-files', help="Renomeia os arquivos de templates para ULIDs (biblioteca em JSON)")
+    rename.add_argument('--dry-run', action='store_true', help="Só lista os novos nomes, sem renomear")
+    args = p.parse_args()
+
+    if args.command == 'migrate':
+        counts = migrate_filesystem_to_sqlite(args.db, args.human_dir, args.ai_dir, args.usage_file)
+        print(f"Migrados {counts['human']} templates humanos, {counts['ai']} de IA "
+              f"e {counts['usage']} registros de uso para {args.db}")
+    elif args.command == 'dedupe':
+        duplicates = get_template_store().dedupe_ai_templates(dry_run=args.dry_run)
+        for removed, kept in duplicates:
+            print(f"{removed} -> {kept}")
+        action = 'encontrados' if args.dry_run else 'removidos'
+        print(f"{len(duplicates)} templates de IA duplicados {action}.")
+    elif args.command == 'rename-files':
+        renames = template_manager.migrate_filenames(dry_run=args.dry_run)
+        for old, new in renames:
+            print(f"{old} -> {new}")
+        action = 'a renomear' if args.dry_run else 'renomeados'
+        print(f"{len(renames)} templates {action}.")
+
+
+if __name__ == '__main__':
+    main()
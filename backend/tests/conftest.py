@@ -0,0 +1,23 @@
+import json
+
+import pytest
+
+from backend import template_manager
+
+
+@pytest.fixture
+def template_dirs(tmp_path, monkeypatch):
+    """Aponta o template_manager para diretórios temporários com dois templates humanos."""
+    human_dir = tmp_path / 'human_templates'
+    ai_dir = tmp_path / 'ai_templates'
+    human_dir.mkdir()
+    ai_dir.mkdir()
+
+    for i, title in enumerate(['Otimizacao de Trafego', 'Auditoria Visual'], start=1):
+        with open(human_dir / f'0{i}_{title.replace(" ", "_")}.json', 'w', encoding='utf-8') as f:
+            json.dump({'title': title, 'subject': f'Assunto {i}', 'body': f'Corpo do template {title}.'}, f)
+
+    monkeypatch.setattr(template_manager, 'HUMAN_TEMPLATES_DIR', str(human_dir))
+    monkeypatch.setattr(template_manager, 'AI_TEMPLATES_DIR', str(ai_dir))
+    monkeypatch.setattr(template_manager, 'DATA_FILE', str(tmp_path / 'template_usage.json'))
+    return tmp_path
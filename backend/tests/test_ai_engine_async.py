@@ -0,0 +1,73 @@
+import asyncio
+import json
+import os
+import time
+
+from backend.ai_engine import AIEngine
+from backend.gemini_client import AsyncMockGeminiClient, MockGeminiClient
+
+
+def test_generate_proposal_async_returns_proposal_and_report(template_dirs):
+    engine = AIEngine(MockGeminiClient(), AsyncMockGeminiClient())
+    result = asyncio.run(engine.generate_proposal_async('Nome do Cliente: Ana'))
+    assert result['proposal'].startswith('[Proposta Mock]')
+    assert result['report'].startswith('[Relatório Mock]')
+    assert len(os.listdir(template_dirs / 'ai_templates')) == 1
+
+
+def test_generate_proposal_async_runs_concurrently(template_dirs):
+    latency = 0.2
+    engine = AIEngine(MockGeminiClient(), AsyncMockGeminiClient(latency=latency))
+
+    async def run_many(n):
+        return await asyncio.gather(*(engine.generate_proposal_async(f'Cliente {i}') for i in range(n)))
+
+    start = time.perf_counter()
+    results = asyncio.run(run_many(20))
+    elapsed = time.perf_counter() - start
+
+    assert len(results) == 20
+    # Sequencialmente seriam 20 * 2 chamadas * 0.2s = 8s.
+    assert elapsed < 20 * 2 * latency / 4
+
+
+class JsonStreamingClient(AsyncMockGeminiClient):
+    """Responde ao prompt híbrido com JSON, em pedaços de 5 caracteres."""
+
+    async def generate_content_stream(self, prompt, media_files=None):
+        if 'relatório conciso' in prompt:
+            response = 'Relatório em streaming.'
+        else:
+            response = '```json\n' + json.dumps({'title': 'Híbrido', 'subject': 'Assunto',
+                                                 'body': 'Olá, "Ana"!\nVamos crescer 🚀', 'ideal_for': 'x'}) + '\n```'
+        for i in range(0, len(response), 5):
+            yield response[i:i + 5]
+
+
+def _collect(engine, context):
+    async def run():
+        return [event async for event in engine.stream_proposal(context)]
+    return asyncio.run(run())
+
+
+def test_stream_proposal_emits_body_tokens_then_report(template_dirs):
+    engine = AIEngine(MockGeminiClient(), JsonStreamingClient())
+    events = _collect(engine, 'Cliente Ana')
+
+    names = [name for name, _ in events]
+    assert names.index('template') > names.index('proposal')
+    assert names[-1] == 'done'
+    streamed_body = ''.join(data for name, data in events if name == 'proposal')
+    assert streamed_body == 'Olá, "Ana"!\nVamos crescer 🚀'
+    assert events[-1][1]['proposal'] == streamed_body
+    assert events[-1][1]['report'] == 'Relatório em streaming.'
+    assert dict(events)['template']['template_name'] == 'Hibrido.json'
+
+
+def test_stream_proposal_with_plain_text_response(template_dirs):
+    engine = AIEngine(MockGeminiClient(), AsyncMockGeminiClient(chunk_size=2))
+    events = _collect(engine, 'Cliente Ana')
+
+    proposal_chunks = [data for name, data in events if name == 'proposal']
+    assert len(proposal_chunks) > 1
+    assert ''.join(proposal_chunks) == events[-1][1]['proposal']
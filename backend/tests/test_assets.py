@@ -0,0 +1,91 @@
+import gzip
+import json
+
+import pytest
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+from backend import assets
+from backend.assets import PrecompressedStaticFiles, build, fingerprint
+
+
+@pytest.fixture
+def dist(tmp_path):
+    source = tmp_path / 'frontend'
+    source.mkdir()
+    (source / 'app.js').write_text('console.log("olá");\n' * 50, encoding='utf-8')
+    (source / 'style.css').write_text('body { color: red; }\n' * 50, encoding='utf-8')
+    (source / 'index.html').write_text(
+        '<link rel="stylesheet" href="style.css" />\n<script src="app.js"></script>\n', encoding='utf-8')
+    out = tmp_path / 'dist'
+    manifest = build(str(source), str(out))
+    return out, manifest
+
+
+def test_build_fingerprints_and_rewrites_index(dist):
+    out, manifest = dist
+    app_js = manifest['app.js']
+    assert app_js == fingerprint('app.js', ('console.log("olá");\n' * 50).encode('utf-8'))
+    assert json.loads((out / 'manifest.json').read_text()) == manifest
+    index = (out / 'index.html').read_text(encoding='utf-8')
+    assert f'src="{app_js}"' in index and f'href="{manifest["style.css"]}"' in index
+    assert gzip.decompress((out / (app_js + '.gz')).read_bytes()) == (out / app_js).read_bytes()
+    assert not (out / 'app.js').exists()
+
+
+def _client(directory):
+    app = Starlette()
+    app.mount('/', PrecompressedStaticFiles(directory=str(directory), html=True))
+    return TestClient(app)
+
+
+def test_serves_precompressed_copy_with_immutable_cache(dist):
+    out, manifest = dist
+    client = _client(out)
+    r = client.get('/' + manifest['app.js'], headers={'Accept-Encoding': 'gzip'})
+    assert r.status_code == 200
+    assert r.headers['content-encoding'] == 'gzip'
+    assert r.headers['content-type'].startswith(('text/javascript', 'application/javascript'))
+    assert r.headers['cache-control'] == assets.IMMUTABLE
+    assert r.headers['vary'] == 'Accept-Encoding'
+    assert r.content == (out / manifest['app.js']).read_bytes()  # o cliente já descomprimiu
+
+    plain = client.get('/' + manifest['app.js'], headers={'Accept-Encoding': 'identity'})
+    assert 'content-encoding' not in plain.headers
+    assert plain.content == r.content
+
+
+def test_index_is_revalidated(dist):
+    out, _ = dist
+    r = _client(out).get('/', headers={'Accept-Encoding': 'gzip'})
+    assert r.status_code == 200
+    assert r.headers['cache-control'] == 'no-cache'
+    assert r.headers['content-type'].startswith('text/html')
+
+
+def test_prefers_brotli_when_available(dist):
+    pytest.importorskip('brotli')
+    out, manifest = dist
+    r = _client(out).get('/' + manifest['style.css'], headers={'Accept-Encoding': 'gzip, br'})
+    assert r.headers['content-encoding'] == 'br'
+
+
+def test_rejected_encoding_is_not_used(dist):
+    out, manifest = dist
+    r = _client(out).get('/' + manifest['style.css'], headers={'Accept-Encoding': 'gzip;q=0'})
+    assert 'content-encoding' not in r.headers
+
+
+def test_json_api_responses_are_gzipped_above_threshold(template_dirs):
+    from backend.server import app
+
+    client = TestClient(app)
+    for i in range(30):
+        client.post('/templates/human', json={'title': f'Template {i}', 'body': 'Corpo longo ' * 20})
+    r = client.get('/templates', headers={'Accept-Encoding': 'gzip'})
+    assert r.status_code == 200
+    assert r.headers['content-encoding'] == 'gzip'
+    assert r.json()
+
+    small = client.get('/templates/top?n=1', headers={'Accept-Encoding': 'gzip'})
+    assert 'content-encoding' not in small.headers
@@ -0,0 +1,87 @@
+import asyncio
+import io
+import json
+import sys
+
+from backend import batch, cli
+from backend.ai_engine import AIEngine
+from backend.gemini_client import AsyncMockGeminiClient, MockGeminiClient
+
+CSV = (
+    'id,nome,empresa,nicho,onde,ponto,problems\n'
+    '1,Ana,Loja A,Moda,Instagram,,"[""site lento""]"\n'
+    '2,Bruno,Loja B,Pet,Google,Ótimas fotos,site amador;sem mobile\n'
+    '3,Carla,Loja C,Café,Indicação,,sem site\n'
+)
+
+
+def _write_leads(tmp_path):
+    path = tmp_path / 'leads.csv'
+    path.write_text(CSV, encoding='utf-8')
+    return str(path)
+
+
+def test_parse_csv_and_jsonl():
+    leads = batch.parse_leads(io.StringIO(CSV, newline=''), 'csv')
+    assert [lead['id'] for lead in leads] == ['1', '2', '3']
+    assert leads[1]['problems'] == ['site amador', 'sem mobile']
+    assert leads[0]['problems'] == ['site lento']
+
+    line = json.dumps({'nome': 'Ana', 'empresa': 'A', 'nicho': 'N', 'onde': 'O', 'problems': ['p']})
+    [lead] = batch.parse_leads([line], 'jsonl')
+    assert lead['id'] == batch.parse_leads([line], 'jsonl')[0]['id']
+    assert lead['ponto'] is None
+
+
+class TrackingEngine:
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+
+    async def generate_proposal_async(self, context):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        if 'Carla' in context:
+            raise RuntimeError('falhou')
+        return {'proposal': context.strip().splitlines()[0], 'report': 'r'}
+
+
+def test_run_batch_respects_concurrency_and_reports_errors():
+    leads = batch.parse_leads(io.StringIO(CSV * 1, newline=''), 'csv') * 4
+    engine = TrackingEngine()
+
+    async def collect():
+        return [record async for record in batch.run_batch(engine, leads, concurrency=3)]
+
+    records = asyncio.run(collect())
+    assert len(records) == 12
+    assert engine.max_running == 3
+    assert sum(r['status'] == 'error' for r in records) == 4
+
+
+def test_run_batch_to_file_resumes_from_checkpoint(tmp_path):
+    leads = batch.read_leads(_write_leads(tmp_path))
+    output = str(tmp_path / 'out.jsonl')
+    # Simula uma execução anterior que concluiu o lead 1 e caiu no meio de uma linha.
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'id': '1', 'status': 'ok', 'proposal': 'p', 'report': 'r'}) + '\n{"id": "2", "sta')
+
+    counts = asyncio.run(batch.run_batch_to_file(TrackingEngine(), leads, output))
+    assert counts == {'skipped': 1, 'ok': 1, 'error': 1}
+
+    # O lead 3 falhou, então é o único reprocessado na próxima rodada.
+    counts = asyncio.run(batch.run_batch_to_file(TrackingEngine(), leads, output))
+    assert counts == {'skipped': 2, 'ok': 0, 'error': 1}
+
+
+def test_cli_batch_subcommand(tmp_path, template_dirs, monkeypatch, capsys):
+    output = tmp_path / 'out.jsonl'
+    monkeypatch.setattr(sys, 'argv', ['cli', '--mock', 'batch', _write_leads(tmp_path), '-o', str(output), '-c', '2'])
+    cli.main()
+
+    records = [json.loads(line) for line in output.read_text(encoding='utf-8').splitlines()]
+    assert sorted(r['id'] for r in records) == ['1', '2', '3']
+    assert all(r['proposal'].startswith('[Proposta Mock]') for r in records)
+    assert '3 propostas geradas' in capsys.readouterr().out
@@ -0,0 +1,39 @@
+import json
+
+from backend import bench, template_manager
+
+
+def test_run_reports_every_operation(tmp_path):
+    original_dir = template_manager.AI_TEMPLATES_DIR
+    report = bench.run([30], str(tmp_path), repeat=2, proposals=1)
+
+    operations = report['results']['30']
+    assert set(operations) == {'get_all_templates_cold', 'get_all_templates', 'templates_view', 'get_template_report',
+                               'increment_template_usage', 'save_ai_template', 'engine_warm_index',
+                               'generate_proposal'}
+    assert operations['get_template_report']['n'] == 2
+    assert template_manager.AI_TEMPLATES_DIR == original_dir
+    json.dumps(report)
+
+
+def test_sqlite_store(tmp_path):
+    report = bench.run([10], str(tmp_path), store_kind='sqlite', repeat=1, proposals=1)
+    assert report['meta']['store'] == 'sqlite'
+    assert report['results']['10']['save_ai_template']['n'] == 1
+
+
+def test_compare_flags_regressions():
+    baseline = {'results': {'100': {'a': {'p50_ms': 1.0}, 'b': {'p50_ms': 2.0}}}}
+    current = {'results': {'100': {'a': {'p50_ms': 1.1}, 'b': {'p50_ms': 3.0}, 'c': {'p50_ms': 1.0}}}}
+    rows = bench.compare(current, baseline, threshold=0.2)
+    assert [(r['operation'], r['regression']) for r in rows] == [('a', False), ('b', True)]
+
+
+def test_main_exits_non_zero_on_regression(tmp_path, capsys):
+    baseline = tmp_path / 'base.json'
+    baseline.write_text(json.dumps({'results': {'5': {'get_all_templates': {'p50_ms': 1e-9}}}}))
+    code = bench.main(['--sizes', '5', '--repeat', '1', '--proposals', '1', '--workdir', str(tmp_path / 'w'),
+                       '-o', str(tmp_path / 'out.json'), '--compare', str(baseline)])
+    assert code == 1
+    assert 'mais lento' in capsys.readouterr().out
+    assert json.loads((tmp_path / 'out.json').read_text())['results']['5']
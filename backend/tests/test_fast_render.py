@@ -0,0 +1,50 @@
+import time
+
+from backend.data import TEMPLATES
+from backend.fast_render import CompiledTemplate, FastRenderer, NO_PROBLEMS_TEXT, format_problems
+
+
+LEAD = {'id': '1', 'nome': 'Ana', 'empresa': 'Emp', 'nicho': 'Moda', 'onde': 'Instagram',
+        'problems': ['site lento no celular.', 'alto abandono mobile']}
+
+
+def test_compiled_template_splits_literals_and_slots():
+    compiled = CompiledTemplate('Olá, [NOME_DO_PROFISSIONAL]! Notei: [PROBLEMAS]. [DESCONHECIDO]')
+    assert compiled.slots == ('NOME_DO_PROFISSIONAL', 'PROBLEMAS', 'DESCONHECIDO')
+    assert compiled.literals == ('Olá, ', '! Notei: ', '. ', '')
+    assert compiled.render({'NOME_DO_PROFISSIONAL': 'Ana', 'PROBLEMAS': 'x'}) == 'Olá, Ana! Notei: x. [DESCONHECIDO]'
+
+
+def test_format_problems():
+    assert format_problems(['a.', 'b', ' c ']) == 'a, b e c'
+    assert format_problems(['só um']) == 'só um'
+    assert format_problems([]) == NO_PROBLEMS_TEXT
+
+
+def test_render_fills_every_template_and_variant():
+    renderer = FastRenderer()
+    for template_id, variants in TEMPLATES.items():
+        for variant in variants:
+            proposal = renderer.render(LEAD, template_id, variant)['proposal']
+            assert '[' not in proposal
+            assert 'Ana' in proposal or '[NOME_DO_PROFISSIONAL]' not in variants[variant]
+            assert 'site lento no celular e alto abandono mobile' in proposal
+
+
+def test_render_picks_a_family_from_the_problems():
+    renderer = FastRenderer()
+    lead = dict(LEAD, problems=['experiência mobile do site com alto abandono'])
+    assert renderer.render(lead)['template_id'] == 'AUDITORIA_VISUAL'
+
+
+def test_render_bulk_expands_leads_by_variant():
+    renderer = FastRenderer()
+    leads = [dict(LEAD, id=str(i), nome=f'Lead {i}') for i in range(1000)]
+    start = time.perf_counter()
+    records = list(renderer.render_bulk(leads, ['default', 'formal', 'inexistente'], 'OTIMIZACAO_TRAFEGO'))
+    elapsed = time.perf_counter() - start
+
+    assert len(records) == 2000
+    assert records[1] == {'id': '0', 'template_id': 'OTIMIZACAO_TRAFEGO', 'variant': 'formal',
+                          'proposal': renderer.render(LEAD, 'OTIMIZACAO_TRAFEGO', 'formal')['proposal'].replace('Ana', 'Lead 0')}
+    assert elapsed < 1.0
@@ -0,0 +1,106 @@
+import asyncio
+import base64
+
+import pytest
+
+from backend.gemini_cache import (AsyncCachingGeminiClient, CachingGeminiClient, ResponseCache,
+                                  bypass_cache, cache_key)
+from backend.gemini_client import GeminiClient, GeminiError
+
+
+class CountingClient(GeminiClient):
+    model_name = 'counting'
+
+    def __init__(self, response='resposta'):
+        self.calls = 0
+        self.response = response
+
+    def generate_content(self, prompt, media_files=None):
+        self.calls += 1
+        return f"{self.response} {self.calls}"
+
+
+def test_cache_key_depends_on_model_prompt_and_media():
+    media = [{'content': base64.b64encode(b'imagem').decode()}]
+    base = cache_key('m', 'p')
+    assert cache_key('m', 'p') == base
+    assert cache_key('outro', 'p') != base
+    assert cache_key('m', 'p2') != base
+    assert cache_key('m', 'p', media) != base
+    assert cache_key('m', 'p', media) == cache_key('m', 'p', [{'content': b'imagem'}])
+
+
+def test_repeated_prompt_hits_cache():
+    inner = CountingClient()
+    client = CachingGeminiClient(inner)
+    assert client.generate_content('p') == 'resposta 1'
+    assert client.generate_content('p') == 'resposta 1'
+    assert inner.calls == 1
+    assert client.cache.stats()['hits'] == 1
+    assert client.cache.stats()['misses'] == 1
+
+
+def test_bypass_skips_lookup_but_refreshes_entry():
+    inner = CountingClient()
+    client = CachingGeminiClient(inner)
+    client.generate_content('p')
+    with bypass_cache():
+        assert client.generate_content('p') == 'resposta 2'
+    assert client.generate_content('p') == 'resposta 2'
+
+
+def test_errors_are_not_cached():
+    class FlakyClient(CountingClient):
+        def generate_content(self, prompt, media_files=None):
+            self.calls += 1
+            if self.calls == 1:
+                raise GeminiError('quota')
+            return 'ok'
+
+    inner = FlakyClient()
+    client = CachingGeminiClient(inner)
+    with pytest.raises(GeminiError):
+        client.generate_content('p')
+    assert client.generate_content('p') == 'ok'
+    assert inner.calls == 2
+
+
+def test_ttl_and_lru_eviction(monkeypatch):
+    cache = ResponseCache(max_entries=2, ttl=10)
+    now = [1000.0]
+    monkeypatch.setattr('backend.gemini_cache.time.time', lambda: now[0])
+    cache.put('a', '1')
+    cache.put('b', '2')
+    cache.get('a')
+    cache.put('c', '3')
+    assert cache.get('b') is None
+    assert cache.get('a') == '1'
+    now[0] += 11
+    assert cache.get('a') is None
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    inner = CountingClient()
+    CachingGeminiClient(inner, ResponseCache(disk_dir=str(tmp_path))).generate_content('p')
+
+    restarted = CachingGeminiClient(inner, ResponseCache(disk_dir=str(tmp_path)))
+    assert restarted.generate_content('p') == 'resposta 1'
+    assert inner.calls == 1
+    assert restarted.cache.stats()['disk_hits'] == 1
+
+
+def test_async_client_shares_cache():
+    class AsyncCounting:
+        model_name = 'counting'
+        calls = 0
+
+        async def generate_content(self, prompt, media_files=None):
+            self.calls += 1
+            return 'assíncrona'
+
+    cache = ResponseCache()
+    inner = AsyncCounting()
+    client = AsyncCachingGeminiClient(inner, cache)
+    asyncio.run(client.generate_content('p'))
+    assert asyncio.run(client.generate_content('p')) == 'assíncrona'
+    assert inner.calls == 1
@@ -0,0 +1,227 @@
+import asyncio
+import os
+import sqlite3
+import time
+
+from fastapi.testclient import TestClient
+
+from backend.jobs import JobQueue
+
+
+async def _wait_for(queue, job_id, status, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while queue.get(job_id)['status'] != status:
+        assert asyncio.get_running_loop().time() < deadline, queue.get(job_id)
+        await asyncio.sleep(0.01)
+    return queue.get(job_id)
+
+
+def test_queue_runs_jobs_with_bounded_workers(tmp_path):
+    running, peak = 0, 0
+
+    async def handler(payload):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        if payload['n'] == 3:
+            raise RuntimeError('falhou')
+        return {'dobro': payload['n'] * 2}
+
+    async def scenario():
+        queue = JobQueue({'calc': handler}, str(tmp_path / 'jobs.db'), workers=2)
+        await queue.start()
+        jobs = [queue.submit('calc', {'n': n}) for n in range(6)]
+        assert queue.get(jobs[5]['id'])['status'] == 'queued'
+        done = [await _wait_for(queue, job['id'], 'error' if n == 3 else 'done') for n, job in enumerate(jobs)]
+        await queue.stop()
+        queue.close()
+        return done
+
+    done = asyncio.run(scenario())
+    assert peak == 2
+    assert done[4]['result'] == {'dobro': 8}
+    assert done[3]['error'] == 'falhou' and done[3]['result'] is None
+    assert all(job['started_at'] >= job['created_at'] for job in done)
+
+
+def test_interrupted_and_queued_jobs_survive_a_restart(tmp_path):
+    db_path = str(tmp_path / 'jobs.db')
+
+    async def first_run():
+        started = asyncio.Event()
+
+        async def slow(payload):
+            started.set()
+            await asyncio.sleep(60)
+
+        queue = JobQueue({'proposal': slow}, db_path, workers=1)
+        await queue.start()
+        ids = [queue.submit('proposal', {'n': n})['id'] for n in range(2)]
+        await started.wait()
+        assert queue.get(ids[0])['status'] == 'running'
+        assert queue.get(ids[1])['position'] == 0
+        await queue.stop()
+        queue.close()
+        return ids
+
+    async def second_run(ids):
+        async def fast(payload):
+            return {'n': payload['n']}
+
+        queue = JobQueue({'proposal': fast}, db_path, workers=1)
+        await queue.start()
+        results = [(await _wait_for(queue, job_id, 'done'))['result'] for job_id in ids]
+        await queue.stop()
+        queue.close()
+        return results
+
+    ids = asyncio.run(first_run())
+    assert asyncio.run(second_run(ids)) == [{'n': 0}, {'n': 1}]
+
+
+def test_proposal_job_endpoints(template_dirs, monkeypatch):
+    from backend import server
+    queue = JobQueue({'proposal': server._run_proposal_job}, str(template_dirs / 'jobs.db'), workers=1)
+    monkeypatch.setattr(server, 'job_queue', queue)
+
+    with TestClient(server.app) as client:
+        form = {'nome': 'Ana', 'empresa': 'Emp', 'nicho': 'Moda', 'onde': 'Instagram', 'problems': '["site lento"]'}
+        r = client.post('/jobs/proposal', data=form)
+        assert r.status_code == 202
+        job_id = r.json()['job_id']
+        assert r.json()['status_url'] == f'/jobs/{job_id}'
+
+        for _ in range(500):
+            job = client.get(f'/jobs/{job_id}').json()
+            if job['status'] == 'done':
+                break
+            time.sleep(0.01)
+        assert job['status'] == 'done'
+        assert job['result']['proposal'].startswith('[Proposta Mock]')
+
+        assert client.get('/jobs/nao-existe').status_code == 404
+        assert client.post('/jobs/proposal', data=dict(form, problems='[')).status_code == 400
+        text = client.get('/metrics').text
+        assert 'job_queue_depth 0' in text
+        assert 'job_wait_seconds_count{kind="proposal"}' in text
+
+
+def test_recover_leaves_jobs_of_live_workers_alone(tmp_path):
+    import socket
+
+    from backend.jobs import JobStore
+
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    host = socket.gethostname()
+    live = store.create('calc', {})['id']
+    dead = store.create('calc', {})['id']
+    remote = store.create('calc', {})['id']
+    stale = store.create('calc', {})['id']
+    queued = store.create('calc', {})['id']
+    # Este processo está vivo; o pid 0x7fffffff não existe.
+    store.start(live, f'{host}:{os.getpid()}')
+    store.start(dead, f'{host}:{0x7fffffff}')
+    store.start(remote, 'outro-host:1')
+    store.start(stale, 'outro-host:2')
+    store._conn.execute('UPDATE jobs SET heartbeat_at = ? WHERE id = ?', (time.time() - 120, stale))
+    store._conn.commit()
+
+    assert store.recover(lease=60) == [dead, stale, queued]
+    assert store.get(live)['status'] == 'running'
+    assert store.get(remote)['status'] == 'running'
+    store.close()
+
+
+def test_start_claims_a_job_only_once(tmp_path):
+    from backend.jobs import JobStore
+
+    first = JobStore(str(tmp_path / 'jobs.db'))
+    second = JobStore(str(tmp_path / 'jobs.db'))
+    job_id = first.create('calc', {'n': 1})['id']
+    assert first.start(job_id, 'a')['payload'] == {'n': 1}
+    assert second.start(job_id, 'b') is None
+    first.close()
+    second.close()
+
+
+def test_finish_only_records_the_result_of_the_current_owner(tmp_path):
+    from backend.jobs import JobStore
+
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    job_id = store.create('calc', {})['id']
+    store.start(job_id, 'outro-host:1')
+    assert not store.finish(job_id, 'outro-host:2', result={'n': 1})
+    assert store.get(job_id)['status'] == 'running'
+
+    # O lease venceu e outro worker pegou o trabalho: o dono antigo não sobrescreve.
+    assert store.reclaim(lease=-1) == [job_id]
+    store.start(job_id, 'outro-host:2')
+    assert not store.finish(job_id, 'outro-host:1', error='atrasado')
+    assert store.finish(job_id, 'outro-host:2', result={'n': 2})
+    assert store.get(job_id)['result'] == {'n': 2}
+    assert not store.finish(job_id, 'outro-host:2', result={'n': 3})
+    store.close()
+
+
+def test_worker_survives_store_failures(tmp_path):
+    async def handler(payload):
+        return {'n': payload['n']}
+
+    async def scenario():
+        queue = JobQueue({'calc': handler}, str(tmp_path / 'jobs.db'), workers=1)
+        await queue.start()
+        finish = queue.store.finish
+        calls = []
+
+        def flaky_finish(job_id, *args, **kwargs):
+            calls.append(job_id)
+            if len(calls) == 1:
+                raise sqlite3.OperationalError('database is locked')
+            return finish(job_id, *args, **kwargs)
+
+        queue.store.finish = flaky_finish
+        lost = queue.submit('calc', {'n': 1})['id']
+        job = await _wait_for(queue, queue.submit('calc', {'n': 2})['id'], 'done')
+        # O primeiro continua "running" sem heartbeat: o lease vence e ele volta para a fila.
+        assert queue.get(lost)['status'] == 'running'
+        await queue.stop()
+        queue.close()
+        return job
+
+    assert asyncio.run(scenario())['result'] == {'n': 2}
+
+
+def test_heartbeat_requeues_jobs_of_dead_workers(tmp_path):
+    from backend.jobs import JobStore
+
+    db_path = str(tmp_path / 'jobs.db')
+    store = JobStore(db_path)
+    job_id = store.create('calc', {'n': 7})['id']
+    store.start(job_id, 'outro-host:1')
+
+    async def handler(payload):
+        return {'n': payload['n']}
+
+    async def scenario():
+        queue = JobQueue({'calc': handler}, db_path, workers=1, lease=0.15)
+        await queue.start()
+        job = await _wait_for(queue, job_id, 'done')
+        await queue.stop()
+        queue.close()
+        return job
+
+    assert asyncio.run(scenario())['result'] == {'n': 7}
+    store.close()
+
+
+def test_proposal_job_fails_clearly_when_media_left_the_spool(template_dirs, tmp_path):
+    import pytest
+
+    from backend import server
+    payload = {'nome': 'Ana', 'empresa': 'Emp', 'nicho': 'Moda', 'onde': 'Instagram', 'ponto': None,
+               'problems': [], 'media': [{'path': str(tmp_path / 'sumiu'), 'filename': 'tela.png',
+                                          'sha256': 'x', 'size': 1, 'mime_type': 'image/png'}]}
+    with pytest.raises(RuntimeError, match='tela.png'):
+        asyncio.run(server._run_proposal_job(payload))
@@ -0,0 +1,159 @@
+import asyncio
+import base64
+import io
+import os
+
+from backend import media
+from backend.gemini_cache import cache_key
+from backend.gemini_client import RealGeminiClient
+from backend.media import LocalUploader, MediaPipeline, MediaSpool, UploadCache
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00\x00\x00\rIHDR' + b'\x00\x00\x00\x01' * 2 + b'\x08\x02\x00\x00\x00' + b'\x00' * 20000
+
+
+def _chunks(data, size=4096):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+def test_spool_streams_hashes_and_dedupes(tmp_path):
+    spool = MediaSpool(str(tmp_path))
+    first = spool.write(_chunks(PNG), 'print.png')
+    second = spool.write([PNG])
+
+    assert first['mime_type'] == 'image/png'
+    assert first['size'] == len(PNG)
+    assert second['path'] == first['path']
+    with open(first['path'], 'rb') as f:
+        assert f.read() == PNG
+    stored = [name for _, _, files in os.walk(tmp_path) for name in files]
+    assert stored == [first['sha256']]
+
+
+def test_spool_sniffs_only_the_first_kilobytes(tmp_path, monkeypatch):
+    seen = []
+    import magic
+    monkeypatch.setattr(magic, 'from_buffer', lambda data, mime: seen.append(len(data)) or 'image/png')
+    MediaSpool(str(tmp_path)).write(_chunks(PNG, 1000))
+    assert seen == [media.SNIFF_BYTES]
+
+
+def test_spool_decodes_base64_and_async_uploads(tmp_path):
+    spool = MediaSpool(str(tmp_path))
+
+    class Upload:
+        filename = 'tela.png'
+
+        def __init__(self, data):
+            self.file = io.BytesIO(data)
+
+        async def read(self, n):
+            return self.file.read(n)
+
+    from_upload = asyncio.run(spool.write_upload(Upload(PNG), chunk_size=1024))
+    from_base64 = spool.write_base64(base64.b64encode(PNG).decode(), chunk_size=1000)
+    assert from_upload['filename'] == 'tela.png'
+    assert from_upload['sha256'] == from_base64['sha256']
+
+
+def test_pipeline_uploads_each_asset_once(tmp_path):
+    uploader = LocalUploader(str(tmp_path / 'uploaded'))
+    pipeline = MediaPipeline(uploader, MediaSpool(str(tmp_path / 'spool')))
+    asset = pipeline.spool.write([PNG])
+    text = pipeline.spool.write([b'apenas texto'])
+
+    parts = pipeline.prepare([asset, text, {'content': base64.b64encode(PNG).decode()}])
+    assert parts == [{'file_uri': f"local://{asset['sha256']}", 'mime_type': 'image/png'}] * 2
+    assert uploader.uploads == [asset['sha256']]
+    assert os.listdir(tmp_path / 'uploaded') == [asset['sha256']]
+    assert pipeline.cache.stats()['hits'] == 1
+    assert pipeline._locks == {}
+
+
+def test_concurrent_uploads_of_one_asset_share_a_lock_that_is_then_dropped(tmp_path):
+    import threading
+    import time
+
+    release = threading.Event()
+
+    class SlowUploader(LocalUploader):
+        def upload(self, asset):
+            release.wait(5)
+            return super().upload(asset)
+
+    uploader = SlowUploader(str(tmp_path / 'uploaded'))
+    pipeline = MediaPipeline(uploader, MediaSpool(str(tmp_path / 'spool')))
+    asset = pipeline.spool.write([PNG])
+    handles = []
+    threads = [threading.Thread(target=lambda: handles.append(pipeline.handle_for(asset))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while pipeline._locks.get(asset['sha256'], [None, 0])[1] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert uploader.uploads == [asset['sha256']]
+    assert len(handles) == 3 and pipeline._locks == {}
+
+
+def test_upload_cache_expires():
+    now = [0.0]
+    cache = UploadCache(ttl=10, clock=lambda: now[0])
+    cache.put('abc', 'handle')
+    assert cache.get('abc') == 'handle'
+    now[0] = 11
+    assert cache.get('abc') is None
+
+
+def test_real_client_sends_upload_references(tmp_path):
+    uploader = LocalUploader()
+    client = RealGeminiClient(api_key='chave', media_pipeline=MediaPipeline(uploader, MediaSpool(str(tmp_path))))
+    asset = client.media.spool.write([PNG])
+    parts = client._request_parts('prompt', [asset])
+    assert parts == ['prompt', {'file_uri': f"local://{asset['sha256']}", 'mime_type': 'image/png'}]
+
+
+def test_cache_key_matches_for_spooled_and_inline_media(tmp_path):
+    asset = MediaSpool(str(tmp_path)).write([PNG])
+    assert cache_key('m', 'p', [asset]) == cache_key('m', 'p', [{'content': PNG}])
+
+
+def test_async_client_and_spool_block_off_the_event_loop(tmp_path, monkeypatch):
+    import threading
+    from unittest.mock import Mock
+
+    from backend.gemini_client import AsyncRealGeminiClient
+
+    threads = []
+
+    class RecordingUploader(LocalUploader):
+        def upload(self, asset):
+            threads.append(('upload', threading.get_ident()))
+            return super().upload(asset)
+
+    spool = MediaSpool(str(tmp_path))
+    monkeypatch.setattr(spool, 'prune', lambda: threads.append(('prune', threading.get_ident())) or 0)
+    client = AsyncRealGeminiClient(api_key='chave', media_pipeline=MediaPipeline(RecordingUploader(), spool))
+
+    async def response(parts):
+        return Mock(text='ok')
+    client.model = Mock()
+    client.model.generate_content_async = response
+
+    class Upload:
+        filename = 'tela.png'
+
+        def __init__(self, data):
+            self.file = io.BytesIO(data)
+
+        async def read(self, n):
+            return self.file.read(n)
+
+    async def scenario():
+        asset = await spool.write_upload(Upload(PNG))
+        assert await client.generate_content('prompt', [asset]) == 'ok'
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert [name for name, _ in threads] == ['prune', 'upload']
+    assert all(ident != loop_thread for _, ident in threads)
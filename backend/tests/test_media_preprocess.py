@@ -0,0 +1,86 @@
+import asyncio
+import io
+import shutil
+import subprocess
+
+import pytest
+from PIL import Image
+
+from backend import media_preprocess
+from backend.media import MediaSpool
+from backend.media_preprocess import MediaPreprocessor, preprocess_asset
+
+
+def _png(size, mode='RGB'):
+    image = Image.linear_gradient('L').resize(size).convert(mode)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return MediaSpool(str(tmp_path / 'spool'))
+
+
+@pytest.fixture
+def in_process(spool, monkeypatch):
+    """Roda `preprocess_asset` no próprio processo, como faria um processo do pool."""
+    settings = {'max_dimension': 400, 'jpeg_quality': 80, 'keyframes': 3, 'spool_dir': spool.directory}
+    monkeypatch.setattr(media_preprocess, '_settings', dict(settings))
+
+
+def test_images_are_downscaled_in_the_pool(spool):
+    preprocessor = MediaPreprocessor(max_dimension=400, workers=2, spool_dir=spool.directory)
+    try:
+        assets = [spool.write([_png((2400, 1600))], 'print.png'), spool.write([b'texto'], 'notas.txt')]
+        outputs, report = asyncio.run(preprocessor.process_async(assets))
+    finally:
+        preprocessor.close()
+
+    image, text = outputs
+    assert image['mime_type'] == 'image/jpeg'
+    with Image.open(image['path']) as result:
+        assert result.size == (400, 267)
+    assert text == assets[1]
+    assert report['files'][0]['bytes_before'] == assets[0]['size']
+    assert report['files'][0]['bytes_after'] == image['size'] < assets[0]['size']
+    assert report['bytes_before'] == assets[0]['size'] + assets[1]['size']
+
+
+def test_small_images_keep_the_original_when_recompression_does_not_help(spool, in_process):
+    asset = spool.write([_png((32, 32))])
+    assert preprocess_asset(asset)['outputs'] == [asset]
+
+
+def test_transparency_is_kept_as_png(spool, in_process):
+    result = preprocess_asset(spool.write([_png((1200, 800), 'RGBA')]))
+    assert result['outputs'][0]['mime_type'] == 'image/png'
+
+
+def test_failures_and_missing_ffmpeg_keep_the_original(spool, in_process, monkeypatch):
+    broken = dict(spool.write([b'\x89PNG\r\n\x1a\n' + b'\x00' * 64]), mime_type='image/png')
+    result = preprocess_asset(broken)
+    assert result['outputs'] == [broken]
+    assert 'falha no processamento' in result['report']['note']
+
+    monkeypatch.setattr(media_preprocess.shutil, 'which', lambda name: None)
+    video = dict(spool.write([b'\x00' * 64], 'video.mp4'), mime_type='video/mp4')
+    result = preprocess_asset(video)
+    assert result['outputs'] == [video]
+    assert 'ffmpeg' in result['report']['note']
+
+
+@pytest.mark.skipif(not shutil.which('ffmpeg'), reason='ffmpeg não instalado')
+def test_video_becomes_keyframes(spool, in_process, tmp_path):
+    path = tmp_path / 'video.mp4'
+    subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=duration=3:size=1280x720:rate=10',
+                    str(path)], check=True)
+    video = spool.write([path.read_bytes()], 'video.mp4')
+    result = preprocess_asset(video)
+
+    assert result['report']['outputs'] == 3
+    assert all(frame['mime_type'] == 'image/jpeg' for frame in result['outputs'])
+    for frame in result['outputs']:
+        with Image.open(frame['path']) as image:
+            assert max(image.size) <= 400
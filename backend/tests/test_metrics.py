@@ -0,0 +1,84 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from backend import metrics
+from backend.ai_engine import AIEngine, build_client_context
+from backend.gemini_client import AsyncMockGeminiClient, MockGeminiClient
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    histogram = registry.histogram('latency_seconds', 'Latência.', ('stage',), buckets=(0.1, 1.0))
+    histogram.observe(0.05, 'a')
+    histogram.observe(0.5, 'a')
+    histogram.observe(5.0, 'a')
+    registry.counter('calls_total', 'Chamadas.', ('status',)).inc('o"k')
+
+    text = registry.render()
+    assert 'latency_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{stage="a",le="1"} 2' in text
+    assert 'latency_seconds_bucket{stage="a",le="+Inf"} 3' in text
+    assert 'latency_seconds_sum{stage="a"} 5.55' in text
+    assert 'latency_seconds_count{stage="a"} 3' in text
+    assert '# TYPE calls_total counter' in text
+    assert 'calls_total{status="o\\"k"} 1' in text
+
+
+def test_disabled_instrumentation_records_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, 'ENABLED', False)
+    before = metrics.STAGE_SECONDS.count('desligado')
+    assert metrics.span('desligado') is metrics.span('outro')
+    with metrics.span('desligado'):
+        pass
+    metrics.timed('desligado')(lambda: None)()
+    metrics.record_llm_call('desligado', 1.0, 'p', 'r')
+    assert metrics.STAGE_SECONDS.count('desligado') == before
+    assert metrics.LLM_CALLS.value('desligado', 'ok') == 0
+
+
+def test_engine_records_stages_and_llm_calls(template_dirs):
+    engine = AIEngine(MockGeminiClient(), AsyncMockGeminiClient())
+    context = build_client_context('Ana', 'Emp', 'Moda', 'Instagram', None, ['site lento'])
+    calls = metrics.LLM_CALLS.value('hybrid', 'ok')
+    fallbacks = metrics.HYBRID_PARSE.value('fallback')
+    stages = {stage: metrics.STAGE_SECONDS.count(stage) for stage in
+              ('generate_proposal', 'select_templates', 'build_prompt', 'hybrid_call', 'parse_response',
+               'save_template', 'report_call', 'template_manager.get_templates_view')}
+
+    engine.generate_proposal(context)
+    asyncio.run(engine.generate_proposal_async(context))
+
+    assert metrics.LLM_CALLS.value('hybrid', 'ok') == calls + 2
+    # O mock não responde em JSON, então as duas respostas vão pelo fallback.
+    assert metrics.HYBRID_PARSE.value('fallback') == fallbacks + 2
+    for stage, count in stages.items():
+        assert metrics.STAGE_SECONDS.count(stage) > count, stage
+
+
+def test_streamed_calls_are_timed_like_the_others(template_dirs):
+    engine = AIEngine(MockGeminiClient(), AsyncMockGeminiClient())
+    before = {stage: metrics.STAGE_SECONDS.count(stage) for stage in ('hybrid_call', 'report_call')}
+    calls = metrics.LLM_CALLS.value('report', 'ok')
+
+    async def consume():
+        async for _ in engine.stream_proposal('Cliente'):
+            pass
+
+    asyncio.run(consume())
+    for stage, count in before.items():
+        assert metrics.STAGE_SECONDS.count(stage) == count + 1, stage
+    assert metrics.LLM_CALLS.value('report', 'ok') == calls + 1
+
+
+def test_metrics_endpoint(template_dirs):
+    from backend.server import app
+    client = TestClient(app)
+    client.post('/generate-proposal', data={'nome': 'Ana', 'empresa': 'Emp', 'nicho': 'Moda',
+                                            'onde': 'Instagram', 'problems': '[]'})
+    r = client.get('/metrics')
+    assert r.status_code == 200
+    assert r.headers['content-type'].startswith('text/plain; version=0.0.4')
+    assert 'llm_calls_total{call="report",status="ok"}' in r.text
+    assert 'proposal_stage_seconds_bucket{stage="hybrid_call",le="+Inf"}' in r.text
+    assert '# TYPE llm_prompt_chars histogram' in r.text
@@ -0,0 +1,49 @@
+from backend.near_duplicates import NearDuplicateIndex, find_duplicates, shingles, signature
+
+TEXT = ('Olá Ana, vi que a Clínica Sorriso aparece pouco no Google. Com uma campanha local '
+        'bem segmentada e um site rápido, conseguimos encher a agenda já no primeiro mês.')
+
+
+def _similarity(a, b):
+    return float((signature(a) == signature(b)).mean())
+
+
+def test_shingles_ignore_case_accents_and_punctuation():
+    assert shingles('Olá,  MUNDO cruel!') == shingles('ola mundo cruel') == {'ola mundo cruel'}
+    assert shingles('') == set()
+    assert signature('') is None
+
+
+def test_signature_estimates_jaccard():
+    assert _similarity(TEXT, TEXT) == 1.0
+    assert _similarity(TEXT, TEXT.replace('Ana', 'Bruno')) > 0.7
+    assert _similarity(TEXT, 'Proposta sobre redes sociais para uma padaria de bairro.') < 0.2
+
+
+def test_short_bodies_hash_every_word():
+    assert _similarity('Olá João', 'Olá Maria') == 0.0
+    assert _similarity('Olá João', 'ola, JOÃO!') == 1.0
+    index = NearDuplicateIndex()
+    index.add('a.json', {'body': 'Olá João'})
+    assert index.find('Olá Maria') is None
+
+
+def test_index_finds_only_close_matches():
+    index = NearDuplicateIndex()
+    index.add('a.json', {'body': TEXT})
+    index.add('b.json', {'body': 'Proposta sobre redes sociais para uma padaria de bairro.'})
+
+    key, similarity = index.find(TEXT + ' Abraços!')
+    assert key == 'a.json' and similarity >= index.threshold
+    assert index.find('Um assunto totalmente diferente de todos os outros.') is None
+    assert index.find(TEXT, exclude={'a.json'}) is None
+
+    index.remove('a.json')
+    assert index.find(TEXT) is None
+    assert len(index) == 1
+
+
+def test_find_duplicates_keeps_the_most_used():
+    templates = [{'filename': f'{i}.json', 'body': TEXT + '!' * i} for i in range(3)]
+    templates.append({'filename': 'x.json', 'body': 'Texto sem relação nenhuma com os demais.'})
+    assert find_duplicates(templates, {'1.json': 5}) == [('0.json', '1.json'), ('2.json', '1.json')]
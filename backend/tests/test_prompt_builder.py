@@ -0,0 +1,70 @@
+import logging
+
+from backend.ai_engine import AIEngine
+from backend.gemini_client import AsyncMockGeminiClient, MockGeminiClient
+from backend.prompt_builder import TRUNCATION_MARK, PromptBuilder, fit_texts, stage_budget
+
+
+def test_fit_texts_keeps_everything_within_budget():
+    texts = ['curto', 'médio ' * 10]
+    assert fit_texts(texts, 1000) == texts
+
+
+def test_fit_texts_trims_longest_first():
+    short, medium, long = 'a' * 200, 'b ' * 300, 'c ' * 2000
+    fitted = fit_texts([short, medium, long], 1200, min_chars=10)
+    assert fitted[0] is short
+    assert sum(len(text) for text in fitted) <= 1200
+    assert fitted[2].endswith(TRUNCATION_MARK)
+    # Os dois cortados ficam com o mesmo teto.
+    assert abs(len(fitted[1]) - len(fitted[2])) <= 10
+
+
+def test_fit_texts_respects_minimum_size():
+    fitted = fit_texts(['x ' * 500, 'y ' * 500], 10, min_chars=100)
+    assert all(80 <= len(text) <= 100 for text in fitted)
+
+
+def test_builder_trims_bodies_not_fixed_text():
+    builder = PromptBuilder('hybrid', budget_tokens=100)
+    builder.add('Cabeçalho fixo\n').add_body('palavra ' * 500).add('\nRodapé fixo')
+    text = builder.build()
+    assert text.startswith('Cabeçalho fixo\n') and text.endswith('\nRodapé fixo')
+    assert len(text) <= 100 * 4
+    assert builder.trimmed == 1
+
+
+def test_stage_budget_reads_environment(monkeypatch):
+    monkeypatch.setenv('PROMPT_BUDGET_REPORT', '123')
+    assert stage_budget('report') == 123
+    monkeypatch.delenv('PROMPT_BUDGET_HYBRID', raising=False)
+    assert stage_budget('hybrid') == 1500
+
+
+def test_long_inspiration_bodies_fit_the_budget(template_dirs, monkeypatch):
+    monkeypatch.setenv('PROMPT_BUDGET_HYBRID', '300')
+    engine = AIEngine(MockGeminiClient())
+    inspiration = [{'title': f'IA {i}', 'subject': 's', 'body': f'texto {i} ' * 2000} for i in range(3)]
+    parts = engine._hybrid_prompt_parts('Cliente', inspiration)
+    assert len(parts.suffix) <= 300 * 4
+    assert parts.suffix.count(TRUNCATION_MARK) == 3
+
+
+def test_hybrid_prefix_does_not_grow_with_the_library(template_dirs):
+    engine = AIEngine(MockGeminiClient())
+    human = engine._load_all_templates()['human_adm']
+    before = engine._hybrid_prompt_parts('Cliente', human)
+    engine.template_store.save_human_template({'title': 'Novo humano', 'body': 'x' * 5000})
+    after = engine._hybrid_prompt_parts('Cliente', human)
+    assert after.prefix == before.prefix
+    assert 'Corpo do template' not in before.prefix
+    assert 'Corpo do template Auditoria Visual' in before.suffix
+
+
+def test_prompt_size_is_logged_per_call(template_dirs, caplog):
+    engine = AIEngine(MockGeminiClient(), AsyncMockGeminiClient())
+    with caplog.at_level(logging.INFO, logger='backend.prompt'):
+        engine.generate_proposal('Cliente')
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(message.startswith('prompt hybrid: prefix=') for message in messages)
+    assert any(message.startswith('prompt report: prefix=') for message in messages)
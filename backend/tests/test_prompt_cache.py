@@ -0,0 +1,188 @@
+import asyncio
+import threading
+import time
+
+from backend import config, prompt_cache
+from backend.ai_engine import AIEngine
+from backend.gemini_cache import CachingGeminiClient
+from backend.gemini_client import AsyncMockGeminiClient, MockGeminiClient
+from backend.prompt_cache import (ContextCache, LocalContextCache, PromptParts, business_profile,
+                                  min_cache_tokens, track_tokens_saved)
+from backend.resilience import estimate_tokens
+
+
+class FlakyContextCache(ContextCache):
+    """Falha nos primeiros `failures` registros; depois devolve handles numerados."""
+
+    def __init__(self, failures=0, delay=0.0, **kwargs):
+        super().__init__(min_tokens=0, **kwargs)
+        self.failures = failures
+        self.delay = delay
+        self.registrations = 0
+
+    def _register(self, model_name, prefix):
+        self.registrations += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.registrations <= self.failures:
+            raise RuntimeError('provedor indisponível')
+        return f'handle-{self.registrations}'
+
+
+def test_lookup_registers_once_then_hits():
+    cache = LocalContextCache()
+    with track_tokens_saved() as saved:
+        handle = cache.lookup('m', 'prefixo fixo ' * 10)
+        assert cache.lookup('m', 'prefixo fixo ' * 10) == handle
+    assert cache.registrations == 1
+    assert cache.resolve(handle) == 'prefixo fixo ' * 10
+    assert saved.total == estimate_tokens('prefixo fixo ' * 10)
+    assert cache.lookup('outro', 'prefixo fixo ' * 10) != handle
+
+
+def test_small_prefix_is_skipped():
+    cache = LocalContextCache(min_tokens=100)
+    assert cache.lookup('m', 'curto') is None
+    assert cache.registrations == 0
+
+
+def test_entry_expires_after_ttl():
+    cache = LocalContextCache(ttl=0.05)
+    cache.lookup('m', 'prefixo')
+    time.sleep(0.06)
+    cache.lookup('m', 'prefixo')
+    assert cache.registrations == 2
+
+
+def test_failed_registration_is_retried_after_a_while():
+    cache = FlakyContextCache(failures=1, retry_after=0.05)
+    assert cache.lookup('m', 'prefixo') is None
+    assert cache.lookup('m', 'prefixo') is None
+    assert cache.registrations == 1
+    time.sleep(0.06)
+    assert cache.lookup('m', 'prefixo') == 'handle-2'
+
+
+def test_concurrent_lookups_share_one_registration():
+    cache = FlakyContextCache(delay=0.1)
+    handles = []
+    threads = [threading.Thread(target=lambda: handles.append(cache.lookup('m', 'prefixo'))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert handles == ['handle-1'] * 5
+    assert cache.registrations == 1
+
+
+class BlockingContextCache(LocalContextCache):
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def _register(self, model_name, prefix):
+        if prefix == 'lento':
+            self.release.wait(5)
+        return super()._register(model_name, prefix)
+
+
+def test_slow_registration_does_not_block_other_prefixes():
+    cache = BlockingContextCache()
+    slow = threading.Thread(target=cache.lookup, args=('m', 'lento'))
+    slow.start()
+    time.sleep(0.05)
+    start = time.perf_counter()
+    assert cache.lookup('m', 'rápido') is not None
+    assert time.perf_counter() - start < 1
+    cache.release.set()
+    slow.join()
+    assert cache.lookup('m', 'lento') is not None
+
+
+def test_min_cache_tokens_by_model(monkeypatch):
+    monkeypatch.delenv('PROMPT_CACHE_MIN_TOKENS', raising=False)
+    assert min_cache_tokens('gemini-2.5-flash') == 1024
+    assert min_cache_tokens('models/gemini-2.5-flash-lite') == 1024
+    assert min_cache_tokens('gemini-2.5-pro') == 4096
+    assert min_cache_tokens('modelo-desconhecido') == prompt_cache.DEFAULT_GEMINI_MIN_TOKENS
+    monkeypatch.setenv('PROMPT_CACHE_MIN_TOKENS', '10')
+    assert min_cache_tokens('gemini-2.5-pro') == 10
+
+
+def test_business_profile_uses_config():
+    profile = business_profile()
+    assert config.BUSINESS_INFO['name'] in profile
+    for item in config.BUSINESS_INFO['products_or_services']:
+        assert item in profile
+    assert business_profile({'name': 'ACME'}) == 'Sobre a empresa que envia a proposta:\n- Nome: ACME\n'
+
+
+def test_engine_splits_static_prefix_from_request_suffix(template_dirs):
+    engine = AIEngine(MockGeminiClient())
+    inspiration = engine._load_all_templates()['human_adm']
+    first = engine._hybrid_prompt_parts('Cliente A', inspiration)
+    second = engine._hybrid_prompt_parts('Cliente B', inspiration[:1])
+    assert first.prefix == second.prefix
+    assert config.BUSINESS_INFO['name'] in first.prefix
+    assert 'Cliente A' in first.suffix and 'Cliente A' not in first.prefix
+    assert 'Corpo do template Auditoria Visual' in first.suffix
+
+    report = engine._report_prompt_parts('Cliente A', inspiration, {'title': 'Novo'})
+    assert 'relatório conciso' in report.prefix
+    assert 'Novo' in report.suffix and 'Novo' not in report.prefix
+
+
+class PrefixRecordingClient(MockGeminiClient):
+    def __init__(self, context_cache):
+        super().__init__(context_cache=context_cache)
+        self.prompts = []
+
+    def generate_content(self, prompt, media_files=None):
+        self.prompts.append(prompt)
+        return super().generate_content(prompt, media_files)
+
+
+def test_engine_reports_tokens_saved(template_dirs):
+    cache = LocalContextCache()
+    client = PrefixRecordingClient(cache)
+    engine = AIEngine(client, AsyncMockGeminiClient(context_cache=cache))
+
+    first = engine.generate_proposal('Cliente com site lento')
+    assert first['tokens_saved'] == 0
+    second = engine.generate_proposal('Outro cliente')
+    assert second['tokens_saved'] > 0
+    assert cache.registrations == 2  # um prefixo para o híbrido e outro para o relatório
+    # O mock recebe o prompt completo, com o prefixo resolvido pelo handle.
+    assert config.BUSINESS_INFO['name'] in client.prompts[-1]
+
+    result = asyncio.run(engine.generate_proposal_async('Mais um cliente'))
+    assert result['tokens_saved'] == second['tokens_saved']
+
+
+def test_engine_without_context_cache_saves_nothing(template_dirs):
+    engine = AIEngine(MockGeminiClient(), AsyncMockGeminiClient())
+    assert engine.generate_proposal('Cliente')['tokens_saved'] == 0
+
+
+def test_stream_done_event_reports_tokens_saved(template_dirs):
+    cache = LocalContextCache()
+    engine = AIEngine(MockGeminiClient(), AsyncMockGeminiClient(context_cache=cache))
+
+    async def done_payload():
+        async for event, payload in engine.stream_proposal('Cliente'):
+            if event == 'done':
+                return payload
+
+    assert asyncio.run(done_payload())['tokens_saved'] == 0
+    assert asyncio.run(done_payload())['tokens_saved'] > 0
+
+
+def test_caching_client_forwards_prefix_and_keys_on_full_prompt():
+    cache = LocalContextCache()
+    inner = MockGeminiClient(context_cache=cache)
+    client = CachingGeminiClient(inner)
+    parts = PromptParts('prefixo ', 'sufixo')
+    first = client.generate_with_prefix(parts.prefix, parts.suffix)
+    assert client.generate_with_prefix(parts.prefix, parts.suffix) == first
+    assert client.generate_content(parts.text) == first
+    assert cache.registrations == 1
@@ -0,0 +1,142 @@
+import asyncio
+from unittest.mock import Mock
+
+import pytest
+
+from backend.ai_engine import AIEngine
+from backend.gemini_client import AsyncMockGeminiClient, RealGeminiClient
+from backend.resilience import (CircuitBreaker, CircuitOpenError, GeminiError, GeminiGuard,
+                                GeminiUnavailableError, RateLimiter, RateLimitExceeded)
+
+
+class ResourceExhausted(Exception):
+    """Mesmo nome da exceção de quota do google.api_core."""
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _guard(clock=None, **kwargs):
+    clock = clock or FakeClock()
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=10**6, clock=clock)
+    guard = GeminiGuard(limiter, CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=clock), **kwargs)
+    guard.backoff = lambda attempt: 0
+    return guard
+
+
+def test_rate_limiter_rejects_when_wait_exceeds_max():
+    clock = FakeClock()
+    limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=10**6, max_wait=10, clock=clock)
+    limiter.acquire()
+    limiter.acquire()
+    # A próxima requisição teria que esperar 30s (2 por minuto).
+    with pytest.raises(RateLimitExceeded) as exc:
+        limiter.acquire()
+    assert exc.value.retry_after == pytest.approx(30)
+    assert limiter.state()['rejected'] == 1
+
+    clock.now += 30
+    limiter.acquire()
+
+
+def test_rate_limiter_counts_prompt_tokens():
+    limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=600, max_wait=5, clock=FakeClock())
+    limiter.acquire(tokens=600)
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire(tokens=100)
+
+
+def test_retries_only_retryable_errors():
+    guard = _guard(max_retries=3)
+    calls = Mock(side_effect=[ResourceExhausted('429'), ResourceExhausted('429'), 'ok'])
+    assert guard.call(calls) == 'ok'
+    assert calls.call_count == 3
+
+    bad_request = Mock(side_effect=ValueError('prompt inválido'))
+    with pytest.raises(GeminiError) as exc:
+        guard.call(bad_request)
+    assert not isinstance(exc.value, GeminiUnavailableError)
+    assert bad_request.call_count == 1
+
+
+def test_circuit_breaker_opens_and_recovers():
+    clock = FakeClock()
+    guard = _guard(clock, max_retries=0)
+    failing = Mock(side_effect=ConnectionError('down'))
+    for _ in range(3):
+        with pytest.raises(GeminiUnavailableError):
+            guard.call(failing)
+
+    with pytest.raises(CircuitOpenError):
+        guard.call(Mock(return_value='ok'))
+    assert failing.call_count == 3
+    assert guard.state()['circuit_breaker']['status'] == 'open'
+
+    clock.now += 10
+    assert guard.call(Mock(return_value='ok')) == 'ok'
+    assert guard.state()['circuit_breaker']['status'] == 'closed'
+
+
+def test_cancelled_half_open_trial_frees_the_slot():
+    clock = FakeClock()
+    guard = _guard(clock, max_retries=0)
+    for _ in range(3):
+        with pytest.raises(GeminiUnavailableError):
+            guard.call(Mock(side_effect=ConnectionError('down')))
+    clock.now += 10
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hangs():
+            started.set()
+            await asyncio.sleep(60)
+
+        trial = asyncio.ensure_future(guard.call_async(hangs))
+        await started.wait()
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+        async def ok():
+            return 'ok'
+        return await guard.call_async(ok)
+
+    assert asyncio.run(scenario()) == 'ok'
+    assert guard.state()['circuit_breaker']['status'] == 'closed'
+
+
+def test_real_client_errors_do_not_save_templates(template_dirs):
+    client = RealGeminiClient(api_key='k', guard=_guard(max_retries=1))
+    client.model = Mock()
+    client.model.generate_content.side_effect = ResourceExhausted('quota')
+
+    engine = AIEngine(client, AsyncMockGeminiClient())
+    with pytest.raises(GeminiUnavailableError):
+        engine.generate_proposal('Cliente')
+    assert client.model.generate_content.call_count == 2
+    assert list((template_dirs / 'ai_templates').iterdir()) == []
+
+
+def test_async_real_client_retries(template_dirs):
+    from backend.gemini_client import AsyncRealGeminiClient
+
+    client = AsyncRealGeminiClient(api_key='k', guard=_guard())
+    response = Mock(text='{"title": "T", "body": "B"}')
+    client.model = Mock()
+    client.model.generate_content_async = Mock(side_effect=[ResourceExhausted('429'), _done(response), _done(response)])
+
+    engine = AIEngine(Mock(), client)
+    result = asyncio.run(engine.generate_proposal_async('Cliente'))
+    assert result['proposal'] == 'B'
+
+
+def _done(value):
+    async def coro():
+        return value
+    return coro()
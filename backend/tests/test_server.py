@@ -1,5 +1,6 @@
 from fastapi.testclient import TestClient
 
+from backend import template_manager
 from backend.server import app
 
 
@@ -88,3 +89,140 @@ def test_templates_endpoint():
     assert 'HIGH_TICKET' in data
     # variants present
     assert 'variants' in data['HIGH_TICKET'] and isinstance(data['HIGH_TICKET']['variants'], list)
+
+
+def test_templates_library_pagination_and_etag(template_dirs):
+    full = client.get('/templates')
+    assert full.status_code == 200
+    assert [t['name'] for t in full.json()['human_adm']] == ['01_Otimizacao_de_Trafego.json', '02_Auditoria_Visual.json']
+    etag = full.headers['etag']
+
+    page = client.get('/templates', params={'summary': 'true', 'limit': 1})
+    data = page.json()
+    assert data['total'] == 2 and data['next_cursor']
+    assert set(data['items'][0]) == {'type', 'filename', 'name', 'title', 'subject', 'usage_count'}
+    rest = client.get('/templates', params={'summary': 'true', 'cursor': data['next_cursor']}).json()
+    assert [i['title'] for i in data['items'] + rest['items']] == ['Otimizacao de Trafego', 'Auditoria Visual']
+
+    assert client.get('/templates', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/templates', params={'limit': 0}).status_code == 400
+    assert client.get('/templates', params={'cursor': '%%%'}).status_code == 400
+
+    body = client.get('/templates/human_adm/02_Auditoria_Visual.json')
+    assert body.status_code == 200 and body.json()['title'] == 'Auditoria Visual'
+    assert client.get('/templates/ai/inexistente.json').status_code == 404
+
+    # Usage changes only the summary's ETag, which carries the usage counts.
+    summary_etag = page.headers['etag']
+    template_manager.increment_template_usage('02_Auditoria_Visual.json')
+    template_manager.flush_usage_data()
+    assert client.get('/templates', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/templates', params={'summary': 'true', 'limit': 1},
+                      headers={'If-None-Match': summary_etag}).status_code == 200
+
+    client.post('/templates/human', json={'name': 'Novo Template', 'content': 'texto'})
+    assert client.get('/templates', headers={'If-None-Match': etag}).status_code == 200
+
+
+
+def test_top_templates_endpoint(template_dirs):
+    from backend import template_manager
+    for _ in range(2):
+        template_manager.increment_template_usage('02_Auditoria_Visual.json')
+    template_manager.increment_template_usage('01_Otimizacao_de_Trafego.json')
+    template_manager.flush_usage_data()
+
+    data = client.get('/templates/top', params={'n': 1, 'days': 3}).json()
+    assert data['templates'] == [{'filename': '02_Auditoria_Visual.json', 'count': 2}]
+    assert [d['count'] for d in data['daily']] == [0, 0, 3]
+    assert client.get('/templates/top', params={'days': 0}).status_code == 400
+
+def test_generate_proposal_stream_endpoint(template_dirs):
+    form = {'nome': 'Ana', 'empresa': 'Emp', 'nicho': 'Moda', 'onde': 'Instagram',
+            'problems': '["site lento"]'}
+    with client.stream('POST', '/generate-proposal/stream', data=form) as r:
+        assert r.status_code == 200
+        assert r.headers['content-type'].startswith('text/event-stream')
+        body = ''.join(r.iter_text())
+
+    events = [block.split('\n') for block in body.strip().split('\n\n')]
+    names = [lines[0][len('event: '):] for lines in events]
+    assert names[0] == 'proposal'
+    assert names[-1] == 'done'
+    import json
+    done = json.loads(events[-1][1][len('data: '):])
+    assert done['proposal'].startswith('[Proposta Mock]')
+
+
+def test_generate_proposal_accepts_media_files(template_dirs, monkeypatch):
+    from backend.media import MediaSpool
+    monkeypatch.setattr('backend.server.media_spool', MediaSpool(str(template_dirs / 'spool')))
+    form = {'nome': 'Ana', 'empresa': 'Emp', 'nicho': 'Moda', 'onde': 'Instagram', 'problems': '[]'}
+    files = [('media_files', ('tela.png', b'\x89PNG\r\n\x1a\n' + b'\x00' * 100, 'image/png'))]
+    r = client.post('/generate-proposal', data=form, files=files)
+    assert r.status_code == 200
+    assert 'com análise de 1 arquivos de mídia' in r.json()['proposal']
+
+
+def test_generate_proposal_fast_mode():
+    form = {'nome': 'Ana', 'empresa': 'Emp', 'nicho': 'Moda', 'onde': 'Instagram',
+            'problems': '["site lento"]', 'mode': 'fast', 'template_id': 'AUDITORIA_VISUAL', 'variant': 'formal'}
+    r = client.post('/generate-proposal', data=form)
+    assert r.status_code == 200
+    data = r.json()
+    assert data['mode'] == 'fast' and data['variant'] == 'formal'
+    assert data['proposal'].startswith('Prezado Ana,') and 'site lento' in data['proposal']
+    assert client.post('/generate-proposal', data=dict(form, variant='nenhuma')).status_code == 400
+
+
+def test_render_bulk_endpoint():
+    import json
+    leads = '\n'.join(json.dumps({'id': str(i), 'nome': f'Lead {i}', 'empresa': 'E', 'nicho': 'N',
+                                  'onde': 'O', 'problems': ['site lento']}) for i in range(3))
+    r = client.post('/render/bulk', files={'file': ('leads.jsonl', leads, 'application/x-ndjson')},
+                    data={'variants': '["default", "conversational"]', 'template_id': 'OTIMIZACAO_TRAFEGO'})
+    assert r.status_code == 200
+    records = [json.loads(line) for line in r.text.splitlines()]
+    assert [(rec['id'], rec['variant']) for rec in records] == [
+        (str(i), v) for i in range(3) for v in ('default', 'conversational')]
+    assert client.post('/render/bulk', files={'file': ('leads.jsonl', leads, 'application/x-ndjson')},
+                       data={'template_id': 'NAO_EXISTE'}).status_code == 400
+    for bad in ('"default"', '{"default": 1}', '[1]', 'default'):
+        r = client.post('/render/bulk', files={'file': ('leads.jsonl', leads, 'application/x-ndjson')},
+                        data={'variants': bad})
+        assert r.status_code == 400, bad
+
+
+def test_generate_proposals_batch_endpoint(template_dirs):
+    import json
+    leads = '\n'.join(json.dumps({'id': str(i), 'nome': f'Lead {i}', 'empresa': 'E', 'nicho': 'N',
+                                  'onde': 'O', 'problems': ['site lento']}) for i in range(5))
+    r = client.post('/generate-proposals/batch',
+                    files={'file': ('leads.jsonl', leads, 'application/x-ndjson')},
+                    data={'concurrency': '2', 'completed_ids': '["0"]'})
+    assert r.status_code == 200
+    records = [json.loads(line) for line in r.text.splitlines()]
+    assert sorted(rec['id'] for rec in records) == ['1', '2', '3', '4']
+    assert all(rec['status'] == 'ok' for rec in records)
+
+
+def test_generate_proposals_batch_rejects_bad_file():
+    r = client.post('/generate-proposals/batch', files={'file': ('leads.csv', 'nome\nAna\n', 'text/csv')})
+    assert r.status_code == 400
+
+
+def test_generate_proposal_sheds_load_when_rate_limited(monkeypatch):
+    from backend.resilience import CircuitBreaker, GeminiGuard, RateLimiter
+    limiter = RateLimiter(requests_per_minute=1, tokens_per_minute=10**6, max_wait=5)
+    limiter.acquire()
+    limiter.requests.reserve(1)  # fila já comprometida: a próxima espera ~60s
+    monkeypatch.setattr('backend.server.get_gemini_guard', lambda: GeminiGuard(limiter, CircuitBreaker()))
+
+    form = {'nome': 'Ana', 'empresa': 'Emp', 'nicho': 'Moda', 'onde': 'Instagram', 'problems': '[]'}
+    r = client.post('/generate-proposal', data=form)
+    assert r.status_code == 503
+    assert int(r.headers['retry-after']) > 5
+
+    status = client.get('/gemini/status').json()
+    assert status['circuit_breaker']['status'] == 'closed'
+    assert status['rate_limiter']['wait_seconds'] > 5
@@ -0,0 +1,35 @@
+"""Perfil de importação: o servidor e o CLI não devem carregar o SDK do modelo nem outras dependências pesadas."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Folga generosa para máquinas lentas; a checagem principal é a dos módulos proibidos.
+IMPORT_TIME_BUDGET = float(os.getenv('IMPORT_TIME_BUDGET', '3.0'))
+
+
+def _import_profile(module):
+    """Tempo acumulado (em segundos) de cada módulo carregado por `import module`, via `-X importtime`."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        profile[name.strip()] = int(cumulative) / 1e6
+    return profile
+
+
+@pytest.mark.parametrize('module, forbidden', [
+    ('backend.server', ('google.generativeai', 'magic', 'uvicorn')),
+    ('backend.cli', ('google.generativeai', 'magic', 'fastapi')),
+])
+def test_import_is_lazy_and_fast(module, forbidden):
+    profile = _import_profile(module)
+    loaded = sorted(name for name in profile
+                    if any(name == prefix or name.startswith(prefix + '.') for prefix in forbidden))
+    assert loaded == []
+    assert profile[module] < IMPORT_TIME_BUDGET, f'{module} levou {profile[module]:.2f}s para importar'
@@ -0,0 +1,126 @@
+import json
+import os
+
+from backend.ai_engine import AIEngine, build_client_context
+from backend.gemini_client import AsyncMockGeminiClient, MockGeminiClient
+from backend.template_index import TemplateIndex, tokenize
+from backend.template_store import get_template_store
+
+
+def _template(title, body):
+    return {'title': title, 'subject': title, 'body': body}
+
+
+def test_tokenize_strips_accents_and_stopwords():
+    assert tokenize('Nome do Cliente: Clínica Odontológica de São Paulo') == ['clinica', 'odontologica', 'sao', 'paulo']
+
+
+def test_search_ranks_by_similarity():
+    index = TemplateIndex()
+    index.add(('human', 'dentista.json'), _template('Clínica odontológica', 'Agenda cheia para dentistas e clínicas odontológicas.'))
+    index.add(('human', 'restaurante.json'), _template('Restaurante', 'Mais pedidos de delivery para seu restaurante.'))
+    index.add(('ai', 'loja.json'), _template('Loja virtual', 'Reduza o abandono de carrinho da loja virtual.'))
+
+    ranked = index.search('Nicho de Atuação: clínica odontológica', k=2)
+    assert [t['title'] for t, _ in ranked][0] == 'Clínica odontológica'
+    assert ranked[0][1] > ranked[1][1]
+
+
+def test_usage_breaks_ties():
+    index = TemplateIndex()
+    index.add(('ai', 'a.json'), _template('A', 'marketing digital'))
+    index.add(('ai', 'b.json'), _template('B', 'marketing digital'))
+    index.record_usage('b.json', 10)
+    assert index.search('marketing digital', k=1)[0][0]['title'] == 'B'
+
+
+def test_remove_and_reuse_rows():
+    index = TemplateIndex()
+    for i in range(100):
+        index.add(('ai', f'{i}.json'), _template(f'T{i}', f'assunto{i}'))
+    assert index.remove(('ai', '5.json'))
+    assert not index.remove(('ai', '5.json'))
+    index.add(('ai', 'novo.json'), _template('Novo', 'assunto5'))
+
+    assert len(index) == 100
+    assert ('ai', '5.json') not in index
+    assert index.search('assunto5', k=1)[0][0]['title'] == 'Novo'
+
+
+def test_sync_applies_only_the_difference():
+    index = TemplateIndex()
+    a, b, c = _template('A', 'um'), _template('B', 'dois'), _template('C', 'tres')
+    index.sync({('ai', 'a.json'): a, ('ai', 'b.json'): b})
+    index.sync({('ai', 'b.json'): b, ('ai', 'c.json'): c}, {'c.json': 3})
+
+    assert len(index) == 2
+    assert ('ai', 'a.json') not in index
+    assert index.search('tres', k=1)[0][0] is c
+
+
+def test_engine_picks_relevant_inspiration(template_dirs):
+    engine = AIEngine(MockGeminiClient(), AsyncMockGeminiClient())
+    context = build_client_context('Ana', 'Loja', 'E-commerce', 'Google', None, ['auditoria visual do site'])
+    assert engine._select_inspiration_templates(context)[0]['title'] == 'Auditoria Visual'
+
+
+def test_engine_index_follows_store_changes(template_dirs):
+    store = get_template_store()
+    engine = AIEngine(MockGeminiClient(), AsyncMockGeminiClient(), template_store=store)
+    engine.warm_index()
+    assert len(engine.template_index) == 2
+
+    filename = store.save_ai_template(_template('Pet shop', 'Banho e tosa com agenda online para pet shops.'))
+    assert ('ai', filename) in engine.template_index
+    assert engine._select_inspiration_templates('pet shop banho tosa')[0]['title'] == 'Pet shop'
+
+    store.delete_template('ai', filename)
+    assert ('ai', filename) not in engine.template_index
+
+    # Alterações feitas por fora do store são percebidas pela versão da biblioteca.
+    with open(template_dirs / 'ai_templates' / 'Externo.json', 'w', encoding='utf-8') as f:
+        json.dump(_template('Externo', 'academia de ginástica'), f)
+    assert engine._select_inspiration_templates('academia ginástica')[0]['title'] == 'Externo'
+
+
+def test_engine_index_sees_external_edits_that_keep_the_count(template_dirs):
+    engine = AIEngine(MockGeminiClient(), AsyncMockGeminiClient(), template_store=get_template_store())
+    engine.warm_index()
+    path = template_dirs / 'human_templates' / '02_Auditoria_Visual.json'
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(_template('Auditoria Visual', 'clínica veterinária com vacinas em dia'), f)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert engine._select_inspiration_templates('veterinária vacinas')[0]['title'] == 'Auditoria Visual'
+    assert len(engine.template_index) == 2
+
+
+def test_sync_skips_unchanged_copies():
+    index = TemplateIndex()
+    vectorized = []
+    original = index.vectorize
+    index.vectorize = lambda text: vectorized.append(text) or original(text)
+    index.sync({('ai', 'a.json'): _template('A', 'um')})
+    index.sync({('ai', 'a.json'): _template('A', 'um')})
+    assert len(vectorized) == 1
+
+
+def test_selection_reads_the_library_only_when_templates_change(template_dirs):
+    store = get_template_store()
+    engine = AIEngine(MockGeminiClient(), AsyncMockGeminiClient(), template_store=store)
+    engine.warm_index()
+    loads = []
+    view = store.templates_view
+    store.templates_view = lambda: loads.append(1) or view()
+    try:
+        store.increment_template_usage('02_Auditoria_Visual.json')
+        store.flush()
+        assert engine._select_inspiration_templates('auditoria visual')[0]['title'] == 'Auditoria Visual'
+        assert loads == []
+
+        store.save_ai_template(_template('Pet shop', 'Banho e tosa com agenda online para pet shops.'))
+        engine._select_inspiration_templates('pet shop')
+        assert len(loads) == 1
+    finally:
+        del store.templates_view
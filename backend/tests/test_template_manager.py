@@ -0,0 +1,176 @@
+import json
+import os
+
+from backend import template_manager
+from backend.usage_recorder import MAX_ANALYSES
+
+
+def test_get_all_templates_splits_categories(template_dirs, monkeypatch):
+    monkeypatch.setattr(template_manager, 'NUM_ADM_TEMPLATES', 1)
+    template_manager.save_ai_template({'title': 'Nova IA', 'body': 'corpo'})
+
+    templates = template_manager.get_all_templates()
+    assert [t['title'] for t in templates['human_adm']] == ['Otimizacao de Trafego']
+    assert [t['title'] for t in templates['human']] == ['Auditoria Visual']
+    assert [t['filename'] for t in templates['ai']] == ['Nova_IA.json']
+
+
+def test_get_all_templates_is_cached(template_dirs, monkeypatch):
+    template_manager.get_all_templates()
+
+    loads = []
+    original = template_manager._load_template_file
+    monkeypatch.setattr(template_manager, '_load_template_file', lambda *a: loads.append(a) or original(*a))
+
+    template_manager.get_all_templates()
+    assert loads == []
+
+    # Saves and deletes update the cache in place instead of reloading the library.
+    name = template_manager.save_ai_template({'title': 'Cacheado', 'body': 'x'})
+    assert name in [t['filename'] for t in template_manager.get_all_templates()['ai']]
+    template_manager.delete_template('ai', name)
+    assert template_manager.get_all_templates()['ai'] == []
+    assert loads == []
+
+
+def test_get_all_templates_sees_external_changes(template_dirs, monkeypatch):
+    monkeypatch.setattr(template_manager, 'CACHE_REVALIDATE_INTERVAL', 0)
+    template_manager.get_all_templates()
+
+    human_dir = template_dirs / 'human_templates'
+    path = human_dir / '01_Otimizacao_de_Trafego.json'
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'title': 'Editado', 'body': 'novo corpo, mais longo'}, f)
+    os.remove(human_dir / '02_Auditoria_Visual.json')
+
+    titles = [t['title'] for t in template_manager.get_all_templates()['human_adm']]
+    assert titles == ['Editado']
+
+
+def test_get_all_templates_returns_copies(template_dirs):
+    template_manager.get_all_templates()['human_adm'].clear()
+    assert len(template_manager.get_all_templates()['human_adm']) == 2
+
+
+def test_mutating_returned_templates_does_not_touch_the_cache(template_dirs):
+    template = template_manager.get_all_templates()['human_adm'][0]
+    template['title'] = 'Alterado'
+    template['tags'] = ['x']
+    fresh = template_manager.get_all_templates()['human_adm'][0]
+    assert fresh['title'] == 'Otimizacao de Trafego' and 'tags' not in fresh
+
+    report = template_manager._find_template(fresh['filename'])
+    report['body'] = 'outro'
+    assert template_manager._find_template(fresh['filename'])['body'] == fresh['body']
+
+
+def test_ulid_filenames_keep_titles_in_the_index(template_dirs, monkeypatch):
+    monkeypatch.setattr(template_manager, 'FILENAME_SCHEME', 'ulid')
+    names = [template_manager.save_ai_template({'title': 'Mesmo Titulo', 'body': f'corpo {i} ' * (i + 1)})
+             for i in range(3)]
+
+    assert all(template_manager.is_ulid_filename(n) for n in names)
+    assert names == sorted(names) and len(set(names)) == 3
+    assert template_manager.find_templates_by_title('Mesmo Titulo') == [
+        {'type': 'ai', 'filename': n} for n in names]
+
+    template_manager.increment_template_usage(names[1])
+    report = template_manager.get_template_report(names[1])
+    assert report['usage_count'] == 1 and report['content'].startswith('corpo 1')
+
+    template_manager.delete_template('ai', names[1])
+    assert [m['filename'] for m in template_manager.find_templates_by_title('Mesmo Titulo')] == [names[0], names[2]]
+
+
+def test_migrate_filenames_keeps_order_and_usage(template_dirs, monkeypatch):
+    monkeypatch.setattr(template_manager, 'NUM_ADM_TEMPLATES', 1)
+    template_manager.increment_template_usage('02_Auditoria_Visual.json')
+    before = template_manager.get_all_templates()
+
+    renames = template_manager.migrate_filenames()
+    assert [old for old, _ in renames] == ['01_Otimizacao_de_Trafego.json', '02_Auditoria_Visual.json']
+    assert template_manager.migrate_filenames() == []
+
+    after = template_manager.get_all_templates()
+    assert [t['title'] for t in after['human_adm']] == [t['title'] for t in before['human_adm']]
+    assert [t['title'] for t in after['human']] == [t['title'] for t in before['human']]
+    new_name = dict(renames)['02_Auditoria_Visual.json']
+    assert template_manager.get_usage_counts() == {new_name: 1}
+    assert template_manager.find_templates_by_title('Auditoria Visual') == [{'type': 'human', 'filename': new_name}]
+
+
+def test_migrated_ulids_carry_the_file_mtime(template_dirs):
+    human_dir = template_dirs / 'human_templates'
+    old, older = 1_600_000_000, 1_500_000_000
+    os.utime(human_dir / '01_Otimizacao_de_Trafego.json', (old, old))
+    # Older than the file before it: its ID must still sort after that one's.
+    os.utime(human_dir / '02_Auditoria_Visual.json', (older, older))
+
+    renames = dict(template_manager.migrate_filenames())
+    first = renames['01_Otimizacao_de_Trafego.json']
+    second = renames['02_Auditoria_Visual.json']
+    assert template_manager._decode_ulid(first[:26]) >> 80 == old * 1000
+    assert first < second
+    assert template_manager._decode_ulid(second[:26]) >> 80 == old * 1000
+
+
+def _hammer_store(human_dir, ai_dir, data_file, worker, rounds):
+    # Runs in a separate process: fresh module state, same files on disk.
+    template_manager.HUMAN_TEMPLATES_DIR = human_dir
+    template_manager.AI_TEMPLATES_DIR = ai_dir
+    template_manager.DATA_FILE = data_file
+    template_manager.USAGE_FLUSH_INTERVAL = 0
+    for i in range(rounds):
+        template_manager.save_human_template({'title': 'Disputado', 'body': f'{worker}-{i}'})
+        template_manager.increment_template_usage('compartilhado.json')
+        template_manager.save_ai_analysis('compartilhado.json', f'{worker}-{i}')
+        template_manager.flush_usage_data()
+
+
+def test_store_is_safe_across_processes(template_dirs):
+    import multiprocessing
+
+    human_dir = template_dirs / 'human_templates'
+    workers, rounds = 4, 15
+    ctx = multiprocessing.get_context('spawn')
+    processes = [ctx.Process(target=_hammer_store,
+                             args=(str(human_dir), template_manager.AI_TEMPLATES_DIR,
+                                   template_manager.DATA_FILE, worker, rounds))
+                 for worker in range(workers)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join(60)
+        assert p.exitcode == 0
+
+    bodies = []
+    for name in os.listdir(human_dir):
+        if name.startswith('Disputado'):
+            with open(human_dir / name, encoding='utf-8') as f:
+                bodies.append(json.load(f)['body'])
+    expected = {f'{w}-{i}' for w in range(workers) for i in range(rounds)}
+    assert sorted(bodies) == sorted(expected)
+    assert [n for n in os.listdir(human_dir) if n.startswith('.tmp-')] == []
+
+    usage = template_manager._load_usage_data()['compartilhado.json']
+    assert usage['usage_count'] == workers * rounds
+    assert len(usage['ai_analysis']) == min(len(expected), MAX_ANALYSES)
+    assert set(usage['ai_analysis']) <= expected
+
+
+def test_readers_do_not_wait_for_the_directory_lock(template_dirs):
+    import threading
+    import time
+
+    template = {'title': 'Novo', 'subject': 'Assunto', 'body': 'corpo inédito para o teste de trava'}
+    with template_manager._directory_lock(template_manager.AI_TEMPLATES_DIR):
+        saver = threading.Thread(target=template_manager.save_or_match_ai_template, args=(template,))
+        saver.start()
+        time.sleep(0.1)
+        # The saver is blocked on the file lock, not holding the in-memory cache.
+        reader = threading.Thread(target=template_manager.get_all_templates)
+        reader.start()
+        reader.join(2)
+        assert not reader.is_alive()
+    saver.join(5)
+    assert any(t['title'] == 'Novo' for t in template_manager.get_all_templates()['ai'])
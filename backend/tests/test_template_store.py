@@ -0,0 +1,239 @@
+import json
+
+import pytest
+
+from backend import template_manager
+from backend.template_store import FileSystemTemplateStore, SQLiteTemplateStore, migrate_filesystem_to_sqlite
+
+
+@pytest.fixture(params=['filesystem', 'sqlite'])
+def store(request, template_dirs):
+    if request.param == 'filesystem':
+        yield FileSystemTemplateStore()
+    else:
+        db_store = SQLiteTemplateStore(str(template_dirs / 'templates.db'))
+        db_store.save_human_template({'title': 'Otimizacao de Trafego', 'body': 'Corpo A'})
+        db_store.save_human_template({'title': 'Auditoria Visual', 'body': 'Corpo B'})
+        yield db_store
+        db_store.close()
+
+
+def test_save_list_and_delete(store):
+    name = store.save_ai_template({'title': 'Proposta Nova', 'subject': 's', 'body': 'corpo'})
+    duplicate = store.save_ai_template({'title': 'Proposta Nova', 'subject': 's', 'body': 'outro'})
+    assert name == 'Proposta_Nova.json'
+    assert duplicate == 'Proposta_Nova_1.json'
+
+    templates = store.get_all_templates()
+    assert len(templates['human_adm']) == 2
+    assert [t['filename'] for t in templates['ai']] == [name, duplicate]
+
+    store.delete_template('ai', name)
+    assert [t['filename'] for t in store.get_all_templates()['ai']] == [duplicate]
+    with pytest.raises(FileNotFoundError):
+        store.delete_template('ai', name)
+
+
+def test_returned_templates_can_be_mutated_safely(store):
+    templates = store.get_all_templates()
+    templates['human_adm'][0]['title'] = 'Alterado'
+    templates['human_adm'].pop()
+    fresh = store.get_all_templates()['human_adm']
+    assert sorted(t['title'] for t in fresh) == ['Auditoria Visual', 'Otimizacao de Trafego']
+
+
+def test_templates_view_is_shared_and_follows_writes(store):
+    view = store.templates_view()
+    assert store.templates_view() is view
+    name = store.save_ai_template({'title': 'Nova', 'body': 'corpo novo'})
+    assert [t['filename'] for t in store.templates_view()['ai']] == [name]
+    assert view['ai'] == []
+
+
+def test_lookups_read_the_view_and_copy_only_what_they_return(store, monkeypatch):
+    name = store.save_ai_template({'title': 'Nova', 'body': 'corpo novo', 'tags': ['a']})
+
+    def copy_everything():
+        raise AssertionError('get_all_templates copia a biblioteca inteira')
+    monkeypatch.setattr(store, 'get_all_templates', copy_everything)
+
+    found = store.get_template('ai', name)
+    found['tags'].append('b')
+    page = store.list_templates(template_type='ai', limit=1)
+    page['items'][0]['title'] = 'Alterada'
+    assert store.get_template('ai', name)['tags'] == ['a']
+    assert store.templates_view()['ai'][0]['title'] == 'Nova'
+
+
+def test_usage_and_report(store):
+    name = store.save_ai_template({'title': 'Relatorio', 'body': 'corpo do relatorio'})
+    store.increment_template_usage(name)
+    store.increment_template_usage(name)
+    store.save_ai_analysis(name, 'analise')
+
+    report = store.get_template_report(name)
+    assert report['usage_count'] == 2
+    assert report['ai_analysis'] == ['analise']
+    assert report['content'] == 'corpo do relatorio'
+    assert store.get_template_report('inexistente.json')['usage_count'] == 0
+
+
+def test_list_templates_pages_filters_and_summarizes(store):
+    names = [store.save_ai_template({'title': f'Proposta {i}', 'subject': f'Assunto {i}', 'body': f'corpo {i} ' * i})
+             for i in range(1, 6)]
+    store.increment_template_usage(names[0])
+
+    seen, cursor = [], None
+    while True:
+        page = store.list_templates(limit=2, cursor=cursor)
+        assert page['total'] == 7
+        seen += [(item['type'], item['filename']) for item in page['items']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert [filename for _, filename in seen[2:]] == names
+    assert {t for t, _ in seen} == {'human_adm', 'ai'}
+
+    ai = store.list_templates(template_type='ai', title_prefix='proposta 1', summary=True)
+    assert ai['total'] == 1 and ai['next_cursor'] is None
+    assert ai['items'] == [{'type': 'ai', 'filename': names[0], 'name': names[0], 'title': 'Proposta 1',
+                            'subject': 'Assunto 1', 'usage_count': 1}]
+
+    assert store.get_template('ai', names[1])['body'] == 'corpo 2 corpo 2 '
+    assert store.get_template('human', 'inexistente.json') is None
+    with pytest.raises(ValueError):
+        store.list_templates(cursor='nao-e-um-cursor')
+
+
+def test_library_version_follows_templates_and_usage_version_follows_usage(store):
+    version = store.library_version()
+    assert store.library_version() == version
+    name = store.save_ai_template({'title': 'Versao', 'body': 'corpo'})
+    after_save = store.library_version()
+    assert after_save != version
+
+    usage = store.usage_version()
+    store.increment_template_usage(name)
+    store.flush()
+    assert store.library_version() == after_save
+    assert store.usage_version() != usage
+
+
+BODY = ('Olá! Notei que o site da sua empresa demora para carregar no celular e isso '
+        'afasta clientes. Podemos otimizar as imagens e o código para dobrar a velocidade.')
+
+
+def test_near_duplicate_ai_template_is_not_saved_again(store):
+    name = store.save_ai_template({'title': 'Velocidade', 'body': BODY})
+    again = store.save_ai_template({'title': 'Proposta Híbrida (Fallback)', 'body': BODY + ' Abraços!'})
+    other = store.save_ai_template({'title': 'Outra', 'body': 'Um texto completamente diferente sobre anúncios.'})
+
+    assert again == name
+    assert other != name
+    assert [t['filename'] for t in store.get_all_templates()['ai']] == sorted([name, other])
+
+
+def test_dedupe_merges_usage_into_the_most_used(store):
+    store.dedupe_ai_templates()
+    # Grava duplicados direto, como faria uma versão antiga sem a detecção.
+    if isinstance(store, SQLiteTemplateStore):
+        names = [store._save('ai', {'title': f'Dup {i}', 'body': BODY + '!' * i}) for i in range(3)]
+    else:
+        names = [template_manager._save_template(template_manager.AI_TEMPLATES_DIR,
+                                                 {'title': f'Dup {i}', 'body': BODY + '!' * i}) for i in range(3)]
+    store.increment_template_usage(names[0])
+    for _ in range(3):
+        store.increment_template_usage(names[2])
+    store.save_ai_analysis(names[0], 'analise')
+
+    assert store.dedupe_ai_templates(dry_run=True) == [(names[0], names[2]), (names[1], names[2])]
+    assert len(store.get_all_templates()['ai']) == 3
+
+    store.dedupe_ai_templates()
+    assert [t['filename'] for t in store.get_all_templates()['ai']] == [names[2]]
+    report = store.get_template_report(names[2])
+    assert report['usage_count'] == 4
+    assert report['ai_analysis'] == ['analise']
+    assert store.dedupe_ai_templates() == []
+
+
+def test_sqlite_sees_writes_from_other_connections(tmp_path):
+    first = SQLiteTemplateStore(str(tmp_path / 'templates.db'))
+    second = SQLiteTemplateStore(str(tmp_path / 'templates.db'))
+    assert first.get_all_templates()['ai'] == []
+
+    second.save_ai_template({'title': 'De outro processo', 'body': 'x'})
+    assert [t['title'] for t in first.get_all_templates()['ai']] == ['De outro processo']
+    first.close()
+    second.close()
+
+
+def test_sqlite_save_never_overwrites_a_name_taken_after_the_probe(tmp_path, monkeypatch):
+    store = SQLiteTemplateStore(str(tmp_path / 'templates.db'))
+    assert store.save_human_template({'title': 'Disputado', 'body': 'primeiro'}) == 'Disputado.json'
+    # Simulates another connection inserting the name between the probe and our INSERT.
+    monkeypatch.setattr(store, '_next_suffix', lambda template_type, name, ext: 0)
+    assert store.save_human_template({'title': 'Disputado', 'body': 'segundo'}) == 'Disputado_1.json'
+    bodies = {t['filename']: t['body'] for t in store.get_all_templates()['human_adm']}
+    assert bodies == {'Disputado.json': 'primeiro', 'Disputado_1.json': 'segundo'}
+    store.close()
+
+
+def test_sqlite_new_names_follow_the_highest_suffix(tmp_path):
+    store = SQLiteTemplateStore(str(tmp_path / 'templates.db'))
+    for title in ('Base', 'Base_5', 'Base_Extra', 'Base_7x'):
+        store.save_ai_template({'title': title, 'body': title})
+    assert store.save_ai_template({'title': 'Base', 'body': 'nova'}) == 'Base_6.json'
+    assert store.save_human_template({'title': 'Base', 'body': 'humana'}) == 'Base.json'
+    store.close()
+
+
+def test_migrate_filesystem_to_sqlite(template_dirs):
+    name = template_manager.save_ai_template({'title': 'Migrada', 'body': 'corpo'})
+    template_manager.increment_template_usage(name)
+    template_manager.save_ai_analysis(name, 'analise')
+    template_manager.flush_usage_data()
+
+    db_path = str(template_dirs / 'templates.db')
+    counts = migrate_filesystem_to_sqlite(db_path)
+    assert counts == {'human': 2, 'ai': 1, 'usage': 1}
+    # Re-running the migration must not duplicate anything.
+    migrate_filesystem_to_sqlite(db_path)
+
+    store = SQLiteTemplateStore(db_path)
+    templates = store.get_all_templates()
+    assert [t['filename'] for t in templates['human_adm']] == ['01_Otimizacao_de_Trafego.json', '02_Auditoria_Visual.json']
+    assert [t['filename'] for t in templates['ai']] == [name]
+    report = store.get_template_report(name)
+    assert report['usage_count'] == 1
+    assert report['ai_analysis'] == ['analise']
+    # The rollups come along, so top templates and trends keep their history.
+    assert store.top_templates(5) == [{'filename': name, 'count': 1}]
+    assert store.usage_trend(name, days=1)[-1][1] == 1
+    store.close()
+
+
+def test_analyses_are_capped(store):
+    from backend.usage_recorder import MAX_ANALYSES
+    for i in range(MAX_ANALYSES + 5):
+        store.save_ai_analysis('a.json', f'analise {i}')
+    store.flush()
+    analyses = store.get_template_report('a.json')['ai_analysis']
+    assert len(analyses) == MAX_ANALYSES
+    assert analyses[-1] == f'analise {MAX_ANALYSES + 4}'
+
+
+def test_top_templates_and_trend(store):
+    names = [store.save_ai_template({'title': f'Popular {i}', 'body': f'texto {i} ' * (i + 1)}) for i in range(3)]
+    for name, uses in zip(names, (1, 3, 2)):
+        for _ in range(uses):
+            store.increment_template_usage(name)
+    store.flush()
+
+    assert store.top_templates(2) == [{'filename': names[1], 'count': 3}, {'filename': names[2], 'count': 2}]
+    assert store.usage_trend(days=2)[-1][1] == 6
+    assert store.usage_trend(names[0], days=1)[0][1] == 1
+
+    store.delete_template('ai', names[1])
+    store.flush()
+    assert [e['filename'] for e in store.top_templates()] == [names[2], names[0]]
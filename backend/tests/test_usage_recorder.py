@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from backend import template_manager
+from backend.usage_recorder import MAX_ANALYSES, UsageRecorder
+
+
+def test_increments_are_buffered_until_flush(tmp_path):
+    path = tmp_path / 'usage.json'
+    recorder = UsageRecorder(str(path), flush_interval=0)
+
+    recorder.increment('a.json')
+    recorder.increment('a.json')
+    recorder.add_analysis('a.json', 'boa proposta')
+    assert not path.exists()
+    assert recorder.get('a.json')['usage_count'] == 2
+
+    # A flush only appends events; compacting folds them into the usage file.
+    recorder.flush()
+    assert not path.exists()
+    assert len((tmp_path / 'usage.json.events').read_text().splitlines()) == 3
+    assert recorder.get('a.json')['usage_count'] == 2
+
+    recorder.compact()
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)['templates']
+    assert data['a.json']['usage_count'] == 2
+    assert data['a.json']['ai_analysis'] == ['boa proposta']
+    assert not (tmp_path / 'usage.json.events').exists()
+    assert [p for p in os.listdir(tmp_path) if p.startswith(('.tmp-', 'usage.json.events'))] == []
+
+
+def test_flush_merges_with_existing_file(tmp_path):
+    path = tmp_path / 'usage.json'
+    path.write_text(json.dumps({'a.json': {'usage_count': 5, 'last_used': None, 'ai_analysis': ['x']},
+                                'b.json': {'usage_count': 1, 'last_used': None, 'ai_analysis': []}}))
+    recorder = UsageRecorder(str(path), flush_interval=0)
+
+    recorder.increment('a.json')
+    recorder.forget('b.json')
+    recorder.compact()
+
+    data = json.loads(path.read_text())['templates']
+    assert data['a.json']['usage_count'] == 6
+    assert data['a.json']['ai_analysis'] == ['x']
+    assert 'b.json' not in data
+
+
+def test_concurrent_increments_are_not_lost(tmp_path):
+    recorder = UsageRecorder(str(tmp_path / 'usage.json'), flush_interval=0.01)
+
+    def hammer():
+        for _ in range(200):
+            recorder.increment('a.json')
+
+    threads = [threading.Thread(target=hammer) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    recorder.close()
+
+    data = json.loads((tmp_path / 'usage.json').read_text())['templates']
+    assert data['a.json']['usage_count'] == 1600
+
+
+def test_template_report_sees_unflushed_usage(template_dirs):
+    name = template_manager.save_ai_template({'title': 'Relatorio', 'body': 'corpo'})
+    template_manager.increment_template_usage(name)
+
+    report = template_manager.get_template_report(name)
+    assert report['usage_count'] == 1
+    assert report['content'] == 'corpo'
+
+    template_manager.delete_template('ai', name)
+    assert template_manager.get_template_report(name)['usage_count'] == 0
+
+
+def test_rollups_answer_top_templates_and_trend(tmp_path):
+    recorder = UsageRecorder(str(tmp_path / 'usage.json'), flush_interval=0)
+    now = datetime.now()
+    for _ in range(3):
+        recorder.increment('a.json', when=now)
+    recorder.increment('b.json', when=now)
+    recorder.increment('b.json', when=now - timedelta(days=3))
+    recorder.increment('b.json', when=now - timedelta(days=3))
+    recorder.increment('c.json', when=now - timedelta(days=20))
+    recorder.flush()
+
+    assert recorder.top_templates(2) == [{'filename': 'a.json', 'count': 3}, {'filename': 'b.json', 'count': 3}]
+    assert recorder.top_templates(5, since=now - timedelta(hours=1), until=now + timedelta(hours=1)) == [
+        {'filename': 'a.json', 'count': 3}, {'filename': 'b.json', 'count': 1}]
+
+    recorder.compact()
+    assert [e['filename'] for e in recorder.top_templates(5, since=now - timedelta(days=30))] == [
+        'a.json', 'b.json', 'c.json']
+    trend = recorder.usage_trend('b.json', days=4)
+    assert [count for _, count in trend] == [2, 0, 0, 1]
+    assert trend[-1][0] == now.strftime('%Y-%m-%d')
+
+    recorder.merge('b.json', 'a.json')
+    recorder.forget('c.json')
+    recorder.flush()
+    assert recorder.top_templates(5, since=now - timedelta(days=30)) == [{'filename': 'a.json', 'count': 6}]
+    assert recorder.get('a.json')['usage_count'] == 6
+
+
+def test_compaction_is_crash_safe_and_reads_old_files(tmp_path):
+    path = tmp_path / 'usage.json'
+    path.write_text(json.dumps({'a.json': {'usage_count': 5, 'last_used': None, 'ai_analysis': []}}))
+    recorder = UsageRecorder(str(path), flush_interval=0)
+    recorder.increment('a.json')
+    recorder.flush()
+
+    # A compaction that died after sealing the log: the next one folds it exactly once.
+    sealed = tmp_path / 'usage.json.events.00000000000000000001-1'
+    (tmp_path / 'usage.json.events').rename(sealed)
+    assert UsageRecorder(str(path), flush_interval=0).get('a.json')['usage_count'] == 6
+    recorder.compact()
+    assert not sealed.exists()
+    assert json.loads(path.read_text())['templates']['a.json']['usage_count'] == 6
+
+    # ...and one that died after writing the state but before removing the sealed log.
+    recorder.increment('a.json')
+    recorder.flush()
+    (tmp_path / 'usage.json.events').rename(sealed)
+    data = json.loads(path.read_text())
+    data['templates']['a.json']['usage_count'] += 1
+    data['folded'] = [sealed.name]
+    path.write_text(json.dumps(data))
+    # Readers in that window must not count the sealed log on top of the state.
+    assert UsageRecorder(str(path), flush_interval=0).get('a.json')['usage_count'] == 7
+    recorder.compact()
+    assert UsageRecorder(str(path), flush_interval=0).get('a.json')['usage_count'] == 7
+
+
+def test_analyses_are_capped(tmp_path):
+    recorder = UsageRecorder(str(tmp_path / 'usage.json'), flush_interval=0)
+    for i in range(MAX_ANALYSES + 5):
+        recorder.add_analysis('a.json', f'analise {i}')
+    recorder.compact()
+    analyses = recorder.get('a.json')['ai_analysis']
+    assert len(analyses) == MAX_ANALYSES
+    assert analyses[-1] == f'analise {MAX_ANALYSES + 4}'
@@ -0,0 +1,152 @@
+import asyncio
+import json
+
+from backend.ai_engine import AIEngine
+from backend.gemini_client import AsyncMockGeminiClient, MockGeminiClient
+from backend.warm_pool import WarmPool, pool_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_pool_key_normalizes_niche_and_problems():
+    assert pool_key(' Odontologia ', ['Site lento', 'sem  SEO']) == pool_key('odontologia', ['sem seo', 'site lento'])
+    assert pool_key('odontologia', ['site lento']) != pool_key('odontologia', [])
+
+
+def test_pool_is_capped_and_keeps_recently_used():
+    pool = WarmPool(capacity=2)
+    pool.put('a', {'n': 1})
+    pool.put('b', {'n': 2})
+    assert pool.get('a') == {'n': 1}
+    pool.put('c', {'n': 3})
+    assert pool.get('b') is None
+    assert pool.get('a') and pool.get('c')
+    assert len(pool) == 2
+
+
+def test_stale_entries_are_evicted():
+    clock = FakeClock()
+    pool = WarmPool(max_age=100, clock=clock)
+    pool.put('a', {'n': 1})
+    clock.now = 50
+    assert pool.get('a') is not None
+    clock.now = 151
+    assert pool.get('a') is None
+    assert len(pool) == 0
+
+
+def test_candidates_follow_demand_and_skip_pooled():
+    pool = WarmPool()
+    for key, count in (('raro', 1), ('comum', 5), ('medio', 3)):
+        for _ in range(count):
+            pool.record(key)
+    assert pool.candidates() == ['comum', 'medio']
+    pool.put('comum', {})
+    assert pool.candidates() == ['medio']
+
+
+def test_budget_limits_generations_per_hour():
+    clock = FakeClock()
+    pool = WarmPool(budget_per_hour=2, clock=clock)
+    assert pool.try_spend() and pool.try_spend()
+    assert not pool.try_spend()
+    clock.now = 3601
+    assert pool.try_spend()
+
+
+def test_idle_and_hit_rate():
+    clock = FakeClock()
+    pool = WarmPool(idle_seconds=30, clock=clock)
+    assert pool.idle()
+    pool.record('a')
+    assert not pool.idle()
+    clock.now = 30
+    assert pool.idle()
+
+    pool.put('a', {})
+    pool.get('a')
+    pool.get('b')
+    assert pool.hit_rate() == 0.5
+    assert pool.stats()['hits'] == 1
+
+
+class PlaceholderClient(AsyncMockGeminiClient):
+    """Devolve um template com marcadores no híbrido e o relatório do mock."""
+
+    def __init__(self, body='Olá, [NOME_DO_PROFISSIONAL]! A [NOME_DA_EMPRESA] pode resolver [PROBLEMAS].'):
+        super().__init__()
+        self.body = body
+        self.calls = 0
+
+    async def generate_content(self, prompt, media_files=None):
+        self.calls += 1
+        if 'relatório conciso' in prompt:
+            return await super().generate_content(prompt, media_files)
+        return json.dumps({'title': 'Pré-gerado', 'subject': 'Assunto', 'body': self.body, 'ideal_for': 'x'})
+
+
+LEAD = {'nome': 'Ana', 'empresa': 'Clínica Sorriso', 'nicho': 'Odontologia', 'problems': ['site lento']}
+
+
+def _engine(client, **pool_kwargs):
+    return AIEngine(MockGeminiClient(), client, warm_pool=WarmPool(**pool_kwargs))
+
+
+def test_popular_niche_is_served_from_pool_with_local_personalization(template_dirs):
+    client = PlaceholderClient()
+    engine = _engine(client)
+    for _ in range(2):
+        asyncio.run(engine.generate_proposal_async('contexto', lead=LEAD))
+    assert asyncio.run(engine.refill_warm_pool()) == 1
+
+    calls = client.calls
+    result = asyncio.run(engine.generate_proposal_async('contexto', lead=dict(LEAD, nome='Bia')))
+    assert client.calls == calls
+    assert result['warm_pool'] is True
+    assert result['proposal'] == 'Olá, Bia! A Clínica Sorriso pode resolver site lento.'
+    assert engine.warm_pool.stats()['hits'] == 1
+    # O template servido entra na biblioteca de IA como os gerados na hora.
+    assert any(t.get('title') == 'Pré-gerado' for t in engine._load_all_templates()['ai'])
+
+    sync_result = engine.generate_proposal('contexto', lead=LEAD)
+    assert sync_result['proposal'].startswith('Olá, Ana!')
+
+
+def test_template_without_placeholders_is_not_pooled(template_dirs):
+    engine = _engine(PlaceholderClient(body='Olá! Texto sem marcadores.'))
+    for _ in range(2):
+        engine.warm_pool.record(pool_key(LEAD['nicho'], LEAD['problems']))
+    assert asyncio.run(engine.refill_warm_pool()) == 0
+    assert len(engine.warm_pool) == 0
+
+
+def test_refill_respects_budget(template_dirs):
+    engine = _engine(PlaceholderClient(), budget_per_hour=1)
+    for nicho in ('a', 'b'):
+        for _ in range(2):
+            engine.warm_pool.record(pool_key(nicho, []))
+    assert asyncio.run(engine.refill_warm_pool()) == 1
+    assert asyncio.run(engine.refill_warm_pool()) == 0
+
+
+def test_requests_with_media_ponto_or_without_lead_skip_pool(template_dirs):
+    client = PlaceholderClient()
+    engine = _engine(client)
+    key = pool_key(LEAD['nicho'], LEAD['problems'])
+    engine.warm_pool.put(key, {'template': {'body': 'pronto [NOME_DO_PROFISSIONAL]'}, 'report': 'r'})
+
+    media = [{'mime_type': 'image/png', 'content': b'x'}]
+    assert 'warm_pool' not in asyncio.run(engine.generate_proposal_async('contexto', media, lead=LEAD))
+    assert 'warm_pool' not in asyncio.run(engine.generate_proposal_async('contexto'))
+    assert asyncio.run(engine.generate_proposal_async('contexto', lead=LEAD))['warm_pool'] is True
+    # O elogio do lead não cabe no template do pool; ele também não conta como demanda.
+    before = engine.warm_pool.stats()
+    with_ponto = asyncio.run(engine.generate_proposal_async('contexto', lead=dict(LEAD, ponto='Ótimas avaliações')))
+    assert 'warm_pool' not in with_ponto
+    assert engine.warm_pool.stats() == before
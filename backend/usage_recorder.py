@@ -0,0 +1,516 @@
+"""Template usage data: an append-only event log plus compacted rollups.
+
+Each use, AI analysis, delete or merge of a template is one short JSON line
+appended to `<path>.events`. Events are buffered in memory and appended in
+batches (on a timer, on demand, or at interpreter exit), so recording usage
+never rewrites the usage file.
+
+A compactor (run by the same background thread every `compact_interval`
+seconds, or sooner once the log passes COMPACT_LOG_BYTES) folds the log into
+`<path>`, which holds:
+
+- `templates`: per-template totals (`usage_count`, `last_used` and the latest
+  MAX_ANALYSES entries of `ai_analysis`), the shape the old file had;
+- `hourly` / `daily`: use counts per template for each hour and day, kept for
+  HOURLY_RETENTION_HOURS and DAILY_RETENTION_DAYS.
+
+`top_templates` and `usage_trend` answer from the rollups and never read raw
+events. Files written by older versions (a flat {filename: record} mapping)
+are read as `templates` and converted on the next compaction.
+
+Appends and compactions hold an exclusive `fcntl` lock on `<path>.lock` and
+reads a shared one, so several processes (e.g. `uvicorn --workers N`) can
+share the same files without losing each other's counts.
+"""
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks; only a single process is safe there.
+    fcntl = None
+
+STATE_FORMAT = 2
+MAX_ANALYSES = 50
+HOURLY_RETENTION_HOURS = 14 * 24
+DAILY_RETENTION_DAYS = 400
+COMPACT_INTERVAL = 60.0
+COMPACT_LOG_BYTES = 1024 * 1024
+
+_HOUR_FORMAT = '%Y-%m-%dT%H'
+_DAY_FORMAT = '%Y-%m-%d'
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """
+    Holds an advisory lock on `path` for the duration of the block, creating
+    the lock file if needed. Blocks until other processes release it. The lock
+    is not reentrant: don't nest two locks on the same path.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        # Closing the descriptor releases the lock.
+        os.close(fd)
+
+
+def atomic_write_json(path, data, **dump_kwargs):
+    """Writes JSON to a temp file in the same directory and renames it over `path`."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def window_buckets(since, until, hourly_since):
+    """
+    Rollup keys covering [since, until), as ('daily', day) for whole days and
+    ('hourly', hour) for the partial days at the edges. Hours before
+    `hourly_since` (no longer kept hourly) are covered by their whole day.
+    """
+    cursor = since.replace(minute=0, second=0, microsecond=0)
+    keys = []
+    while cursor < until:
+        day_start = cursor.replace(hour=0)
+        next_day = day_start + timedelta(days=1)
+        if (cursor == day_start and next_day <= until) or cursor < hourly_since:
+            keys.append(('daily', cursor.strftime(_DAY_FORMAT)))
+            cursor = next_day
+        else:
+            keys.append(('hourly', cursor.strftime(_HOUR_FORMAT)))
+            cursor += timedelta(hours=1)
+    return keys
+
+
+def hourly_retention_start(now=None):
+    """Oldest hour still kept in the hourly rollups."""
+    now = now or datetime.now()
+    return now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=HOURLY_RETENTION_HOURS - 1)
+
+
+def _new_record():
+    return {'usage_count': 0, 'last_used': None, 'ai_analysis': []}
+
+
+def _normalized(record):
+    record.setdefault('usage_count', 0)
+    record.setdefault('last_used', None)
+    record.setdefault('ai_analysis', [])
+    return record
+
+
+def _copy_record(record):
+    return dict(record, ai_analysis=list(record.get('ai_analysis', [])))
+
+
+def merge_records(target, source):
+    """Adds the usage of `source` to `target`: counts summed, latest `last_used`, analyses joined."""
+    _normalized(target)
+    target['usage_count'] += source.get('usage_count', 0)
+    last_used = [d for d in (target.get('last_used'), source.get('last_used')) if d]
+    target['last_used'] = max(last_used) if last_used else None
+    target['ai_analysis'] = (target['ai_analysis'] + source.get('ai_analysis', []))[-MAX_ANALYSES:]
+
+
+class _UsageState:
+    """Per-template totals plus the hourly and daily rollups, with events folded in."""
+
+    __slots__ = ('templates', 'hourly', 'daily')
+
+    def __init__(self, templates=None, hourly=None, daily=None):
+        self.templates = templates if templates is not None else {}
+        self.hourly = hourly if hourly is not None else {}
+        self.daily = daily if daily is not None else {}
+
+    @classmethod
+    def from_file(cls, data):
+        if data.get('format') != STATE_FORMAT:
+            # Written before the event log: the whole file is the per-template mapping.
+            return cls(data)
+        return cls(data.get('templates', {}), data.get('hourly', {}), data.get('daily', {}))
+
+    def to_file(self):
+        return {'format': STATE_FORMAT, 'templates': self.templates, 'hourly': self.hourly, 'daily': self.daily}
+
+    def _rollups(self):
+        return (self.hourly, self.daily)
+
+    def apply(self, event, rollups=True):
+        kind, filename = event['e'], event['f']
+        if kind == 'use':
+            record = _normalized(self.templates.setdefault(filename, _new_record()))
+            moment = datetime.fromtimestamp(event['t'])
+            record['usage_count'] += 1
+            record['last_used'] = moment.isoformat()
+            if rollups:
+                for buckets, key in ((self.hourly, moment.strftime(_HOUR_FORMAT)),
+                                     (self.daily, moment.strftime(_DAY_FORMAT))):
+                    bucket = buckets.setdefault(key, {})
+                    bucket[filename] = bucket.get(filename, 0) + 1
+        elif kind == 'analysis':
+            analyses = _normalized(self.templates.setdefault(filename, _new_record()))['ai_analysis']
+            analyses.append(event['text'])
+            del analyses[:-MAX_ANALYSES]
+        elif kind == 'forget':
+            self.templates.pop(filename, None)
+            if rollups:
+                for buckets in self._rollups():
+                    for bucket in buckets.values():
+                        bucket.pop(filename, None)
+        elif kind == 'merge':
+            into = event['into']
+            source = self.templates.pop(filename, None)
+            if source is not None:
+                merge_records(self.templates.setdefault(into, _new_record()), source)
+            if rollups:
+                for buckets in self._rollups():
+                    for bucket in buckets.values():
+                        count = bucket.pop(filename, 0)
+                        if count:
+                            bucket[into] = bucket.get(into, 0) + count
+
+    def apply_lines(self, lines):
+        for line in lines:
+            if line.strip():
+                try:
+                    self.apply(json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    print(f"Warning: Skipping malformed usage event: {line[:80]!r}")
+
+    def retain_only(self, filenames):
+        """Drops the rollup counts of templates no longer in `filenames`."""
+        for buckets in self._rollups():
+            for key, bucket in buckets.items():
+                buckets[key] = {f: c for f, c in bucket.items() if f in filenames}
+
+    def prune(self, now=None):
+        now = now or datetime.now()
+        hourly_cutoff = hourly_retention_start(now).strftime(_HOUR_FORMAT)
+        daily_cutoff = (now - timedelta(days=DAILY_RETENTION_DAYS - 1)).strftime(_DAY_FORMAT)
+        for buckets, cutoff in ((self.hourly, hourly_cutoff), (self.daily, daily_cutoff)):
+            for key in [k for k, bucket in buckets.items() if k < cutoff or not bucket]:
+                del buckets[key]
+
+
+class UsageRecorder:
+    """
+    Records template usage for the files at `path` (see the module docstring).
+
+    All public methods are thread-safe. Reads (`get`, `load_all`) fold the
+    unflushed events over the on-disk data, so callers always see current
+    counts; the rollup queries see everything flushed so far.
+    """
+
+    def __init__(self, path, flush_interval=5.0, compact_interval=COMPACT_INTERVAL):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.log_path = path + '.events'
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        # _lock guards the pending events; _flush_lock the disk and the cached view.
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._atexit_registered = False
+        self._last_compaction = time.monotonic()
+        # On-disk data as of the last read: state file stamp, live log inode and bytes folded.
+        self._view = None
+        self._state_stamp = None
+        self._log_inode = None
+        self._log_offset = 0
+        # Bumped on every local change; lets callers detect updates cheaply.
+        self.version = 0
+
+    def _ensure_started(self):
+        if not self._atexit_registered:
+            atexit.register(self.flush)
+            self._atexit_registered = True
+        if self.flush_interval and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='usage-recorder', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                if self._compaction_due():
+                    self.compact()
+            except OSError as e:
+                print(f"Warning: Could not write usage data to {self.path}: {e}")
+
+    def _compaction_due(self):
+        if self.compact_interval and time.monotonic() - self._last_compaction >= self.compact_interval:
+            return True
+        try:
+            return os.stat(self.log_path).st_size >= COMPACT_LOG_BYTES
+        except FileNotFoundError:
+            return False
+
+    def _record(self, event):
+        with self._lock:
+            self._pending.append(event)
+            self.version += 1
+            self._ensure_started()
+
+    def increment(self, filename, when=None):
+        self._record({'t': (when or datetime.now()).timestamp(), 'e': 'use', 'f': filename})
+
+    def add_analysis(self, filename, analysis_text):
+        self._record({'t': time.time(), 'e': 'analysis', 'f': filename, 'text': analysis_text})
+
+    def forget(self, filename):
+        """Drops all usage data for `filename`, including what is already on disk."""
+        self._record({'t': time.time(), 'e': 'forget', 'f': filename})
+
+    def merge(self, filename, into):
+        """Moves the usage of `filename` (totals and rollups) onto `into`; a rename if `into` has none."""
+        self._record({'t': time.time(), 'e': 'merge', 'f': filename, 'into': into})
+
+    def has_pending(self):
+        with self._lock:
+            return bool(self._pending)
+
+    # --- reading ---
+
+    def _read_state(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _sealed_logs(self):
+        return sorted(glob.glob(glob.escape(self.log_path) + '.*'))
+
+    def _current_view(self):
+        """
+        The on-disk data with every appended event folded in. Needs _flush_lock.
+        Only the bytes appended since the last call are read and parsed.
+        """
+        with file_lock(self.lock_path, shared=True):
+            try:
+                st = os.stat(self.path)
+                state_stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                state_stamp = None
+            try:
+                log_inode = os.stat(self.log_path).st_ino
+            except FileNotFoundError:
+                log_inode = None
+
+            if (self._view is None or state_stamp != self._state_stamp
+                    or (self._log_offset and log_inode != self._log_inode)):
+                data = self._read_state()
+                self._view = _UsageState.from_file(data)
+                # Logs sealed by a compaction that did not finish are not in the state yet,
+                # unless it crashed after writing the state and before removing them.
+                already_folded = set(data.get('folded', ()))
+                for sealed in self._sealed_logs():
+                    if os.path.basename(sealed) in already_folded:
+                        continue
+                    with open(sealed, 'r', encoding='utf-8') as f:
+                        self._view.apply_lines(f)
+                self._state_stamp = state_stamp
+                self._log_offset = 0
+            self._log_inode = log_inode
+
+            if log_inode is not None:
+                with open(self.log_path, 'rb') as f:
+                    f.seek(self._log_offset)
+                    chunk = f.read()
+                # A line without its newline is still being written; leave it for the next read.
+                complete = chunk[:chunk.rfind(b'\n') + 1]
+                self._view.apply_lines(complete.decode('utf-8').splitlines())
+                self._log_offset += len(complete)
+        return self._view
+
+    def _pending_snapshot(self):
+        with self._lock:
+            return list(self._pending)
+
+    def load_all(self):
+        """Returns the full usage mapping, including unflushed changes."""
+        # Holding the flush lock keeps a batch from being neither pending nor on disk.
+        with self._flush_lock:
+            view = self._current_view()
+            state = _UsageState({f: _copy_record(r) for f, r in view.templates.items()})
+            for event in self._pending_snapshot():
+                state.apply(event, rollups=False)
+        return state.templates
+
+    def rollups(self):
+        """Copies of the hourly and daily rollups ({bucket: {filename: count}}), including unflushed uses."""
+        with self._flush_lock:
+            view = self._current_view()
+            state = _UsageState({f: _copy_record(r) for f, r in view.templates.items()},
+                                {key: dict(counts) for key, counts in view.hourly.items()},
+                                {key: dict(counts) for key, counts in view.daily.items()})
+            for event in self._pending_snapshot():
+                state.apply(event)
+        return {'hourly': state.hourly, 'daily': state.daily}
+
+    def get(self, filename):
+        """Returns the usage record for one template, or None if it has none."""
+        with self._flush_lock:
+            view = self._current_view()
+            pending = self._pending_snapshot()
+            names = {filename} | {e['f'] for e in pending if e.get('into') == filename}
+            state = _UsageState({f: _copy_record(view.templates[f]) for f in names if f in view.templates})
+            for event in pending:
+                if event['f'] in names:
+                    state.apply(event, rollups=False)
+        return state.templates.get(filename)
+
+    def top_templates(self, n=10, since=None, until=None):
+        """
+        The `n` most used templates in [since, until) (default: the last 7
+        days) as [{'filename', 'count'}], from the hourly and daily rollups.
+        Hours older than HOURLY_RETENTION_HOURS count with their whole day.
+        """
+        until = until or datetime.now()
+        since = since or until - timedelta(days=7)
+        totals = Counter()
+        with self._flush_lock:
+            view = self._current_view()
+            for granularity, key in window_buckets(since, until, hourly_retention_start()):
+                totals.update((view.hourly if granularity == 'hourly' else view.daily).get(key, {}))
+        ranked = sorted(totals.items(), key=lambda item: (-item[1], item[0]))[:n]
+        return [{'filename': filename, 'count': count} for filename, count in ranked]
+
+    def usage_trend(self, filename=None, days=30):
+        """Uses per day over the last `days` days, oldest first, for one template or all of them."""
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        keys = [(today - timedelta(days=i)).strftime(_DAY_FORMAT) for i in range(days - 1, -1, -1)]
+        with self._flush_lock:
+            daily = self._current_view().daily
+            if filename is None:
+                return [(key, sum(daily.get(key, {}).values())) for key in keys]
+            return [(key, daily.get(key, {}).get(filename, 0)) for key in keys]
+
+    def disk_stamp(self):
+        """Changes whenever this or another process writes usage data to disk."""
+        stamp = []
+        for path in (self.path, self.log_path):
+            try:
+                st = os.stat(path)
+                stamp.append(f"{st.st_mtime_ns}.{st.st_size}")
+            except FileNotFoundError:
+                stamp.append('0')
+        return '-'.join(stamp)
+
+    # --- writing ---
+
+    def _requeue(self, events):
+        # Puts a failed batch back in front of anything recorded meanwhile.
+        with self._lock:
+            self._pending[:0] = events
+
+    def _append_pending(self):
+        """Appends the buffered events to the log. Needs _flush_lock."""
+        with self._lock:
+            events, self._pending = self._pending, []
+        if not events:
+            return
+        payload = ''.join(json.dumps(e, ensure_ascii=False, separators=(',', ':')) + '\n' for e in events)
+        try:
+            with file_lock(self.lock_path):
+                fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, payload.encode('utf-8'))
+                finally:
+                    os.close(fd)
+        except BaseException:
+            self._requeue(events)
+            raise
+
+    def flush(self):
+        """Appends all buffered events to the event log."""
+        with self._flush_lock:
+            self._append_pending()
+
+    def _compact_locked(self, change=None):
+        # Needs _flush_lock and the exclusive file lock. The live log is renamed
+        # first; the state records which sealed logs it already contains, so a
+        # crash at any point neither loses nor double-counts events.
+        if os.path.exists(self.log_path):
+            os.rename(self.log_path, f"{self.log_path}.{time.time_ns():020d}-{os.getpid()}")
+        sealed = self._sealed_logs()
+        if not sealed and change is None:
+            return
+        data = self._read_state()
+        already_folded = set(data.get('folded', ()))
+        state = _UsageState.from_file(data)
+        for path in sealed:
+            if os.path.basename(path) not in already_folded:
+                with open(path, 'r', encoding='utf-8') as f:
+                    state.apply_lines(f)
+        if change is not None:
+            result = change(state.templates)
+            if result is not None:
+                state.templates = result
+            state.retain_only(state.templates)
+        state.prune()
+
+        data = state.to_file()
+        data['folded'] = [os.path.basename(path) for path in sealed]
+        atomic_write_json(self.path, data, indent=4)
+        for path in sealed:
+            os.remove(path)
+        self._view = None
+
+    def compact(self):
+        """Folds the event log into the totals and rollups, and prunes expired rollups."""
+        with self._flush_lock:
+            self._append_pending()
+            with file_lock(self.lock_path):
+                self._compact_locked()
+            self._last_compaction = time.monotonic()
+
+    def update(self, change):
+        """
+        Compacts the log and rewrites the per-template totals with
+        `change(templates)`, all under the file lock. `change` may modify
+        `templates` in place and return None, or return a new mapping.
+        Rollup counts of templates that are no longer present are dropped.
+        """
+        with self._flush_lock:
+            self._append_pending()
+            with file_lock(self.lock_path):
+                self._compact_locked(change)
+            self._last_compaction = time.monotonic()
+
+    def close(self):
+        """Stops the background thread, then flushes and compacts everything still buffered."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.compact()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""Pool de templates híbridos gerados de antemão para os nichos mais pedidos.
+
+A maior parte dos leads vem de poucos nichos. O pool conta os pedidos por
+combinação de nicho e problemas (`pool_key`) e, nos períodos ociosos, o motor
+gera templates para as combinações mais frequentes que ainda não estão no pool
+(`AIEngine.refill_warm_pool`). Um pedido que casa com uma entrada é atendido
+na hora: o template guarda marcadores (`[NOME_DO_PROFISSIONAL]`,
+`[NOME_DA_EMPRESA]`, ...) que são preenchidos localmente com
+`fast_render.CompiledTemplate`.
+
+Limites: `capacity` entradas (sai a usada há mais tempo), `max_age` segundos
+por entrada e `budget_per_hour` gerações antecipadas por hora.
+"""
+
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from backend import metrics
+
+DEFAULT_CAPACITY = 20
+DEFAULT_MAX_AGE = 6 * 3600.0
+DEFAULT_BUDGET_PER_HOUR = 20
+DEFAULT_IDLE_SECONDS = 30.0
+# Uma combinação só é gerada de antemão depois de pedida pelo menos esta quantidade de vezes.
+MIN_REQUESTS = 2
+# Combinações acompanhadas; acima disso as menos pedidas são esquecidas.
+MAX_TRACKED = 1000
+
+PLACEHOLDERS = ("[NOME_DO_PROFISSIONAL]", "[NOME_DA_EMPRESA]")
+
+WARM_POOL_LOOKUPS = metrics.REGISTRY.counter(
+    "warm_pool_lookups_total", "Pedidos de proposta atendidos pelo pool pré-gerado (hit) ou não (miss).", ("result",))
+WARM_POOL_GENERATED = metrics.REGISTRY.counter(
+    "warm_pool_generated_total", "Templates gerados de antemão, por resultado.", ("result",))
+
+Key = Tuple[str, Tuple[str, ...]]
+
+
+def pool_key(nicho: str, problems: Sequence[str]) -> Key:
+    """Nicho e problemas normalizados (minúsculas, sem espaços nas pontas, problemas em ordem)."""
+    return (" ".join((nicho or "").lower().split()),
+            tuple(sorted(" ".join(p.lower().split()) for p in problems if p and p.strip())))
+
+
+class WarmPool:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, max_age: float = DEFAULT_MAX_AGE,
+                 budget_per_hour: int = DEFAULT_BUDGET_PER_HOUR, idle_seconds: float = DEFAULT_IDLE_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.capacity = capacity
+        self.max_age = max_age
+        self.budget_per_hour = budget_per_hour
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+        # chave -> (entrada, instante da geração), na ordem do uso mais recente.
+        self._entries: "OrderedDict[Key, tuple]" = OrderedDict()
+        self._demand: Counter = Counter()
+        self._generated_at: deque = deque()
+        self._last_request = float("-inf")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def record(self, key: Key) -> None:
+        """Conta um pedido real para `key` (o pool só gera para o que é pedido)."""
+        with self._lock:
+            self._demand[key] += 1
+            self._last_request = self.clock()
+            if len(self._demand) > MAX_TRACKED:
+                for stale, _ in self._demand.most_common()[MAX_TRACKED // 2:]:
+                    del self._demand[stale]
+
+    def get(self, key: Key) -> Dict[str, Any] | None:
+        """A entrada de `key`, se houver e não estiver vencida; conta acerto ou falta."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and self.clock() - item[1] > self.max_age:
+                del self._entries[key]
+                item = None
+            if item is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if metrics.ENABLED:
+            WARM_POOL_LOOKUPS.inc("hit" if item is not None else "miss")
+        return item[0] if item is not None else None
+
+    def put(self, key: Key, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = (entry, self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def evict_stale(self) -> int:
+        with self._lock:
+            now = self.clock()
+            stale = [key for key, (_, created) in self._entries.items() if now - created > self.max_age]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def idle(self) -> bool:
+        """Sem pedidos reais há `idle_seconds`: hora de gerar sem disputar o limite do modelo."""
+        with self._lock:
+            return self.clock() - self._last_request >= self.idle_seconds
+
+    def candidates(self, limit: int | None = None) -> List[Key]:
+        """Combinações mais pedidas que não estão no pool (ou venceram), até `limit`."""
+        self.evict_stale()
+        limit = self.capacity if limit is None else limit
+        with self._lock:
+            wanted = [key for key, count in self._demand.most_common(self.capacity)
+                      if count >= MIN_REQUESTS and key not in self._entries]
+        return wanted[:limit]
+
+    def try_spend(self) -> bool:
+        """Reserva uma geração no orçamento da última hora; False se ele acabou."""
+        with self._lock:
+            now = self.clock()
+            while self._generated_at and now - self._generated_at[0] > 3600:
+                self._generated_at.popleft()
+            if len(self._generated_at) >= self.budget_per_hour:
+                return False
+            self._generated_at.append(now)
+            return True
+
+    def hit_rate(self) -> float:
+        with self._lock:
+            total = self.hits + self.misses
+            return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size, tracked = len(self._entries), len(self._demand)
+        return {"size": size, "capacity": self.capacity, "tracked": tracked,
+                "hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate()}
+
+    def collect_metrics(self) -> list:
+        """Famílias de métricas do pool, para `metrics.REGISTRY.add_collector`."""
+        stats = self.stats()
+        return [
+            ("warm_pool_size", "gauge", "Templates prontos no pool pré-gerado.", [({}, stats["size"])]),
+            ("warm_pool_hit_ratio", "gauge", "Fração dos pedidos atendidos pelo pool pré-gerado.",
+             [({}, stats["hit_rate"])]),
+        ]
+
+
+def warm_pool_from_env() -> WarmPool | None:
+    """Pool configurado por WARM_POOL_SIZE, WARM_POOL_MAX_AGE, WARM_POOL_IDLE e WARM_POOL_BUDGET (0 desliga)."""
+    budget = int(os.getenv("WARM_POOL_BUDGET", DEFAULT_BUDGET_PER_HOUR))
+    capacity = int(os.getenv("WARM_POOL_SIZE", DEFAULT_CAPACITY))
+    if budget <= 0 or capacity <= 0:
+        return None
+    return WarmPool(capacity=capacity, max_age=float(os.getenv("WARM_POOL_MAX_AGE", DEFAULT_MAX_AGE)),
+                    budget_per_hour=budget, idle_seconds=float(os.getenv("WARM_POOL_IDLE", DEFAULT_IDLE_SECONDS)))
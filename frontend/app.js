@@ -62,7 +62,7 @@ document.addEventListener('DOMContentLoaded', () => {
         // }
 
         try {
-            const response = await fetch('/generate-proposal', {
+            const response = await fetch('/generate-proposal/stream', {
                 method: 'POST',
                 body: formData,
             });
@@ -72,9 +72,18 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(err.detail || 'Erro no servidor');
             }
 
-            const result = await response.json();
-            resultText.textContent = result.proposal;
-            addToHistory(result.proposal);
+            // O corpo da proposta chega em pedaços; o spinner some no primeiro deles.
+            await readEventStream(response, (event, data) => {
+                if (event === 'proposal') {
+                    loading.style.display = 'none';
+                    resultText.textContent += data;
+                } else if (event === 'done') {
+                    resultText.textContent = data.proposal;
+                    addToHistory(data.proposal);
+                } else if (event === 'error') {
+                    throw new Error(data.detail);
+                }
+            });
 
         } catch (error) {
             resultText.textContent = `Erro: ${error.message}`;
@@ -83,11 +92,41 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // --- Leitura de Server-Sent Events ---
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = 'message';
+                const dataLines = [];
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+                });
+                if (dataLines.length) {
+                    onEvent(event, JSON.parse(dataLines.join('\n')));
+                }
+            }
+        }
+    }
+
     // --- Lógica de Templates ---
     addTemplateBtn.addEventListener('click', () => openModal(templateModal));
     viewTemplatesBtn.addEventListener('click', async () => {
-        await loadTemplates();
+        // Abre antes de carregar, para a primeira página saber quanto cabe na tela.
         openModal(viewTemplatesModal);
+        await loadTemplates();
     });
 
     document.getElementById('save-template-btn').addEventListener('click', async () => {
@@ -114,34 +153,67 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
-    async function loadTemplates() {
-        try {
-            const response = await fetch('/templates');
-            if (!response.ok) throw new Error('Falha ao carregar templates.');
-            const templates = await response.json();
-            
-            const lists = {
-                'human-adm': document.getElementById('human-adm-templates-list'),
-                'human': document.getElementById('human-templates-list'),
-                'ai': document.getElementById('ai-templates-list'),
-            };
-
-            Object.values(lists).forEach(list => list.innerHTML = '');
-
-            (templates.human_adm || []).forEach(t => lists['human-adm'].appendChild(createTemplateItem(t)));
-            (templates.human || []).forEach(t => lists['human'].appendChild(createTemplateItem(t)));
-            (templates.ai || []).forEach(t => lists['ai'].appendChild(createTemplateItem(t)));
-            
-            // Ativa a primeira aba por padrão após carregar
-            const firstTab = document.querySelector('#view-templates-modal .tablinks');
-            if (firstTab) {
-                openTab(firstTab.dataset.tab);
-            }
+    // Cada aba carrega o resumo (sem o corpo) do seu tipo sob demanda: a
+    // primeira página quando a aba é aberta e as seguintes ao rolar até o fim.
+    // O navegador revalida cada página pelo ETag; sem mudanças, volta 304.
+    const TEMPLATES_PAGE_LIMIT = 100;
+    const templateTabs = {
+        'human-adm-templates': { type: 'human_adm', list: document.getElementById('human-adm-templates-list') },
+        'human-templates': { type: 'human', list: document.getElementById('human-templates-list') },
+        'ai-templates': { type: 'ai', list: document.getElementById('ai-templates-list') },
+    };
+    let activeTemplateTab = null;
+
+    async function fetchTemplateSummaries(type, cursor) {
+        const params = new URLSearchParams({ summary: 'true', type, limit: String(TEMPLATES_PAGE_LIMIT) });
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`/templates?${params}`);
+        if (!response.ok) throw new Error('Falha ao carregar templates.');
+        return response.json();
+    }
 
+    async function loadNextTemplatePage(tabId) {
+        const tab = templateTabs[tabId];
+        if (!tab || tab.loading || tab.done) return;
+        tab.loading = true;
+        try {
+            const page = await fetchTemplateSummaries(tab.type, tab.cursor);
+            page.items.forEach(t => tab.list.appendChild(createTemplateItem(t)));
+            tab.cursor = page.next_cursor;
+            tab.done = !page.next_cursor;
         } catch (error) {
             console.error(error);
+        } finally {
+            tab.loading = false;
+        }
+        // Se a página não encheu a tela, não há rolagem para pedir a próxima.
+        if (!tab.done && tabId === activeTemplateTab && viewTemplatesModal.style.display === 'block'
+                && viewTemplatesModal.scrollHeight <= viewTemplatesModal.clientHeight) {
+            await loadNextTemplatePage(tabId);
+        }
+    }
+
+    async function loadTemplates() {
+        Object.values(templateTabs).forEach(tab => {
+            tab.list.innerHTML = '';
+            tab.cursor = null;
+            tab.done = false;
+            tab.loaded = false;
+        });
+        // Ativa a primeira aba por padrão
+        const firstTab = document.querySelector('#view-templates-modal .tablinks');
+        if (firstTab) {
+            await openTab(firstTab.dataset.tab);
         }
     }
+
+    viewTemplatesModal.addEventListener('scroll', () => {
+        const nearBottom = viewTemplatesModal.scrollTop + viewTemplatesModal.clientHeight
+            >= viewTemplatesModal.scrollHeight - 200;
+        if (nearBottom && activeTemplateTab) {
+            loadNextTemplatePage(activeTemplateTab);
+        }
+    });
     
     function createTemplateItem(template) {
         const li = document.createElement('li');
@@ -191,7 +263,7 @@ document.addEventListener('DOMContentLoaded', () => {
     // --- Lógica de Abas ---
     const tabContainer = document.querySelector('#view-templates-modal .tab');
 
-    function openTab(tabId) {
+    async function openTab(tabId) {
         const tabContents = document.querySelectorAll('#view-templates-modal .tabcontent');
         const tabs = document.querySelectorAll('#view-templates-modal .tablinks');
 
@@ -203,6 +275,13 @@ document.addEventListener('DOMContentLoaded', () => {
         if (activeContent) {
             activeContent.classList.add('active');
         }
+
+        activeTemplateTab = tabId;
+        const tab = templateTabs[tabId];
+        if (tab && !tab.loaded) {
+            tab.loaded = true;
+            await loadNextTemplatePage(tabId);
+        }
     }
 
     if (tabContainer) {